@@ -1,10 +1,9 @@
 import streamlit as st
-import google.generativeai as genai
-import PyPDF2 as pdf
-import requests
 from dotenv import load_dotenv
 import os
-import subprocess
+
+# The AI client, PDF reader and HTTP libraries are imported inside the page
+# that uses them, so opening Home does not pay for loading them.
 
 st.set_page_config(page_title="HR Dashboard",layout="wide")
 load_dotenv()
@@ -36,6 +35,8 @@ if page == "Home":
         st.markdown(description)
     
 elif page == "ChatBot Assistant":
+    import requests
+
     OPENAI_KEY = os.getenv("AZURE_OPENAI_KEY")
     OPENAI_ENDPOINT = os.getenv("AZURE_OPENAI_ENDPOINT")
     
@@ -109,6 +110,9 @@ elif page == "ChatBot Assistant":
     st.caption("This chatbot uses Azure OpenAI services to generate responses. The quality and length of responses may vary based on the input and settings.")
 
 elif page == "Interview Scheduling":
+    import google.generativeai as genai
+    import PyPDF2 as pdf
+
     genai.configure(api_key=os.getenv("GOOGLE_API_KEY"))
 
     def get_ai_response(prompt, pdf_text, job_desc):
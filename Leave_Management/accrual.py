@@ -0,0 +1,204 @@
+import argparse
+import sqlite3
+import sys
+import time
+from datetime import date
+from config import TOTAL_LEAVES_PER_YEAR, DEPARTMENT_ENTITLEMENTS, CARRY_OVER_CAP
+from ledger import post_entries
+
+# Start-of-year accrual: every user's balance is reset to the unused days they
+# may carry over (capped at CARRY_OVER_CAP) plus their entitlement for the new
+# year, which depends on their department (DEPARTMENT_ENTITLEMENTS, else
+# TOTAL_LEAVES_PER_YEAR) and is pro-rated for users who join during the year.
+# The whole users table is updated by one set-based UPDATE ... FROM in a single
+# transaction; a dry run evaluates the same plan and only reports it. Each
+# year can be accrued once (recorded in accrual_runs). The reset is posted to
+# the balance ledger as a 'forfeit' entry (the balance dropped down to what is
+# carried over) and an 'accrual' entry per user.
+#
+#   python accrual.py 2025 --dry-run
+#   python accrual.py 2025
+
+ACCRUAL_SCHEMA = [
+    '''
+    CREATE TABLE IF NOT EXISTS accrual_runs (
+        year INTEGER PRIMARY KEY,
+        run_at TEXT NOT NULL,
+        users INTEGER NOT NULL,
+        accrued INTEGER NOT NULL,
+        carried INTEGER NOT NULL,
+        forfeited INTEGER NOT NULL
+    )
+    ''',
+]
+
+def _columns(conn, table):
+    return {row[1] for row in conn.execute(f'PRAGMA table_info({table})')}
+
+def create_accrual_schema(conn):
+    # New databases get these columns from init_db(); older ones gain them
+    # here. allowance is what the user was granted for the current year, so
+    # allowance - remaining_leaves is what they have used.
+    columns = _columns(conn, 'users')
+    if 'allowance' not in columns:
+        conn.execute(f'ALTER TABLE users ADD COLUMN allowance INTEGER NOT NULL DEFAULT {TOTAL_LEAVES_PER_YEAR}')
+    if 'joined_on' not in columns:
+        conn.execute('ALTER TABLE users ADD COLUMN joined_on TEXT')
+    for statement in ACCRUAL_SCHEMA:
+        conn.execute(statement)
+
+
+def entitlement(department):
+    return DEPARTMENT_ENTITLEMENTS.get(department, TOTAL_LEAVES_PER_YEAR)
+
+def prorated_entitlement(department, joined_on, year):
+    # Python twin of the SQL in PLAN, used when a user is created mid-year.
+    year_start, year_end = date(year, 1, 1), date(year, 12, 31)
+    if joined_on is None or joined_on <= year_start:
+        fraction = 1.0
+    elif joined_on > year_end:
+        fraction = 0.0
+    else:
+        fraction = ((year_end - joined_on).days + 1) / ((year_end - year_start).days + 1)
+    return int(entitlement(department) * fraction + 0.5)  # rounds like SQLite ROUND()
+
+# One row per user with the balance they will have after the accrual.
+PLAN = '''
+    WITH params AS (
+        SELECT :year_start as year_start, :year_end as year_end,
+               julianday(:year_end) - julianday(:year_start) + 1 as year_days
+    ),
+    shares AS (
+        SELECT users.id, users.department, users.remaining_leaves,
+               IFNULL(temp.accrual_entitlements.days, :default_days) as entitlement,
+               CASE
+                   WHEN users.joined_on IS NULL OR users.joined_on <= params.year_start THEN 1.0
+                   WHEN users.joined_on > params.year_end THEN 0.0
+                   ELSE (julianday(params.year_end) - julianday(users.joined_on) + 1) / params.year_days
+               END as fraction
+        FROM users
+        CROSS JOIN params
+        LEFT JOIN temp.accrual_entitlements ON temp.accrual_entitlements.department = users.department
+    ),
+    plan AS (
+        SELECT id, department, remaining_leaves, entitlement, fraction < 1.0 as prorated,
+               MIN(MAX(remaining_leaves, 0), :cap) as carried,
+               MAX(remaining_leaves, 0) - MIN(MAX(remaining_leaves, 0), :cap) as forfeited,
+               CAST(ROUND(entitlement * fraction) AS INTEGER) as accrued
+        FROM shares
+    )
+'''
+
+REPORT = PLAN + '''
+    SELECT NULLIF(department, '') as department, COUNT(*) as users, SUM(prorated) as prorated_users,
+           SUM(remaining_leaves) as balance_before, SUM(carried) as carried, SUM(forfeited) as forfeited,
+           SUM(accrued) as accrued, SUM(carried + accrued) as balance_after
+    FROM plan
+    GROUP BY department
+    ORDER BY department
+'''
+
+# (user_id, delta, kind, leave_id, reason) rows for ledger.post_entries().
+LEDGER_ENTRIES = PLAN + '''
+    SELECT id as user_id, carried - remaining_leaves as delta, 'forfeit' as kind,
+           NULL as leave_id, :reason as reason
+    FROM plan WHERE carried != remaining_leaves
+    UNION ALL
+    SELECT id, accrued, 'accrual', NULL, :reason
+    FROM plan WHERE accrued != 0
+'''
+
+APPLY = PLAN + '''
+    UPDATE users
+    SET remaining_leaves = plan.carried + plan.accrued,
+        allowance = plan.carried + plan.accrued
+    FROM plan
+    WHERE plan.id = users.id
+'''
+
+def _stage_entitlements(conn):
+    conn.execute('CREATE TEMP TABLE IF NOT EXISTS accrual_entitlements (department TEXT PRIMARY KEY, days INTEGER)')
+    conn.execute('DELETE FROM temp.accrual_entitlements')
+    conn.executemany('INSERT INTO temp.accrual_entitlements (department, days) VALUES (?, ?)',
+                     DEPARTMENT_ENTITLEMENTS.items())
+
+def _params(year, cap):
+    return {'year_start': f"{year:04d}-01-01", 'year_end': f"{year:04d}-12-31",
+            'default_days': TOTAL_LEAVES_PER_YEAR, 'cap': cap}
+
+def run_accrual(conn, year, dry_run=False, cap=CARRY_OVER_CAP):
+    import pandas as pd
+    # Returns (report DataFrame, totals dict). Raises ValueError if the year
+    # was already accrued. Runs inside the caller's transaction: a real run
+    # is an operation on the database writer thread, which commits it.
+    done = conn.execute('SELECT run_at FROM accrual_runs WHERE year = ?', (year,)).fetchone()
+    if done is not None and not dry_run:
+        raise ValueError(f"Leave year {year} was already accrued on {done['run_at']}")
+    _stage_entitlements(conn)
+    params = _params(year, cap)
+    report = pd.read_sql_query(REPORT, conn, params=params)
+    totals = {
+        'year': year,
+        'dry_run': dry_run,
+        'already_run': done is not None,
+        'users': int(report['users'].sum()),
+        'accrued': int(report['accrued'].sum()),
+        'carried': int(report['carried'].sum()),
+        'forfeited': int(report['forfeited'].sum()),
+    }
+    if dry_run:
+        return report, totals
+    post_entries(conn, LEDGER_ENTRIES, dict(params, reason=f"Leave year {year}"))
+    conn.execute(APPLY, params)
+    conn.execute('''
+        INSERT INTO accrual_runs (year, run_at, users, accrued, carried, forfeited)
+        VALUES (?, ?, ?, ?, ?, ?)
+    ''', (year, time.strftime('%Y-%m-%dT%H:%M:%S'), totals['users'], totals['accrued'],
+          totals['carried'], totals['forfeited']))
+    return report, totals
+
+def accrue_year(year, dry_run=False, cap=CARRY_OVER_CAP):
+    from database import get_db_connection, invalidate_cache, submit_write
+    if not dry_run:
+        # One operation on the writer, so the whole reset lands in one
+        # transaction without competing with the app's other writes.
+        result = submit_write(run_accrual, year, False, cap).result()
+        invalidate_cache('users')
+        return result
+    conn = get_db_connection()
+    if conn is None:
+        raise sqlite3.OperationalError("Unable to connect to the database")
+    try:
+        # A read transaction, so the report is one consistent snapshot.
+        conn.execute('BEGIN')
+        return run_accrual(conn, year, True, cap)
+    finally:
+        conn.rollback()
+        conn.close()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Reset and accrue leave balances for a new leave year.")
+    parser.add_argument('year', type=int, nargs='?', default=date.today().year)
+    parser.add_argument('--dry-run', action='store_true', help="report what would change without writing")
+    parser.add_argument('--cap', type=int, default=CARRY_OVER_CAP, help="maximum days carried over")
+    args = parser.parse_args(argv)
+
+    from database import init_db
+    init_db()
+    started = time.perf_counter()
+    try:
+        report, totals = accrue_year(args.year, args.dry_run, args.cap)
+    except (sqlite3.Error, ValueError) as e:
+        print(f"Accrual failed: {e}")
+        return 1
+    print(report.to_string(index=False))
+    verb = "Would accrue" if args.dry_run else "Accrued"
+    print(f"\n{verb} {totals['accrued']} days for {totals['users']} users in {args.year} "
+          f"({totals['carried']} carried over, {totals['forfeited']} forfeited) "
+          f"in {time.perf_counter() - started:.2f}s")
+    if args.dry_run and totals['already_run']:
+        print(f"Note: {args.year} has already been accrued; a real run would be refused.")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,71 +1,106 @@
 import streamlit as st
-import pandas as pd
-import plotly.express as px
-import plotly.graph_objects as go
-from database import get_db_connection,  add_user, update_user_data, get_all_users
-from config import COLORSCHEME
+import os
+from database import (get_db_connection, add_user, update_user_data, get_leaves_page, get_users_page,
+                      get_leave_overview, get_leave_utilization, get_top_leave_types, get_monthly_leave_counts,
+                      get_cache_stats, get_pool_stats, get_writer_stats, get_change_feed_stats, compact_change_feed,
+                      get_snapshot_info, refresh_snapshot, get_balance_as_of, get_balance_history,
+                      decide_leaves, decide_matching_leaves, count_matching_leaves, search_leave_reasons)
+from config import COLORSCHEME, SEARCH_CANDIDATES, EXPORT_DIR, EXPORT_DOWNLOAD_LIMIT
 from datetime import datetime
+from bulk import import_rows, export_rows
+from pagination import current_cursor, pagination_controls, reset_pagination
+import tracing
+from tracing import timed_page
+
+DEPARTMENTS = ["HR", "IT", "Finance", "Marketing", "Operations"]
+LEAVE_TYPES = ["Annual Leave", "Sick Leave", "Personal Leave", "Other"]
 
 def admin_dashboard():
     st.title("Admin Dashboard")
 
-    menu = ["Leave Overview", "Manage Leaves", "Interview Scheduling", "Create User", "User Management"]
+    menu = ["Leave Overview", "Manage Leaves", "Interview Scheduling", "Create User", "User Management", "Search Reasons", "Bulk Import/Export", "Diagnostics"]
     choice = st.sidebar.selectbox("Menu", menu)
 
-    if choice == "Leave Overview":
-        show_leave_overview()
-        show_leave_utilization()
-        show_top_leave_reasons()
-        show_leave_trends()
-    elif choice == "Manage Leaves":
-        manage_leaves()
-    elif choice == "Interview Scheduling":
-        st.markdown("""
-        <style>
-        .button {
-            margin-top: 40px;
-            display: inline-block;
-            padding: 10px 20px;
-            font-size: 16px;
-            font-weight: bold;
-            color: #e72d2e;
-            background-color: #0e1117;
-            border: 0.5px solid #00F;
-            border-radius: 5px;
-            text-align: center;
-            text-decoration: none;
-            cursor: pointer;
-        }
-        .button:hover {
-            color: #e72d2e;
-            border: 1px solid #e72d2e;
-            text-decoration: none;
-        }
-        </style>
-
-        <a href="https://interview-sched.streamlit.app/" class="button" target="_blank">Interview Scheduling</a>
-        """, unsafe_allow_html=True)
-    elif choice == "Create User":
-        create_user()
-    elif choice == "User Management":
-        user_management()
+    with timed_page(f"admin/{choice}"):
+        if choice == "Leave Overview":
+            show_snapshot_status()
+            show_leave_overview()
+            show_leave_utilization()
+            show_top_leave_reasons()
+            show_leave_trends()
+        elif choice == "Manage Leaves":
+            manage_leaves()
+        elif choice == "Interview Scheduling":
+            st.markdown("""
+            <style>
+            .button {
+                margin-top: 40px;
+                display: inline-block;
+                padding: 10px 20px;
+                font-size: 16px;
+                font-weight: bold;
+                color: #e72d2e;
+                background-color: #0e1117;
+                border: 0.5px solid #00F;
+                border-radius: 5px;
+                text-align: center;
+                text-decoration: none;
+                cursor: pointer;
+            }
+            .button:hover {
+                color: #e72d2e;
+                border: 1px solid #e72d2e;
+                text-decoration: none;
+            }
+            </style>
+
+            <a href="https://interview-sched.streamlit.app/" class="button" target="_blank">Interview Scheduling</a>
+            """, unsafe_allow_html=True)
+        elif choice == "Create User":
+            create_user()
+        elif choice == "User Management":
+            user_management()
+        elif choice == "Search Reasons":
+            search_reasons_page()
+        elif choice == "Bulk Import/Export":
+            bulk_import_export()
+        elif choice == "Diagnostics":
+            show_diagnostics()
+
+def show_snapshot_status():
+    info = get_snapshot_info()
+    col1, col2 = st.columns([4, 1])
+    if info['taken_at'] is None:
+        col1.info("Analytics are read from a snapshot of the database; none has been taken yet.")
+    else:
+        taken = datetime.fromtimestamp(info['taken_at']).strftime('%Y-%m-%d %H:%M:%S')
+        minutes = int(info['age'] // 60)
+        age = f"{minutes} min ago" if minutes else "just now"
+        if info['changes_behind']:
+            freshness = f"{info['changes_behind']} row changes since"
+        elif info['changes_behind'] == 0:
+            freshness = "up to date"
+        else:
+            freshness = "freshness unknown"
+        if info['refreshing']:
+            freshness += ", refreshing in the background"
+        col1.caption(f"Charts use the analytics snapshot from {taken} ({age}, {freshness}). "
+                     f"It is refreshed automatically every {info['max_age'] // 60} min.")
+    if col2.button("Refresh Snapshot"):
+        if refresh_snapshot():
+            st.rerun()
+        else:
+            st.error("Unable to refresh the analytics snapshot. Please try again later.")
 
 def show_leave_overview():
     st.header("Leave Overview")
-    conn = get_db_connection()
-    if conn is None:
+    df = get_leave_overview()
+    if df is None:
         st.error("Unable to connect to the database. Please try again later.")
         return
 
-    df = pd.read_sql_query("""
-        SELECT users.department, leaves.status, COUNT(*) as count
-        FROM leaves
-        JOIN users ON leaves.user_id = users.id
-        GROUP BY users.department, leaves.status
-    """, conn)
-    conn.close()
-
     if not df.empty:
+        import plotly.express as px
         fig = px.bar(df, x='department', y='count', color='status', title="Leave Distribution by Department",
                      labels={'count': 'Number of Leaves', 'department': 'Department'},
                      color_discrete_map={'approved': COLORSCHEME['success'], 
@@ -77,21 +112,13 @@ def show_leave_overview():
 
 def show_leave_utilization():
     st.subheader("Leave Utilization")
-    conn = get_db_connection()
-    if conn is None:
+    df = get_leave_utilization()
+    if df is None:
         st.error("Unable to connect to the database. Please try again later.")
         return
 
-    df = pd.read_sql_query("""
-        SELECT users.department, 
-               AVG(users.remaining_leaves) as avg_remaining_leaves,
-               20 - AVG(users.remaining_leaves) as avg_used_leaves
-        FROM users
-        GROUP BY users.department
-    """, conn)
-    conn.close()
-
     if not df.empty:
+        import plotly.express as px
         fig = px.bar(df, x='department', y=['avg_used_leaves', 'avg_remaining_leaves'],
                      title="Average Leave Utilization by Department",
                      labels={'value': 'Days', 'department': 'Department', 'variable': 'Leave Type'},
@@ -104,21 +131,13 @@ def show_leave_utilization():
 
 def show_top_leave_reasons():
     st.subheader("Top Reasons for Leave")
-    conn = get_db_connection()
-    if conn is None:
+    df = get_top_leave_types(5)
+    if df is None:
         st.error("Unable to connect to the database. Please try again later.")
         return
 
-    df = pd.read_sql_query("""
-        SELECT leave_type, COUNT(*) as count
-        FROM leaves
-        GROUP BY leave_type
-        ORDER BY count DESC
-        LIMIT 5
-    """, conn)
-    conn.close()
-
     if not df.empty:
+        import plotly.express as px
         fig = px.pie(df, values='count', names='leave_type', title="Top 5 Reasons for Leave")
         st.plotly_chart(fig)
     else:
@@ -126,20 +145,14 @@ def show_top_leave_reasons():
 
 def show_leave_trends():
     st.subheader("Leave Trends")
-    conn = get_db_connection()
-    if conn is None:
+    df = get_monthly_leave_counts()
+    if df is None:
         st.error("Unable to connect to the database. Please try again later.")
         return
 
-    df = pd.read_sql_query("""
-        SELECT strftime('%Y-%m', start_date) as month, COUNT(*) as count
-        FROM leaves
-        GROUP BY month
-        ORDER BY month
-    """, conn)
-    conn.close()
-
     if not df.empty:
+        import pandas as pd
+        import plotly.express as px
         df['month'] = pd.to_datetime(df['month'])
         fig = px.line(df, x='month', y='count', title="Leave Trends Over Time")
         st.plotly_chart(fig)
@@ -148,65 +161,83 @@ def show_leave_trends():
 
 def manage_leaves():
     st.header("Manage Leaves")
-    conn = get_db_connection()
-    if conn is None:
+
+    col1, col2, col3 = st.columns(3)
+    department = col1.selectbox("Department", ["All"] + DEPARTMENTS, key="pending_department",
+                                on_change=reset_pagination, args=("pending",))
+    leave_type = col2.selectbox("Leave Type", ["All"] + LEAVE_TYPES, key="pending_leave_type",
+                                on_change=reset_pagination, args=("pending",))
+    date_range = col3.date_input("Dates", (), key="pending_dates",
+                                 on_change=reset_pagination, args=("pending",))
+    filters = {
+        'department': None if department == "All" else department,
+        'leave_type': None if leave_type == "All" else leave_type,
+        'date_from': date_range[0] if len(date_range) == 2 else None,
+        'date_to': date_range[1] if len(date_range) == 2 else None,
+    }
+
+    summary = st.session_state.pop("pending_summary", None)
+    if summary is not None:
+        show_decision_summary(summary)
+
+    rows, next_cursor = get_leaves_page(status='pending', after=current_cursor("pending"), **filters)
+    if rows is None:
         st.error("Unable to connect to the database. Please try again later.")
         return
 
-    df = pd.read_sql_query("""
-        SELECT leaves.*, users.username, users.department 
-        FROM leaves 
-        JOIN users ON leaves.user_id = users.id 
-        WHERE leaves.status = 'pending'
-    """, conn)
-    conn.close()
+    if rows:
+        import pandas as pd
+        matching = count_matching_leaves('pending', **filters)
+        st.write(f"{matching} pending leaves match the filters.")
 
-    if not df.empty:
-        for _, leave in df.iterrows():
-            with st.expander(f"{leave['username']} - {leave['start_date']} to {leave['end_date']}"):
-                st.write(f"Department: {leave['department']}")
-                st.write(f"Leave Type: {leave['leave_type']}")
-                st.write(f"Reason: {leave['reason']}")
-                col1, col2 = st.columns(2)
-                with col1:
-                    if st.button("Approve", key=f"approve_{leave['id']}", type="primary"):
-                        if update_leave_status(leave['id'], 'approved'):
-                            st.success("Leave approved!")
-                            st.rerun()
-                        else:
-                            st.error("Failed to approve leave. Please try again.")
-                with col2:
-                    if st.button("Reject", key=f"reject_{leave['id']}", type="secondary"):
-                        if update_leave_status(leave['id'], 'rejected'):
-                            st.success("Leave rejected!")
-                            st.rerun()
-                        else:
-                            st.error("Failed to reject leave. Please try again.")
+        page = pd.DataFrame([dict(row) for row in rows])
+        page.insert(0, 'select', False)
+        columns = ['select', 'username', 'department', 'leave_type', 'start_date', 'end_date', 'reason']
+        st.session_state.pending_page_ids = page['id'].tolist()
+        st.data_editor(page[columns], key="pending_editor", hide_index=True,
+                       disabled=columns[1:], use_container_width=True)
+        pagination_controls("pending", next_cursor)
+
+        col1, col2 = st.columns(2)
+        col1.button("Approve Selected", type="primary", on_click=decide_selected, args=('approved',))
+        col2.button("Reject Selected", type="secondary", on_click=decide_selected, args=('rejected',))
+        col1.button(f"Approve All {matching} Matching", on_click=decide_filtered, args=('approved', filters))
+        col2.button(f"Reject All {matching} Matching", on_click=decide_filtered, args=('rejected', filters))
     else:
         st.info("No pending leaves.")
 
-def update_leave_status(leave_id, status):
-    conn = get_db_connection()
-    if conn is None:
-        return False
+# Decisions run as button callbacks, i.e. before the next script run, so the
+# queue is fetched once afterwards and the summary is shown above it.
 
-    try:
-        cur = conn.cursor()
-        cur.execute('UPDATE leaves SET status = ? WHERE id = ?', (status, leave_id))
-        conn.commit()
-        return True
-    except Exception as e:
-        print(f"Error updating leave status: {e}")
-        return False
-    finally:
-        conn.close()
+def decide_selected(status):
+    edits = st.session_state.get("pending_editor", {}).get("edited_rows", {})
+    page_ids = st.session_state.get("pending_page_ids", [])
+    leave_ids = [page_ids[row] for row, change in edits.items() if change.get('select') and row < len(page_ids)]
+    if not leave_ids:
+        st.session_state.pending_summary = {'error': "Select at least one leave first."}
+        return
+    st.session_state.pending_summary = decide_leaves(leave_ids, status) or {'error': None}
+
+def decide_filtered(status, filters):
+    st.session_state.pending_summary = decide_matching_leaves(status, **filters) or {'error': None}
+
+def show_decision_summary(summary):
+    if 'error' in summary:
+        st.error(summary['error'] or "Failed to update leaves. Please try again.")
+        return
+    message = f"{summary['updated']} leaves {summary['status']} for {summary['users']} employees."
+    if summary['days_credited']:
+        message += f" {summary['days_credited']} days credited back to balances."
+    if summary['skipped']:
+        message += f" {summary['skipped']} were no longer pending and were skipped."
+    st.success(message)
 
 def create_user():
     st.header("Create New User")
     with st.form("create_user_form"):
         username = st.text_input("Username")
         password = st.text_input("Password", type="password")
-        department = st.selectbox("Department", ["HR", "IT", "Finance", "Marketing", "Operations"])
+        department = st.selectbox("Department", DEPARTMENTS)
         is_admin = st.checkbox("Is Admin")
         submitted = st.form_submit_button("Create User")
 
@@ -222,10 +253,11 @@ def create_user():
 def user_management():
     st.header("User Management")
     
-    # Display all users
-    users_df = get_all_users()
+    # Display users one page at a time
+    users_df, next_cursor = get_users_page(after=current_cursor("users"))
     if users_df is not None:
         st.dataframe(users_df)
+        pagination_controls("users", next_cursor)
     else:
         st.error("Unable to fetch user data. Please try again later.")
         return
@@ -265,15 +297,23 @@ def update_user(user_id):
                     
                     if success:
                         st.success("User updated successfully!")
-                        # Clear cache and refresh the user table
-                        st.cache_data.clear()
-                        updated_df = get_all_users()
+                        # Refresh the user table (update_user_data already invalidated the cache)
+                        updated_df, _ = get_users_page(after=current_cursor("users"))
                         if updated_df is not None:
                             st.dataframe(updated_df)
                         else:
                             st.error("Unable to fetch updated user data. Please refresh the page.")
                     else:
                         st.error("Failed to update user. Please try again.")
+
+            st.subheader("Balance History")
+            as_of = st.date_input("Balance on", value=datetime.now().date(), key="balance_as_of")
+            balance = get_balance_as_of(user_id, as_of)
+            if balance is not None:
+                st.metric(f"Balance at end of {as_of}", balance)
+            history = get_balance_history(user_id)
+            if history is not None and not history.empty:
+                st.dataframe(history)
         else:
             st.error("User not found")
     except Exception as e:
@@ -281,3 +321,188 @@ def update_user(user_id):
     finally:
         conn.close()
 
+def search_reasons_page():
+    st.header("Search Reasons")
+
+    text = st.text_input("Search leave reasons and adjustment notes", key="search_text",
+                         placeholder='e.g. wedding, "jury duty", visa*',
+                         on_change=reset_pagination, args=("search",))
+    col1, col2, col3 = st.columns(3)
+    department = col1.selectbox("Department", ["All"] + DEPARTMENTS, key="search_department",
+                                on_change=reset_pagination, args=("search",))
+    status = col2.selectbox("Status", ["All", "pending", "approved", "rejected"], key="search_status",
+                            on_change=reset_pagination, args=("search",))
+    date_range = col3.date_input("Dates", (), key="search_dates",
+                                 on_change=reset_pagination, args=("search",))
+    if not text.strip():
+        return
+
+    filters = {
+        'department': None if department == "All" else department,
+        'status': None if status == "All" else status,
+        'date_from': date_range[0] if len(date_range) == 2 else None,
+        'date_to': date_range[1] if len(date_range) == 2 else None,
+    }
+    rows, next_cursor, truncated, restarted = search_leave_reasons(text, after=current_cursor("search"), **filters)
+    if restarted:
+        # The last result of the previous page no longer matches.
+        reset_pagination("search")
+        st.info("The results changed since the last page, so they are shown from the first page again.")
+    if rows is None:
+        st.error("Unable to connect to the database. Please try again later.")
+        return
+
+    if rows:
+        import pandas as pd
+        results = pd.DataFrame([dict(row) for row in rows])
+        columns = ['source', 'username', 'department', 'date', 'end_date', 'status', 'leave_type', 'days', 'reason']
+        st.dataframe(results[columns], hide_index=True, use_container_width=True)
+        pagination_controls("search", next_cursor)
+        if truncated:
+            st.warning(f"More than {SEARCH_CANDIDATES:,} leaves or adjustments match, so only the newest "
+                       f"{SEARCH_CANDIDATES:,} of each were ranked. Add words or filters to narrow the search.")
+        st.caption("Best matches first. Adjustments have no status and are left out when one is chosen.")
+    else:
+        st.info("No leaves or adjustments match.")
+
+def bulk_import_export():
+    st.header("Bulk Import/Export")
+
+    st.subheader("Import")
+    st.markdown(
+        "Upload a CSV or Parquet file. Users need `username` and `password` columns "
+        "(optional `department`, `is_admin`, `remaining_leaves`, `allowance`, `joined_on`). Leaves need "
+        "`user_id` or `username`, `start_date` and `end_date` (optional `reason`, `status`, `leave_type`). "
+        "Imported leaves are treated as history and do not change leave balances."
+    )
+    kind = st.selectbox("Import", ["users", "leaves"], key="bulk_import_kind")
+    default_password = None
+    if kind == "users":
+        default_password = st.text_input(
+            "Password for users without one", type="password",
+            help="Exports never include passwords. Set this to re-import an exported file; "
+                 "leave it empty to reject users without a password.") or None
+    uploaded = st.file_uploader("File", type=["csv", "parquet"])
+    if uploaded is not None and st.button("Start Import"):
+        progress = st.progress(0.0)
+        status = st.empty()
+        total = uploaded.size or 1
+
+        def on_chunk(report):
+            progress.progress(min(uploaded.tell() / total, 1.0))
+            status.write(f"{report['rows']} rows read, {report['inserted']} inserted, {report['failed']} failed")
+
+        try:
+            report = import_rows(kind, uploaded, progress=on_chunk, default_password=default_password)
+        except Exception as e:
+            st.error(f"Import failed: {e}")
+            return
+        progress.progress(1.0)
+        if report['failed']:
+            import pandas as pd
+            st.warning(f"Imported {report['inserted']} of {report['rows']} rows; {report['failed']} failed.")
+            st.dataframe(pd.DataFrame(sorted(report['errors']), columns=['line', 'error']))
+        else:
+            st.success(f"Imported {report['inserted']} rows.")
+
+    st.subheader("Export")
+    kind = st.selectbox("Export", ["users", "leaves"], key="bulk_export_kind")
+    fmt = st.radio("Format", ["csv", "parquet"], horizontal=True)
+    if st.button("Prepare Export"):
+        # Streamed to a file on the server, replacing the previous export of
+        # the same kind and format once complete.
+        os.makedirs(EXPORT_DIR, exist_ok=True)
+        path = os.path.join(EXPORT_DIR, f"{kind}.{fmt}")
+        try:
+            with st.spinner("Exporting..."):
+                count = export_rows(kind, f"{path}.tmp.{fmt}")
+            os.replace(f"{path}.tmp.{fmt}", path)
+        except Exception as e:
+            st.error(f"Export failed: {e}")
+            return
+        size = os.path.getsize(path)
+        if size <= EXPORT_DOWNLOAD_LIMIT:
+            def read_export():
+                # Only runs when the button is clicked.
+                with open(path, 'rb') as f:
+                    return f.read()
+            st.download_button(f"Download {count} {kind}", read_export, file_name=f"{kind}.{fmt}")
+        else:
+            st.info(f"Exported {count} {kind} ({size / 2**20:.0f} MB) to {path} on the server. Files over "
+                    f"{EXPORT_DOWNLOAD_LIMIT / 2**20:.0f} MB are not offered for download; copy it from there.")
+
+def show_diagnostics():
+    import pandas as pd
+    st.header("Diagnostics")
+
+    st.subheader("Query Cache")
+    cache = get_cache_stats()
+    col1, col2, col3, col4 = st.columns(4)
+    col1.metric("Hits", cache['hits'])
+    col2.metric("Misses", cache['misses'])
+    col3.metric("Hit Rate", f"{cache['hit_rate']:.0%}")
+    col4.metric("Entries", f"{cache['entries']} / {cache['max_entries']}")
+    st.caption(f"Evictions: {cache['evictions']} · Expired: {cache['expirations']} · "
+               f"Invalidated: {cache['invalidations']} · TTL: {cache['ttl']}s")
+
+    st.subheader("Connection Pool")
+    pool = get_pool_stats()
+    col1, col2, col3, col4 = st.columns(4)
+    col1.metric("Open", f"{pool['open']} / {pool['size']}")
+    col2.metric("In Use", pool['in_use'])
+    col3.metric("Reused", pool['hits'])
+    col4.metric("Waits", pool['waits'])
+
+    st.subheader("Database Writer")
+    writer = get_writer_stats()
+    col1, col2, col3, col4 = st.columns(4)
+    col1.metric("Queue Depth", writer['depth'])
+    col2.metric("Writes / Commit", f"{writer['avg_batch']:.1f}")
+    col3.metric("Commit p50", f"{writer['commit_ms_p50']:.1f} ms")
+    col4.metric("Write Latency p95", f"{writer['latency_ms_p95']:.1f} ms")
+    st.caption(f"Writes: {writer['writes']} · Failed: {writer['failed']} · Commits: {writer['batches']} · "
+               f"Largest batch: {writer['max_batch']} / {writer['batch_size']} · "
+               f"Deepest queue: {writer['max_depth']} · Lock retries: {writer['retries']}")
+
+    st.subheader("Change Feed")
+    feed = get_change_feed_stats()
+    if feed is None:
+        st.error("Unable to read the change feed.")
+    else:
+        col1, col2, col3, col4 = st.columns(4)
+        col1.metric("Head Seq", feed['head'])
+        col2.metric("Retained Events", feed['retained'])
+        col3.metric("Consumers", len(feed['consumers']))
+        col4.metric("Max Lag", max((consumer['lag'] for consumer in feed['consumers']), default=0))
+        if feed['consumers']:
+            st.dataframe(pd.DataFrame(feed['consumers']), hide_index=True)
+        if st.button("Compact Change Feed"):
+            result = compact_change_feed()
+            if result is None:
+                st.error("Unable to compact the change feed. Please try again later.")
+            else:
+                st.success(f"Removed {result[1]} consumed and {result[0]} superseded events.")
+
+    st.subheader("Query Tracing")
+    enabled = st.checkbox("Trace queries and page render times", value=tracing.is_enabled(),
+                          help="Timings are kept in memory and appended to trace.log")
+    if enabled != tracing.is_enabled():
+        tracing.enable() if enabled else tracing.disable()
+    if not enabled:
+        st.info("Tracing is off. Turn it on (or start the app with LEAVE_TRACE=1) to collect timings.")
+        return
+    if st.button("Clear Trace Data"):
+        tracing.clear()
+
+    pages = tracing.page_percentiles()
+    if pages:
+        st.write("Page render time (ms)")
+        st.dataframe(pd.DataFrame(pages), hide_index=True)
+    queries = tracing.slowest_queries(limit=20)
+    if queries:
+        st.write("Slowest queries by total time")
+        df = pd.DataFrame(queries)
+        df['pages'] = df['pages'].apply(', '.join)
+        st.dataframe(df, hide_index=True)
+    if not pages and not queries:
+        st.info("No traced activity yet. Browse some pages and come back.")
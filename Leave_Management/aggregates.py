@@ -0,0 +1,187 @@
+import sqlite3
+import sys
+
+# Summary tables behind the admin "Leave Overview" page. They are kept in step
+# with users/leaves by the triggers below, so every write path (database.py,
+# user.py, admin.py, bulk loaders) updates them in the same transaction as the
+# row change. NULL departments/types/months are stored as '' because NULLs
+# are never equal in a primary key.
+TABLES = [
+    '''
+    CREATE TABLE IF NOT EXISTS agg_department_status (
+        department TEXT NOT NULL,
+        status TEXT NOT NULL,
+        count INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (department, status)
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS agg_leave_type (
+        leave_type TEXT PRIMARY KEY,
+        count INTEGER NOT NULL DEFAULT 0
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS agg_monthly (
+        month TEXT PRIMARY KEY,
+        count INTEGER NOT NULL DEFAULT 0
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS agg_department_balance (
+        department TEXT PRIMARY KEY,
+        user_count INTEGER NOT NULL DEFAULT 0,
+        remaining_sum INTEGER NOT NULL DEFAULT 0
+    )
+    ''',
+]
+
+def _leave_delta(row, sign):
+    return f'''
+        INSERT INTO agg_department_status (department, status, count)
+        VALUES (IFNULL((SELECT department FROM users WHERE id = {row}.user_id), ''), {row}.status, {sign}1)
+        ON CONFLICT (department, status) DO UPDATE SET count = count + excluded.count;
+        INSERT INTO agg_leave_type (leave_type, count)
+        VALUES (IFNULL({row}.leave_type, ''), {sign}1)
+        ON CONFLICT (leave_type) DO UPDATE SET count = count + excluded.count;
+        INSERT INTO agg_monthly (month, count)
+        VALUES (IFNULL(strftime('%Y-%m', {row}.start_date), ''), {sign}1)
+        ON CONFLICT (month) DO UPDATE SET count = count + excluded.count;
+    '''
+
+# agg_department_balance column -> the users column it sums. allowance_sum
+# was added by migration 8 (add_allowance_to_balance); migration 4 created
+# the table, triggers and refill with remaining_sum only.
+BALANCE_SUMS = {'remaining_sum': 'remaining_leaves', 'allowance_sum': 'allowance'}
+VERSION_4_SUMS = ['remaining_sum']
+
+def _balance_delta(row, sign, sums):
+    return f'''
+        INSERT INTO agg_department_balance (department, user_count, {', '.join(sums)})
+        VALUES (IFNULL({row}.department, ''), {sign}1, {', '.join(f'{sign}{row}.{BALANCE_SUMS[s]}' for s in sums)})
+        ON CONFLICT (department) DO UPDATE SET
+            user_count = user_count + excluded.user_count,
+            {', '.join(f'{s} = {s} + excluded.{s}' for s in sums)};
+    '''
+
+def _department_move(row, sign):
+    return f'''
+        INSERT INTO agg_department_status (department, status, count)
+        SELECT IFNULL({row}.department, ''), status, {sign}COUNT(*)
+        FROM leaves WHERE user_id = {row}.id GROUP BY status
+        ON CONFLICT (department, status) DO UPDATE SET count = count + excluded.count;
+    '''
+
+TRIGGERS = [
+    f'''
+    CREATE TRIGGER IF NOT EXISTS trg_agg_leaves_insert AFTER INSERT ON leaves
+    BEGIN {_leave_delta('NEW', '+')} END
+    ''',
+    f'''
+    CREATE TRIGGER IF NOT EXISTS trg_agg_leaves_delete AFTER DELETE ON leaves
+    BEGIN {_leave_delta('OLD', '-')} END
+    ''',
+    f'''
+    CREATE TRIGGER IF NOT EXISTS trg_agg_leaves_update
+    AFTER UPDATE OF user_id, status, leave_type, start_date ON leaves
+    BEGIN {_leave_delta('OLD', '-')} {_leave_delta('NEW', '+')} END
+    ''',
+    f'''
+    CREATE TRIGGER IF NOT EXISTS trg_agg_users_department
+    AFTER UPDATE OF department ON users
+    WHEN OLD.department IS NOT NEW.department
+    BEGIN {_department_move('OLD', '-')} {_department_move('NEW', '+')} END
+    ''',
+]
+
+def _balance_triggers(sums):
+    columns = ', '.join(['department'] + [BALANCE_SUMS[s] for s in sums])
+    return [
+        f'''
+        CREATE TRIGGER IF NOT EXISTS trg_agg_users_insert AFTER INSERT ON users
+        BEGIN {_balance_delta('NEW', '+', sums)} END
+        ''',
+        f'''
+        CREATE TRIGGER IF NOT EXISTS trg_agg_users_delete AFTER DELETE ON users
+        BEGIN {_balance_delta('OLD', '-', sums)} END
+        ''',
+        f'''
+        CREATE TRIGGER IF NOT EXISTS trg_agg_users_update
+        AFTER UPDATE OF {columns} ON users
+        BEGIN {_balance_delta('OLD', '-', sums)} {_balance_delta('NEW', '+', sums)} END
+        ''',
+    ]
+
+def _balance_refill(sums):
+    return f'''
+    INSERT INTO agg_department_balance (department, user_count, {', '.join(sums)})
+    SELECT IFNULL(department, ''), COUNT(*), {', '.join(f'SUM({BALANCE_SUMS[s]})' for s in sums)}
+    FROM users GROUP BY 1
+    '''
+
+REFILL = [
+    'DELETE FROM agg_department_status',
+    'DELETE FROM agg_leave_type',
+    'DELETE FROM agg_monthly',
+    'DELETE FROM agg_department_balance',
+    '''
+    INSERT INTO agg_department_status (department, status, count)
+    SELECT IFNULL(users.department, ''), leaves.status, COUNT(*)
+    FROM leaves LEFT JOIN users ON leaves.user_id = users.id
+    GROUP BY 1, 2
+    ''',
+    '''
+    INSERT INTO agg_leave_type (leave_type, count)
+    SELECT IFNULL(leave_type, ''), COUNT(*) FROM leaves GROUP BY 1
+    ''',
+    '''
+    INSERT INTO agg_monthly (month, count)
+    SELECT IFNULL(strftime('%Y-%m', start_date), ''), COUNT(*) FROM leaves GROUP BY 1
+    ''',
+]
+
+BALANCE_TRIGGERS = ['trg_agg_users_insert', 'trg_agg_users_delete', 'trg_agg_users_update']
+
+def add_allowance_to_balance(conn):
+    # Upgrades agg_department_balance created before users.allowance existed:
+    # adds allowance_sum, recreates the users triggers that maintain it and
+    # refills the table. Runs inside the caller's transaction.
+    columns = {row[1] for row in conn.execute('PRAGMA table_info(agg_department_balance)')}
+    if 'allowance_sum' not in columns:
+        conn.execute('ALTER TABLE agg_department_balance ADD COLUMN allowance_sum INTEGER NOT NULL DEFAULT 0')
+    for name in BALANCE_TRIGGERS:
+        conn.execute(f'DROP TRIGGER IF EXISTS {name}')
+    sums = list(BALANCE_SUMS)
+    for statement in _balance_triggers(sums) + ['DELETE FROM agg_department_balance', _balance_refill(sums)]:
+        conn.execute(statement)
+
+def create_aggregates(conn):
+    # Migration 4, as it was first shipped: it must run on a users table
+    # without allowance. Runs inside the caller's transaction.
+    for statement in TABLES + TRIGGERS + _balance_triggers(VERSION_4_SUMS) + REFILL + [_balance_refill(VERSION_4_SUMS)]:
+        conn.execute(statement)
+
+def rebuild_aggregates(conn):
+    try:
+        conn.execute('BEGIN IMMEDIATE')
+        for statement in REFILL + [_balance_refill(list(BALANCE_SUMS))]:
+            conn.execute(statement)
+        conn.commit()
+        return True
+    except sqlite3.Error as e:
+        print(f"Error rebuilding leave aggregates: {e}")
+        conn.rollback()
+        return False
+
+if __name__ == "__main__":
+    from database import get_db_connection, init_db
+    init_db()
+    conn = get_db_connection()
+    if conn is None:
+        sys.exit(1)
+    try:
+        ok = rebuild_aggregates(conn)
+        print("Leave aggregates rebuilt." if ok else "Rebuild failed.")
+        sys.exit(0 if ok else 1)
+    finally:
+        conn.close()
@@ -0,0 +1,103 @@
+import argparse
+import sys
+import pyarrow as pa
+import pyarrow.compute as pc
+from config import ANALYTICS_STORE
+from columnar import read_leaves, read_users, read_state
+
+# Leave Overview aggregations computed with Arrow over the Parquet store that
+# columnar.py exports, for multi-year reporting without scanning SQLite. Each
+# function returns a DataFrame shaped like its database.py counterpart, or None
+# when nothing has been exported yet. years narrows the scan to those year
+# partitions.
+
+def _group(table, keys, aggregations, names):
+    # Arrow puts aggregate columns before the keys; return keys first, renamed.
+    result = table.group_by(keys).aggregate(aggregations)
+    return result.select(keys + [f"{column}_{function}" for column, function in aggregations]).rename_columns(names)
+
+def _sort(table, keys):
+    return table.sort_by([(key, 'ascending') for key in keys], null_placement='at_start')  # as SQLite
+
+def leave_overview(store=ANALYTICS_STORE, years=None):
+    table = read_leaves(store, years, columns=['department', 'status'])
+    if table is None:
+        return None
+    result = _group(table, ['department', 'status'], [('id', 'count')], ['department', 'status', 'count'])
+    return _sort(result, ['department', 'status']).to_pandas()
+
+def leave_utilization(store=ANALYTICS_STORE):
+    users = read_users(store)
+    if users is None:
+        return None
+    users = users.append_column('used', pc.subtract(users['allowance'], users['remaining_leaves']))
+    result = _group(users, ['department'], [('remaining_leaves', 'mean'), ('used', 'mean')],
+                    ['department', 'avg_remaining_leaves', 'avg_used_leaves'])
+    return _sort(result, ['department']).to_pandas()
+
+def top_leave_types(store=ANALYTICS_STORE, limit=5, years=None):
+    table = read_leaves(store, years, columns=['leave_type'])
+    if table is None:
+        return None
+    result = _group(table, ['leave_type'], [('id', 'count')], ['leave_type', 'count'])
+    return result.sort_by([('count', 'descending')]).slice(0, limit).to_pandas()
+
+def top_reasons(store=ANALYTICS_STORE, limit=10, years=None):
+    table = read_leaves(store, years, columns=['reason', 'days'])
+    if table is None:
+        return None
+    reasons = pc.utf8_lower(pc.utf8_trim_whitespace(table['reason']))
+    table = pa.table({'reason': reasons, 'days': table['days'], 'id': table['id']})
+    result = _group(table, ['reason'], [('id', 'count'), ('days', 'sum')], ['reason', 'count', 'total_days'])
+    return result.sort_by([('count', 'descending')]).slice(0, limit).to_pandas()
+
+def monthly_leave_counts(store=ANALYTICS_STORE, years=None):
+    table = read_leaves(store, years, columns=['year', 'month'])
+    if table is None:
+        return None
+    table = table.filter(pc.greater(table['year'], 0))
+    result = _sort(_group(table, ['year', 'month'], [('id', 'count')], ['year', 'month', 'count']),
+                   ['year', 'month']).to_pandas()
+    result['month'] = [f"{year:04d}-{month:02d}" for year, month in zip(result['year'], result['month'])]
+    return result[['month', 'count']]
+
+def yearly_leave_days(store=ANALYTICS_STORE, years=None, status='approved'):
+    # Days taken per department per year, for year-over-year trends.
+    table = read_leaves(store, years, columns=['year', 'department', 'status', 'days'])
+    if table is None:
+        return None
+    if status is not None:
+        table = table.filter(pc.equal(table['status'], status))
+    result = _group(table, ['year', 'department'], [('days', 'sum'), ('id', 'count')],
+                    ['year', 'department', 'days', 'leaves'])
+    return _sort(result, ['year', 'department']).to_pandas()
+
+
+def main(argv=None):
+    import pandas as pd
+    parser = argparse.ArgumentParser(description="Leave analytics over the Parquet store (see columnar.py).")
+    parser.add_argument('--store', default=ANALYTICS_STORE)
+    parser.add_argument('--years', type=int, nargs='*', help="only these start years")
+    args = parser.parse_args(argv)
+
+    state = read_state(args.store)
+    if state['last_export_at'] is None:
+        print("The analytics store is empty; run columnar.py first.")
+        return 1
+    print(f"Store last exported {state['last_export_at']} (seq {state['last_seq']})\n")
+    pd.set_option('display.width', 120)
+    for title, df in [
+        ("Leaves by department and status", leave_overview(args.store, args.years)),
+        ("Leave utilization", leave_utilization(args.store)),
+        ("Top leave types", top_leave_types(args.store, years=args.years)),
+        ("Top reasons", top_reasons(args.store, years=args.years)),
+        ("Approved days per department and year", yearly_leave_days(args.store, args.years)),
+        ("Leaves per month", monthly_leave_counts(args.store, args.years)),
+    ]:
+        print(title)
+        print(df.to_string(index=False) if df is not None else "  (no data)")
+        print()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,402 @@
+import argparse
+import asyncio
+import hashlib
+import hmac
+import json
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+import numpy as np
+import tornado.web
+from tornado.web import HTTPError
+import database
+from config import API_ADDRESS, API_PORT, API_WORKERS, API_MAX_PENDING, API_MAX_PAGE_SIZE, API_TOKEN, PAGE_SIZE
+from search import SEARCH_SOURCES
+
+# Headless JSON API over database.py for HRIS integrations:
+#
+#   python api.py [--port 8600] [--db path/to/database.db]
+#
+#   GET  /api/health
+#   GET  /api/users?after=&limit=
+#   GET  /api/users/<id>
+#   GET  /api/users/<id>/balance[?as_of=YYYY-MM-DD]
+#   GET  /api/users/<id>/ledger?limit=
+#   GET  /api/leaves?user_id=&status=&department=&leave_type=&date_from=&date_to=&after=&limit=
+#   POST /api/leaves            {"user_id", "start_date", "end_date", "reason", "leave_type"}
+#   POST /api/leaves/decisions  {"ids": [...], "status": "approved" | "rejected"}
+#   GET  /api/search?q=&department=&status=&date_from=&date_to=&source=&after=&limit=
+#   GET  /api/stats/overview | utilization | leave-types | monthly
+#
+# The database helpers block, so they run on a fixed-size thread pool (no
+# larger than the connection pool) and the IOLoop only does HTTP. When
+# API_MAX_PENDING calls are already queued, requests get 503 instead of
+# piling up. Listings are keyset-paginated: each page carries a "next" cursor
+# to pass back as ?after=. GET responses have ETags; for users, leaves and
+# the balance ledger the ETag is derived from the table_versions counters, so
+# a matching If-None-Match is answered with 304 without running the query.
+# When API_TOKEN (LEAVE_API_TOKEN) is set, requests need "Authorization:
+# Bearer".
+
+STATS = {
+    'overview': database.get_leave_overview,
+    'utilization': database.get_leave_utilization,
+    'leave-types': database.get_top_leave_types,
+    'monthly': database.get_monthly_leave_counts,
+}
+
+
+class DatabaseExecutor:
+    def __init__(self, workers=API_WORKERS, max_pending=API_MAX_PENDING):
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='api-db')
+        self._lock = threading.Lock()
+        self.workers = workers
+        self.max_pending = max_pending
+        self.pending = 0
+        self.rejected = 0
+
+    def _call(self, fn, args):
+        try:
+            return fn(*args)
+        finally:
+            with self._lock:
+                self.pending -= 1
+
+    async def run(self, fn, *args):
+        with self._lock:
+            if self.pending >= self.max_pending:
+                self.rejected += 1
+                raise HTTPError(503, reason="Server busy")
+            self.pending += 1
+        try:
+            future = self._executor.submit(self._call, fn, args)
+        except RuntimeError:
+            with self._lock:
+                self.pending -= 1
+            raise HTTPError(503, reason="Server shutting down")
+        return await asyncio.wrap_future(future)
+
+    def get_stats(self):
+        with self._lock:
+            return {'workers': self.workers, 'pending': self.pending,
+                    'max_pending': self.max_pending, 'rejected': self.rejected}
+
+    def shutdown(self):
+        self._executor.shutdown(wait=True)
+
+
+def _json_default(value):
+    if isinstance(value, np.integer):
+        return int(value)
+    if isinstance(value, np.floating):
+        return float(value)
+    if isinstance(value, np.bool_):
+        return bool(value)
+    if isinstance(value, date):
+        return value.isoformat()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+def _records(df):
+    return df.astype(object).where(df.notna(), None).to_dict('records')
+
+def _versions(tables):
+    return [database.get_table_version(table) for table in tables]
+
+def _leave_cursor(cursor):
+    return None if cursor is None else f"{cursor[0]}:{cursor[1]}"
+
+
+class BaseHandler(tornado.web.RequestHandler):
+    def initialize(self, executor):
+        self.executor = executor
+
+    def prepare(self):
+        if API_TOKEN is None:
+            return
+        expected = f"Bearer {API_TOKEN}"
+        if not hmac.compare_digest(self.request.headers.get('Authorization', ''), expected):
+            raise HTTPError(401, reason="Missing or invalid API token")
+
+    def write_json(self, obj, status=200):
+        self.set_status(status)
+        self.set_header('Content-Type', 'application/json; charset=UTF-8')
+        self.finish(json.dumps(obj, default=_json_default))
+
+    def write_error(self, status_code, **kwargs):
+        self.set_header('Content-Type', 'application/json; charset=UTF-8')
+        self.finish(json.dumps({'error': self._reason}))
+
+    async def db(self, fn, *args):
+        result = await self.executor.run(fn, *args)
+        if result is None:
+            raise HTTPError(500, reason="Database error")
+        return result
+
+    async def not_modified(self, *tables):
+        # Sets a version-based ETag and returns True if the client already
+        # has this response.
+        versions = await self.executor.run(_versions, tables)
+        tag = hashlib.sha1(f"{self.request.uri}|{versions}".encode()).hexdigest()
+        self.set_header('Etag', f'"{tag}"')
+        if self.check_etag_header():
+            self.set_status(304)
+            self.finish()
+            return True
+        return False
+
+    def int_argument(self, name, default=None, low=None, high=None):
+        value = self.get_argument(name, None)
+        if value is None:
+            return default
+        try:
+            value = int(value)
+        except ValueError:
+            raise HTTPError(400, reason=f"{name} must be an integer")
+        if low is not None:
+            value = max(value, low)
+        if high is not None:
+            value = min(value, high)
+        return value
+
+    def date_argument(self, name):
+        value = self.get_argument(name, None)
+        return None if value is None else self.parse_date(value, name)
+
+    def parse_date(self, value, name):
+        try:
+            return date.fromisoformat(str(value))
+        except ValueError:
+            raise HTTPError(400, reason=f"{name} must be an ISO date (YYYY-MM-DD)")
+
+    def json_body(self):
+        try:
+            body = json.loads(self.request.body or b'{}')
+        except ValueError:
+            raise HTTPError(400, reason="Request body must be JSON")
+        if not isinstance(body, dict):
+            raise HTTPError(400, reason="Request body must be a JSON object")
+        return body
+
+    def page_size(self):
+        return self.int_argument('limit', PAGE_SIZE, 1, API_MAX_PAGE_SIZE)
+
+
+class HealthHandler(BaseHandler):
+    def compute_etag(self):
+        return None
+
+    async def get(self):
+        self.write_json({'status': 'ok', 'executor': self.executor.get_stats(),
+                         'pool': database.get_pool_stats(), 'writer': database.get_writer_stats(),
+                         'cache': database.get_cache_stats()})
+
+
+class UsersHandler(BaseHandler):
+    async def get(self):
+        after = self.int_argument('after')
+        limit = self.page_size()
+        if await self.not_modified('users'):
+            return
+        df, next_cursor = await self.executor.run(database.get_users_page, after, limit)
+        if df is None:
+            raise HTTPError(500, reason="Database error")
+        self.write_json({'items': _records(df), 'next': next_cursor})
+
+
+class UserHandler(BaseHandler):
+    async def get(self, user_id):
+        if await self.not_modified('users'):
+            return
+        user = await self.executor.run(database.get_user, int(user_id))
+        if user is None:
+            raise HTTPError(404, reason="User not found")
+        self.write_json(user)
+
+
+class BalanceHandler(BaseHandler):
+    async def get(self, user_id):
+        user_id = int(user_id)
+        as_of = self.date_argument('as_of')
+        if await self.not_modified('users', 'balance_ledger'):
+            return
+        user = await self.executor.run(database.get_user, user_id)
+        if user is None:
+            raise HTTPError(404, reason="User not found")
+        result = {'user_id': user_id, 'remaining_leaves': user['remaining_leaves'],
+                  'allowance': user['allowance']}
+        if as_of is not None:
+            result['as_of'] = as_of
+            result['balance'] = await self.db(database.get_balance_as_of, user_id, as_of)
+        self.write_json(result)
+
+
+class LedgerHandler(BaseHandler):
+    async def get(self, user_id):
+        limit = self.page_size()
+        if await self.not_modified('users', 'balance_ledger'):
+            return
+        history = await self.db(database.get_balance_history, int(user_id), limit)
+        self.write_json({'items': _records(history)})
+
+
+class LeavesHandler(BaseHandler):
+    def after_argument(self):
+        after = self.get_argument('after', None)
+        if after is None:
+            return None
+        start, _, leave_id = after.rpartition(':')
+        if not start or not leave_id.isdigit():
+            raise HTTPError(400, reason="after must be a cursor returned as 'next'")
+        return (start, int(leave_id))
+
+    async def get(self):
+        status = self.get_argument('status', None)
+        args = dict(user_id=self.int_argument('user_id'), status=status,
+                    department=self.get_argument('department', None), after=self.after_argument(),
+                    page_size=self.page_size(), leave_type=self.get_argument('leave_type', None),
+                    date_from=self.date_argument('date_from'), date_to=self.date_argument('date_to'))
+        if await self.not_modified('leaves', 'users'):
+            return
+        rows, next_cursor = await self.executor.run(lambda: database.get_leaves_page(**args))
+        if rows is None:
+            raise HTTPError(500, reason="Database error")
+        self.write_json({'items': [dict(row) for row in rows], 'next': _leave_cursor(next_cursor)})
+
+    async def post(self):
+        body = self.json_body()
+        missing = [name for name in ('user_id', 'start_date', 'end_date', 'leave_type') if body.get(name) is None]
+        if missing:
+            raise HTTPError(400, reason=f"Missing fields: {', '.join(missing)}")
+        try:
+            user_id = int(body['user_id'])
+        except (TypeError, ValueError):
+            raise HTTPError(400, reason="user_id must be an integer")
+        start = self.parse_date(body['start_date'], 'start_date')
+        end = self.parse_date(body['end_date'], 'end_date')
+        ok, message = await self.executor.run(database.submit_leave, user_id, start, end,
+                                              str(body.get('reason') or ''), str(body['leave_type']))
+        if ok:
+            self.write_json({'message': message}, status=201)
+        elif message == "User not found.":
+            raise HTTPError(404, reason=message)
+        elif message.startswith("Error") or message.startswith("Unable"):
+            raise HTTPError(500, reason=message)
+        else:
+            raise HTTPError(409, reason=message)
+
+
+class SearchHandler(BaseHandler):
+    def after_argument(self):
+        # Cursors are the doc_id of the previous page's last result.
+        after = self.get_argument('after', None)
+        if after is None:
+            return None
+        try:
+            return int(after)
+        except ValueError:
+            raise HTTPError(400, reason="after must be a cursor returned as 'next'")
+
+    async def get(self):
+        text = self.get_argument('q', '')
+        if not text.strip():
+            raise HTTPError(400, reason="q is required")
+        source = self.get_argument('source', None)
+        if source is not None and source not in SEARCH_SOURCES:
+            raise HTTPError(400, reason=f"source must be one of {', '.join(SEARCH_SOURCES)}")
+        args = dict(department=self.get_argument('department', None), status=self.get_argument('status', None),
+                    date_from=self.date_argument('date_from'), date_to=self.date_argument('date_to'),
+                    sources=SEARCH_SOURCES if source is None else (source,), after=self.after_argument(),
+                    page_size=self.page_size())
+        if await self.not_modified('leaves', 'users', 'balance_ledger'):
+            return
+        rows, next_cursor, truncated, restarted = await self.executor.run(
+            lambda: database.search_leave_reasons(text, **args))
+        if rows is None:
+            raise HTTPError(500, reason="Database error")
+        self.write_json({
+            'items': [{key: row[key] for key in row.keys() if key != 'most_matches'} for row in rows],
+            'next': None if next_cursor is None else str(next_cursor),
+            'truncated': truncated,
+            'restarted': restarted,
+        })
+
+
+class DecisionsHandler(BaseHandler):
+    async def post(self):
+        body = self.json_body()
+        status = body.get('status')
+        if status not in database.DECISION_STATUSES:
+            raise HTTPError(400, reason=f"status must be one of {', '.join(database.DECISION_STATUSES)}")
+        try:
+            ids = [int(leave_id) for leave_id in body.get('ids') or []]
+        except (TypeError, ValueError):
+            raise HTTPError(400, reason="ids must be a list of leave ids")
+        if not ids:
+            raise HTTPError(400, reason="ids must not be empty")
+        summary = await self.db(database.decide_leaves, ids, status)
+        self.write_json(summary)
+
+
+class StatsHandler(BaseHandler):
+    # Served from the analytics snapshot; the ETag is a hash of the body.
+    async def get(self, name):
+        if name not in STATS:
+            raise HTTPError(404, reason=f"Unknown statistic; use one of {', '.join(STATS)}")
+        df = await self.db(STATS[name])
+        self.write_json({'items': _records(df)})
+
+
+class NotFoundHandler(BaseHandler):
+    def prepare(self):
+        raise HTTPError(404, reason="Not found")
+
+
+def make_app(executor):
+    kwargs = {'executor': executor}
+    return tornado.web.Application([
+        (r'/api/health', HealthHandler, kwargs),
+        (r'/api/users', UsersHandler, kwargs),
+        (r'/api/users/(\d+)', UserHandler, kwargs),
+        (r'/api/users/(\d+)/balance', BalanceHandler, kwargs),
+        (r'/api/users/(\d+)/ledger', LedgerHandler, kwargs),
+        (r'/api/leaves', LeavesHandler, kwargs),
+        (r'/api/leaves/decisions', DecisionsHandler, kwargs),
+        (r'/api/search', SearchHandler, kwargs),
+        (r'/api/stats/([a-z-]+)', StatsHandler, kwargs),
+    ], default_handler_class=NotFoundHandler, default_handler_args=kwargs)
+
+
+
+async def serve(address, port, workers):
+    executor = DatabaseExecutor(workers)
+    server = make_app(executor).listen(port, address, xheaders=True)
+    print(f"Leave API listening on http://{address}:{port}/api/ ({workers} database threads)", flush=True)
+    try:
+        await asyncio.Event().wait()
+    finally:
+        server.stop()
+        executor.shutdown()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Headless JSON API over the leave database.")
+    parser.add_argument('--address', default=API_ADDRESS)
+    parser.add_argument('--port', type=int, default=API_PORT)
+    parser.add_argument('--workers', type=int, default=API_WORKERS, help="database threads")
+    parser.add_argument('--db', help="database path (default: config.DB_PATH)")
+    args = parser.parse_args(argv)
+
+    if args.db:
+        database.close_pool()
+        database.DB_PATH = args.db
+    database.init_db()
+    try:
+        asyncio.run(serve(args.address, args.port, args.workers))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        database.close_pool()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
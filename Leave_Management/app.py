@@ -1,7 +1,5 @@
 import streamlit as st
 from auth import login_page, logout
-from admin import admin_dashboard
-from user import user_dashboard
 from database import init_db
 from config import COLORSCHEME
 
@@ -44,9 +42,13 @@ def main():
             logout()
             st.rerun()
 
+        # The dashboards (and plotly behind them) are only imported once
+        # someone has logged in, so the login page starts without them.
         if st.session_state.is_admin:
+            from admin import admin_dashboard
             admin_dashboard()
         elif st.session_state.username:
+            from user import user_dashboard
             user_dashboard(st.session_state.username)
         else:
             st.error("Session error. Please log in again.")
@@ -1,5 +1,6 @@
 import streamlit as st
-from database import get_db_connection
+from datetime import date
+from database import get_db_connection, get_user_context, get_user_version
 from config import ADMIN_USERNAME, ADMIN_PASSWORD, COLORSCHEME
 
 def login(username, password):
@@ -16,6 +17,7 @@ def login(username, password):
         cur.execute('SELECT * FROM users WHERE username = ? AND password = ?', (username, password))
         user = cur.fetchone()
         if user:
+            load_user_context(username)
             return True, user['is_admin']
         return False, False
     except Exception as e:
@@ -72,8 +74,26 @@ def login_page():
         
         st.markdown("</div>", unsafe_allow_html=True)
 
+def load_user_context(username):
+    context = get_user_context(username)
+    if context is not None:
+        context['loaded_on'] = date.today()
+    st.session_state.user_context = context
+    return context
+
+def current_user_context(username):
+    # The logged-in user's id, department, is_admin, balance and upcoming
+    # leave count, kept in session state and reloaded only when their row or
+    # their leaves have been written to (or the day has rolled over).
+    context = st.session_state.get('user_context')
+    if (context is None or context['username'] != username
+            or context['version'] != get_user_version(context['id'])
+            or context['loaded_on'] != date.today()):
+        context = load_user_context(username)
+    return context
+
 def logout():
-    for key in ['is_authenticated', 'is_admin', 'username']:
+    for key in ['is_authenticated', 'is_admin', 'username', 'user_context']:
         if key in st.session_state:
             del st.session_state[key]
     st.rerun()
\ No newline at end of file
@@ -0,0 +1,238 @@
+import argparse
+import itertools
+import json
+import os
+import platform
+import random
+import sqlite3
+import statistics
+import subprocess
+import sys
+import time
+from datetime import date, timedelta
+import database
+from calendar_engine import leave_occupancy, to_days
+
+# Times every database.py helper and the data loading behind each admin/user
+# page against a database (normally one built by generate_data.py), and
+# writes the results as JSON so runs from different commits can be compared:
+#
+#   python benchmark.py /tmp/bench.db -o before.json
+#   python benchmark.py /tmp/bench.db -o after.json --compare before.json
+#
+# The query cache is cleared before every run, so the figures are for the
+# uncached path. Write benchmarks use dates far in the future so they do not
+# disturb the read benchmarks. Helpers that materialise whole tables are
+# skipped unless --include-heavy is given.
+
+def _context():
+    conn = database.get_db_connection()
+    try:
+        user = conn.execute('''
+            SELECT users.id, users.username, users.department FROM users
+            JOIN leaves ON leaves.user_id = users.id
+            WHERE users.department IS NOT NULL
+            GROUP BY users.id ORDER BY COUNT(*) DESC LIMIT 1
+        ''').fetchone()
+        user_ids = [row[0] for row in conn.execute('SELECT id FROM users ORDER BY random() LIMIT 1000')]
+        pending = [row[0] for row in conn.execute(
+            "SELECT id FROM leaves WHERE status = 'pending' ORDER BY start_date DESC LIMIT 2000")]
+        busiest = conn.execute('''
+            SELECT start_date FROM leaves WHERE status = 'approved'
+            GROUP BY start_date ORDER BY COUNT(*) DESC LIMIT 1
+        ''').fetchone()
+    finally:
+        conn.close()
+    if user is None:
+        raise SystemExit("The database has no users with leaves; run generate_data.py first.")
+    return {
+        'user_id': user['id'], 'username': user['username'], 'department': user['department'],
+        'user_ids': user_ids, 'pending': pending,
+        'day': date.fromisoformat(busiest[0]) if busiest else date.today(),
+        'counter': itertools.count(),
+        'rng': random.Random(0),
+    }
+
+def _page_team_calendar(ctx):
+    year = date.today().year
+    df = database.get_team_leaves(ctx['department'], date(year, 1, 1), date(year, 12, 31))
+    leave_occupancy(to_days(df['start_day']), to_days(df['end_day']), date(year, 1, 1), date(year, 12, 31))
+    database.get_leaves_on(ctx['day'], ctx['department'])
+
+def _page_leave_overview(ctx):
+    database.get_leave_overview()
+    database.get_leave_utilization()
+    database.get_top_leave_types(5)
+    database.get_monthly_leave_counts()
+
+def _page_manage_leaves(ctx):
+    database.get_leaves_page(status='pending')
+    database.count_matching_leaves('pending')
+
+def _submit(ctx):
+    n = next(ctx['counter'])
+    start = date(2100, 1, 1) + timedelta(days=3 * (n % 10000))
+    database.submit_leave(ctx['rng'].choice(ctx['user_ids']), start, start, "benchmark", "Other",
+                          days_requested=0)
+
+def _decide(ctx):
+    if ctx['pending']:
+        database.decide_leaves([ctx['pending'].pop()], 'approved')
+
+def _update_user(ctx):
+    conn = database.get_db_connection()
+    user = conn.execute('SELECT * FROM users WHERE id = ?', (ctx['rng'].choice(ctx['user_ids']),)).fetchone()
+    conn.close()
+    database.update_user_data(user['id'], user['username'], user['department'], user['is_admin'],
+                              user['remaining_leaves'], 0, "")
+
+# (name, function(ctx), heavy)
+BENCHMARKS = [
+    ('init_db', lambda ctx: database.init_db(), False),
+    ('get_user_context', lambda ctx: database.get_user_context(ctx['username']), False),
+    ('get_remaining_leaves', lambda ctx: database.get_remaining_leaves(ctx['user_id']), False),
+    ('get_user_leaves', lambda ctx: database.get_user_leaves(ctx['user_id']), False),
+    ('get_user_leave_type_counts', lambda ctx: database.get_user_leave_type_counts(ctx['user_id']), False),
+    ('get_leave_breakdown', lambda ctx: database.get_leave_breakdown(ctx['user_id'], date.today().year), False),
+    ('get_leaves_page (user)', lambda ctx: database.get_leaves_page(user_id=ctx['user_id']), False),
+    ('get_leaves_page (pending)', lambda ctx: database.get_leaves_page(status='pending'), False),
+    ('get_leaves_page (all)', lambda ctx: database.get_leaves_page(), False),
+    ('get_leaves_page (department)', lambda ctx: database.get_leaves_page(department=ctx['department']), False),
+    ('get_users_page', lambda ctx: database.get_users_page(), False),
+    ('count_matching_leaves', lambda ctx: database.count_matching_leaves('pending', ctx['department']), False),
+    ('get_all_users', lambda ctx: database.get_all_users(), False),
+    ('get_leave_overview', lambda ctx: database.get_leave_overview(), False),
+    ('get_leave_utilization', lambda ctx: database.get_leave_utilization(), False),
+    ('get_top_leave_types', lambda ctx: database.get_top_leave_types(5), False),
+    ('get_monthly_leave_counts', lambda ctx: database.get_monthly_leave_counts(), False),
+    ('get_table_version', lambda ctx: database.get_table_version('leaves'), False),
+    ('get_team_leaves', lambda ctx: database.get_team_leaves(
+        ctx['department'], ctx['day'], ctx['day'] + timedelta(days=365)), False),
+    ('get_leaves_on', lambda ctx: database.get_leaves_on(ctx['day'], ctx['department']), False),
+    ('get_leaves_between', lambda ctx: database.get_leaves_between(
+        ctx['day'], ctx['day'] + timedelta(days=30), ctx['department']), False),
+    ('get_department_leaves', lambda ctx: database.get_department_leaves(ctx['department']), True),
+    ('get_all_leaves', lambda ctx: database.get_all_leaves(), True),
+    ('iter_leaves', lambda ctx: sum(1 for _ in database.iter_leaves()), True),
+    ('iter_leave_chunks (arrow)', lambda ctx: sum(
+        batch.num_rows for batch in database.iter_leave_chunks(format='arrow')), True),
+    ('add_user', lambda ctx: database.add_user(f"bench{time.time_ns()}", "pw", "IT"), False),
+    ('update_remaining_leaves', lambda ctx: database.update_remaining_leaves(
+        ctx['rng'].choice(ctx['user_ids']), 0), False),
+    ('submit_leave', _submit, False),
+    ('update_leave_status', _decide, False),
+    ('update_user_data', _update_user, False),
+    ('page: user Leave Summary', lambda ctx: (database.get_user_context(ctx['username']),
+                                              database.get_leave_breakdown(ctx['user_id'], date.today().year)),
+     False),
+    ('page: user Leave History', lambda ctx: (database.get_leaves_page(user_id=ctx['user_id']),
+                                              database.get_user_leave_type_counts(ctx['user_id'])), False),
+    ('page: user Team Calendar', _page_team_calendar, False),
+    ('page: admin Leave Overview', _page_leave_overview, False),
+    ('page: admin Manage Leaves', _page_manage_leaves, False),
+    ('page: admin User Management', lambda ctx: database.get_users_page(), False),
+]
+
+def run_benchmarks(repeat, include_heavy=False, only=None):
+    ctx = _context()
+    results, skipped = {}, []
+    for name, func, heavy in BENCHMARKS:
+        if only and not any(part in name for part in only):
+            continue
+        if heavy and not include_heavy:
+            skipped.append(name)
+            continue
+        timings = []
+        for _ in range(repeat + 1):
+            database.invalidate_cache('users', 'leaves', 'snapshot')
+            started = time.perf_counter()
+            func(ctx)
+            timings.append((time.perf_counter() - started) * 1000)
+        first, steady = timings[0], sorted(timings[1:])
+        results[name] = {
+            'runs': len(steady),
+            'first_ms': round(first, 3),
+            'min_ms': round(steady[0], 3),
+            'median_ms': round(statistics.median(steady), 3),
+            'p95_ms': round(steady[min(len(steady) - 1, int(len(steady) * 0.95))], 3),
+            'mean_ms': round(statistics.fmean(steady), 3),
+        }
+        print(f"{name:<34} median {results[name]['median_ms']:>10.2f} ms", file=sys.stderr)
+    return results, skipped
+
+def _metadata(path):
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        commit = None
+    conn = database.get_db_connection()
+    try:
+        users = conn.execute('SELECT COUNT(*) FROM users').fetchone()[0]
+        leaves = conn.execute('SELECT COUNT(*) FROM leaves').fetchone()[0]
+    finally:
+        conn.close()
+    return {
+        'commit': commit,
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'database': os.path.abspath(path),
+        'users': users,
+        'leaves': leaves,
+        'python': platform.python_version(),
+        'sqlite': sqlite3.sqlite_version,
+        'platform': platform.platform(),
+    }
+
+def compare(current, baseline, threshold, min_delta_ms):
+    # Returns the names whose median got slower than threshold x baseline by
+    # more than min_delta_ms (sub-millisecond jitter is not a regression).
+    regressions = []
+    for name, result in current['results'].items():
+        before = baseline['results'].get(name)
+        if before is None or not before['median_ms']:
+            continue
+        ratio = result['median_ms'] / before['median_ms']
+        regressed = ratio > threshold and result['median_ms'] - before['median_ms'] > min_delta_ms
+        flag = 'REGRESSION' if regressed else ''
+        print(f"{name:<34} {before['median_ms']:>10.2f} -> {result['median_ms']:>10.2f} ms  x{ratio:.2f} {flag}")
+        if regressed:
+            regressions.append(name)
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the Leave_Management data layer.")
+    parser.add_argument('database', help="database to benchmark (see generate_data.py)")
+    parser.add_argument('-o', '--output', help="write JSON results here (default: stdout)")
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--include-heavy', action='store_true', help="also time whole-table helpers")
+    parser.add_argument('--only', nargs='*', help="only benchmarks whose name contains one of these")
+    parser.add_argument('--compare', help="baseline JSON to compare against")
+    parser.add_argument('--threshold', type=float, default=1.25, help="slowdown ratio counted as a regression")
+    parser.add_argument('--min-delta-ms', type=float, default=1.0, help="ignore slowdowns smaller than this")
+    args = parser.parse_args(argv)
+
+    if not os.path.exists(args.database):
+        parser.error(f"{args.database} does not exist")
+    database.close_pool()
+    database.DB_PATH = args.database
+    try:
+        results, skipped = run_benchmarks(args.repeat, args.include_heavy, args.only)
+        report = {'meta': _metadata(args.database), 'results': results, 'skipped': skipped}
+    finally:
+        database.close_pool()
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        return 1 if compare(report, baseline, args.threshold, args.min_delta_ms) else 0
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
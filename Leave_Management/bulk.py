@@ -0,0 +1,302 @@
+import argparse
+import csv
+import io
+import sqlite3
+import sys
+from datetime import date
+from accrual import prorated_entitlement
+from database import get_db_connection, init_db, invalidate_cache, stream_query, submit_write
+
+# Streaming bulk import/export of users and leaves. Input is read and written
+# in fixed-size chunks, each chunk is inserted with executemany as one
+# operation on the database writer thread (committed before the next chunk is
+# read), and only the first MAX_REPORTED_ERRORS row errors are kept, so memory
+# stays constant regardless of file size.
+#
+# Exports never contain passwords. To load an exported users file back (into
+# a new database, say), pass default_password (--default-password): every
+# user without a password gets that one and should change it. Without it,
+# rows with no password are rejected.
+
+DEFAULT_CHUNK_SIZE = 5000
+MAX_REPORTED_ERRORS = 1000
+LEAVE_STATUSES = ('pending', 'approved', 'rejected')
+
+USER_COLUMNS = ['id', 'username', 'department', 'is_admin', 'remaining_leaves', 'allowance', 'joined_on']
+LEAVE_COLUMNS = ['id', 'user_id', 'username', 'start_date', 'end_date', 'reason', 'status', 'leave_type']
+INTEGER_COLUMNS = {'id', 'user_id', 'is_admin', 'remaining_leaves', 'allowance'}
+
+
+def _is_parquet(source):
+    name = source if isinstance(source, str) else getattr(source, 'name', '')
+    return str(name).lower().endswith(('.parquet', '.pq'))
+
+def read_chunks(source, chunk_size=DEFAULT_CHUNK_SIZE):
+    # Yields lists of dicts. source is a path or a binary file object.
+    if _is_parquet(source):
+        import pyarrow.parquet as pq
+        for batch in pq.ParquetFile(source).iter_batches(batch_size=chunk_size):
+            yield batch.to_pylist()
+        return
+
+    if isinstance(source, str):
+        handle = open(source, newline='', encoding='utf-8')
+    else:
+        handle = io.TextIOWrapper(source, newline='', encoding='utf-8')
+    with handle:
+        chunk = []
+        for row in csv.DictReader(handle):
+            chunk.append(row)
+            if len(chunk) >= chunk_size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+
+def _text(value):
+    if value is None:
+        return None
+    value = str(value).strip()
+    return value or None
+
+def _flag(value):
+    text = _text(value)
+    if text is None:
+        return False
+    if text.lower() in ('1', 'true', 'yes', 'y'):
+        return True
+    if text.lower() in ('0', 'false', 'no', 'n'):
+        return False
+    raise ValueError(f"invalid boolean {value!r}")
+
+def _int(value, default=None):
+    text = _text(value)
+    if text is None:
+        if default is None:
+            raise ValueError("missing integer value")
+        return default
+    return int(float(text))
+
+def _iso_date(value, column):
+    text = _text(value)
+    if text is None:
+        raise ValueError(f"missing {column}")
+    return date.fromisoformat(text[:10]).isoformat()
+
+def _user_params(row, default_password=None):
+    username = _text(row.get('username'))
+    password = _text(row.get('password')) or default_password
+    if username is None or password is None:
+        raise ValueError("username and password are required")
+    department = _text(row.get('department'))
+    # Missing values default as in database.add_user: joined today, with the
+    # department's entitlement pro-rated from then, all of it remaining.
+    joined_on = date.today()
+    if _text(row.get('joined_on')) is not None:
+        joined_on = date.fromisoformat(_iso_date(row.get('joined_on'), 'joined_on'))
+    allowance = _int(row.get('allowance'), prorated_entitlement(department, joined_on, date.today().year))
+    return (username, password, department, _flag(row.get('is_admin')),
+            _int(row.get('remaining_leaves'), allowance), allowance, joined_on.isoformat())
+
+def _leave_params(row, user_ids):
+    user_id = _text(row.get('user_id'))
+    if user_id is not None:
+        user_id = _int(user_id)
+        if user_id not in user_ids:
+            raise ValueError(f"unknown user_id {user_id}")
+    else:
+        username = _text(row.get('username'))
+        if username is None:
+            raise ValueError("user_id or username is required")
+        user_id = user_ids.get(username)
+        if user_id is None:
+            raise ValueError(f"unknown user {username!r}")
+    start_date = _iso_date(row.get('start_date'), 'start_date')
+    end_date = _iso_date(row.get('end_date'), 'end_date')
+    if end_date < start_date:
+        raise ValueError("end_date is before start_date")
+    status = (_text(row.get('status')) or 'approved').lower()
+    if status not in LEAVE_STATUSES:
+        raise ValueError(f"invalid status {status!r}")
+    return (user_id, start_date, end_date, _text(row.get('reason')) or '', status,
+            _text(row.get('leave_type')))
+
+
+INSERT_USER = '''
+    INSERT INTO users (username, password, department, is_admin, remaining_leaves, allowance, joined_on)
+    VALUES (?, ?, ?, ?, ?, ?, ?)
+'''
+INSERT_LEAVE = '''
+    INSERT INTO leaves (user_id, start_date, end_date, start_day, end_day, reason, status, leave_type, days)
+    VALUES (?1, ?2, ?3, CAST(julianday(?2) - 2440587.5 AS INTEGER), CAST(julianday(?3) - 2440587.5 AS INTEGER),
+            ?4, ?5, ?6, working_days(?2, ?3, (SELECT department FROM users WHERE id = ?1)))
+'''
+
+def _lookup_user_ids(conn, chunk):
+    # Maps each username in the chunk, and each user_id, to the id of an
+    # existing user; anything missing is not a user. Foreign keys are not
+    # enforced, so this is the only check that a leave has an owner.
+    names, ids = set(), set()
+    for row in chunk:
+        user_id = _text(row.get('user_id'))
+        if user_id is None:
+            if _text(row.get('username')):
+                names.add(row['username'].strip())
+            continue
+        try:
+            ids.add(_int(user_id))
+        except ValueError:
+            pass
+    user_ids = {}
+    for column, values in (('username', list(names)), ('id', list(ids))):
+        for i in range(0, len(values), 500):
+            part = values[i:i + 500]
+            placeholders = ','.join('?' * len(part))
+            for row in conn.execute(f'SELECT id, username FROM users WHERE {column} IN ({placeholders})', part):
+                user_ids[row[column]] = row['id']
+    return user_ids
+
+def _insert_chunk(conn, sql, params, line_numbers):
+    # Runs on the writer thread. If the batch trips a constraint, replay it
+    # row by row under the same transaction so only the offending rows are
+    # lost. Returns (inserted, [(line, message), ...]).
+    conn.execute('SAVEPOINT chunk')
+    try:
+        conn.executemany(sql, params)
+        conn.execute('RELEASE chunk')
+        return len(params), []
+    except sqlite3.IntegrityError:
+        conn.execute('ROLLBACK TO chunk')
+        conn.execute('RELEASE chunk')
+    inserted, errors = 0, []
+    for line, values in zip(line_numbers, params):
+        try:
+            conn.execute(sql, values)
+            inserted += 1
+        except sqlite3.IntegrityError as e:
+            errors.append((line, str(e)))
+    return inserted, errors
+
+def _write_chunk(sql, params, line_numbers, report):
+    inserted, errors = submit_write(_insert_chunk, sql, params, line_numbers).result()
+    invalidate_cache('users', 'leaves')
+    report['inserted'] += inserted
+    for line, message in errors:
+        _add_error(report, line, message)
+
+def _add_error(report, line, message):
+    report['failed'] += 1
+    if len(report['errors']) < MAX_REPORTED_ERRORS:
+        report['errors'].append((line, message))
+
+def import_rows(kind, source, chunk_size=DEFAULT_CHUNK_SIZE, progress=None, default_password=None):
+    # kind is 'users' or 'leaves'. progress(report) is called after each chunk.
+    # Imported leaves are history: they do not debit remaining_leaves.
+    # default_password is given to users without one (see above).
+    if kind not in ('users', 'leaves'):
+        raise ValueError("kind must be 'users' or 'leaves'")
+    report = {'rows': 0, 'inserted': 0, 'failed': 0, 'errors': []}
+    conn = get_db_connection()
+    if conn is None:
+        raise sqlite3.OperationalError("Unable to connect to the database")
+
+    try:
+        line = 1  # header
+        for chunk in read_chunks(source, chunk_size):
+            user_ids = _lookup_user_ids(conn, chunk) if kind == 'leaves' else None
+            params, line_numbers = [], []
+            for row in chunk:
+                line += 1
+                try:
+                    if kind == 'users':
+                        params.append(_user_params(row, default_password))
+                    else:
+                        params.append(_leave_params(row, user_ids))
+                    line_numbers.append(line)
+                except (ValueError, TypeError) as e:
+                    _add_error(report, line, str(e))
+            if params:
+                _write_chunk(INSERT_USER if kind == 'users' else INSERT_LEAVE, params, line_numbers, report)
+            report['rows'] += len(chunk)
+            if progress is not None:
+                progress(report)
+        return report
+    finally:
+        conn.close()
+
+
+EXPORT_QUERIES = {
+    'users': 'SELECT id, username, department, is_admin, remaining_leaves, allowance, joined_on FROM users ORDER BY id',
+    'leaves': '''
+        SELECT leaves.id, leaves.user_id, users.username, leaves.start_date, leaves.end_date,
+               leaves.reason, leaves.status, leaves.leave_type
+        FROM leaves
+        LEFT JOIN users ON leaves.user_id = users.id
+        ORDER BY leaves.id
+    ''',
+}
+
+def export_rows(kind, destination, chunk_size=DEFAULT_CHUNK_SIZE, progress=None):
+    # Streams the table to a CSV or Parquet file; returns the row count.
+    if kind not in EXPORT_QUERIES:
+        raise ValueError("kind must be 'users' or 'leaves'")
+    columns = USER_COLUMNS if kind == 'users' else LEAVE_COLUMNS
+    chunks = stream_query(EXPORT_QUERIES[kind], chunk_size=chunk_size)
+
+    written = 0
+    try:
+        if _is_parquet(destination):
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+            schema = pa.schema([(name, pa.int64() if name in INTEGER_COLUMNS else pa.string())
+                                for name in columns])
+            with pq.ParquetWriter(destination, schema) as writer:
+                for rows in chunks:
+                    writer.write_table(pa.Table.from_pylist([dict(row) for row in rows], schema=schema))
+                    written += len(rows)
+                    if progress is not None:
+                        progress(written)
+        else:
+            with open(destination, 'w', newline='', encoding='utf-8') as handle:
+                out = csv.writer(handle)
+                out.writerow(columns)
+                for rows in chunks:
+                    out.writerows(tuple(row) for row in rows)
+                    written += len(rows)
+                    if progress is not None:
+                        progress(written)
+        return written
+    finally:
+        chunks.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Bulk import/export of users and leaves (CSV or Parquet).")
+    parser.add_argument('action', choices=['import', 'export'])
+    parser.add_argument('kind', choices=['users', 'leaves'])
+    parser.add_argument('path')
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE)
+    parser.add_argument('--default-password',
+                        help="password for imported users without one (exports never include passwords)")
+    args = parser.parse_args(argv)
+
+    init_db()
+    if args.action == 'export':
+        count = export_rows(args.kind, args.path, args.chunk_size,
+                            progress=lambda n: print(f"\r{n} rows written", end='', file=sys.stderr))
+        print(f"\nExported {count} {args.kind} to {args.path}", file=sys.stderr)
+        return 0
+
+    report = import_rows(args.kind, args.path, args.chunk_size, default_password=args.default_password,
+                         progress=lambda r: print(f"\r{r['rows']} rows read, {r['inserted']} inserted, "
+                                                  f"{r['failed']} failed", end='', file=sys.stderr))
+    print(file=sys.stderr)
+    for line, message in sorted(report['errors']):
+        print(f"line {line}: {message}")
+    if report['failed'] > len(report['errors']):
+        print(f"... {report['failed'] - len(report['errors'])} more errors not shown")
+    return 1 if report['failed'] else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
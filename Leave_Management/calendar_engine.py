@@ -0,0 +1,54 @@
+import numpy as np
+
+# Team calendar occupancy using a difference array: each leave adds +1 on its
+# first day and -1 on the day after its last day, and a cumulative sum turns
+# that into per-day counts. Cost is O(leaves + days) regardless of how long
+# the leaves or the window are.
+
+EPOCH = np.datetime64('1970-01-01', 'D')
+
+def to_days(values):
+    # ISO date strings, dates, datetime64 values or day numbers -> datetime64[D]
+    return np.asarray(values, dtype='datetime64[D]')
+
+def day_number(value):
+    # Days since 1970-01-01, as stored in leaves.start_day/end_day.
+    return int((np.datetime64(value, 'D') - EPOCH).astype(np.int64))
+
+def date_window(window_start, window_end):
+    start = np.datetime64(window_start, 'D')
+    end = np.datetime64(window_end, 'D')
+    if end < start:
+        raise ValueError("window_end must not be before window_start")
+    return np.arange(start, end + 1, dtype='datetime64[D]')
+
+def _clip_to_window(starts, ends, window_start, n_days):
+    s = (to_days(starts) - window_start).astype(np.int64)
+    e = (to_days(ends) - window_start).astype(np.int64)
+    keep = (e >= 0) & (s < n_days) & (s <= e)
+    return np.clip(s, 0, n_days - 1), np.clip(e, 0, n_days - 1), keep
+
+def leave_occupancy(starts, ends, window_start, window_end, employees=None):
+    # Returns (days, counts, presence). counts[i] is the number of leaves
+    # covering days[i]. When employees (one label per leave) is given,
+    # presence is a (labels, bool matrix) pair with one row per distinct
+    # employee and one column per day; otherwise presence is None.
+    days = date_window(window_start, window_end)
+    n_days = len(days)
+    s, e, keep = _clip_to_window(starts, ends, days[0], n_days)
+    s, e = s[keep], e[keep]
+
+    diff = np.bincount(s, minlength=n_days + 1) - np.bincount(e + 1, minlength=n_days + 1)
+    counts = np.cumsum(diff[:n_days]).astype(np.int32)
+
+    presence = None
+    if employees is not None:
+        labels, rows = np.unique(np.asarray(employees)[keep], return_inverse=True)
+        width = n_days + 1
+        size = len(labels) * width
+        grid = (np.bincount(rows * width + s, minlength=size)
+                - np.bincount(rows * width + e + 1, minlength=size))
+        matrix = np.cumsum(grid.reshape(len(labels), width), axis=1)[:, :n_days] > 0
+        presence = (labels, matrix)
+
+    return days, counts, presence
@@ -0,0 +1,207 @@
+import argparse
+import sqlite3
+import sys
+import time
+from config import CHANGES_BATCH_SIZE
+
+# Change feed for users and leaves. Triggers append one compact event per row
+# change (table, row id, op) to `changes` in the same transaction as the
+# change itself, numbered by an AUTOINCREMENT seq that only ever grows. Events
+# carry no column values: a consumer re-reads the rows it cares about, and a
+# row that is gone has been deleted.
+#
+# Consumers keep their position in change_consumers. read_changes() returns
+# the events after it without moving it, and ack_changes() moves it once the
+# batch has been handled, so delivery is at-least-once and catching up costs
+# O(changes since the last ack) rather than a rescan of the tables.
+# compact_changes() drops events superseded by a later event for the same row
+# (only the latest matters to anyone who has not read it yet) and truncates
+# everything every consumer has acknowledged. None of the functions commit.
+
+CHANGE_TABLES = ('users', 'leaves')
+
+def _triggers(table):
+    return [
+        f'''
+        CREATE TRIGGER IF NOT EXISTS trg_changes_{table}_insert AFTER INSERT ON {table}
+        BEGIN
+            INSERT INTO changes (table_name, row_id, op) VALUES ('{table}', NEW.id, 'insert');
+        END
+        ''',
+        # A changed id reads as the old row deleted and a new one inserted.
+        f'''
+        CREATE TRIGGER IF NOT EXISTS trg_changes_{table}_update AFTER UPDATE ON {table}
+        BEGIN
+            INSERT INTO changes (table_name, row_id, op) SELECT '{table}', OLD.id, 'delete' WHERE OLD.id != NEW.id;
+            INSERT INTO changes (table_name, row_id, op)
+            VALUES ('{table}', NEW.id, CASE WHEN OLD.id != NEW.id THEN 'insert' ELSE 'update' END);
+        END
+        ''',
+        f'''
+        CREATE TRIGGER IF NOT EXISTS trg_changes_{table}_delete AFTER DELETE ON {table}
+        BEGIN
+            INSERT INTO changes (table_name, row_id, op) VALUES ('{table}', OLD.id, 'delete');
+        END
+        ''',
+    ]
+
+CHANGES_SCHEMA = [
+    '''
+    CREATE TABLE IF NOT EXISTS changes (
+        seq INTEGER PRIMARY KEY AUTOINCREMENT,
+        table_name TEXT NOT NULL,
+        row_id INTEGER NOT NULL,
+        op TEXT NOT NULL,
+        changed_at TEXT NOT NULL DEFAULT (datetime('now', 'localtime'))
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS change_consumers (
+        name TEXT PRIMARY KEY,
+        last_seq INTEGER NOT NULL,
+        registered_at TEXT NOT NULL DEFAULT (datetime('now', 'localtime')),
+        acked_at TEXT
+    ) WITHOUT ROWID
+    ''',
+    *_triggers('users'),
+    *_triggers('leaves'),
+]
+
+def create_change_feed(conn):
+    for statement in CHANGES_SCHEMA:
+        conn.execute(statement)
+
+def head_seq(conn):
+    # The highest seq ever issued, even if those events have been truncated.
+    row = conn.execute("SELECT seq FROM sqlite_sequence WHERE name = 'changes'").fetchone()
+    return row[0] if row else 0
+
+def register_consumer(conn, name, from_start=False):
+    # New consumers start at the head (they are expected to load the tables
+    # once), or with from_start at the oldest event still retained. Returns
+    # the consumer's position; registering an existing name leaves it as is.
+    head = head_seq(conn)
+    start = head
+    if from_start:
+        oldest = conn.execute('SELECT MIN(seq) FROM changes').fetchone()[0]
+        start = head if oldest is None else oldest - 1
+    conn.execute('INSERT OR IGNORE INTO change_consumers (name, last_seq) VALUES (?, ?)', (name, start))
+    return consumer_position(conn, name)
+
+def unregister_consumer(conn, name):
+    return conn.execute('DELETE FROM change_consumers WHERE name = ?', (name,)).rowcount > 0
+
+def consumer_position(conn, name):
+    row = conn.execute('SELECT last_seq FROM change_consumers WHERE name = ?', (name,)).fetchone()
+    return row[0] if row else None
+
+def read_changes(conn, name, limit=CHANGES_BATCH_SIZE, tables=None):
+    # Returns (events, upto): up to limit events after the consumer's position,
+    # oldest first, and the seq to pass to ack_changes() once they are handled.
+    # upto also covers events skipped by the tables filter. Raises ValueError
+    # for an unknown consumer.
+    position = consumer_position(conn, name)
+    if position is None:
+        raise ValueError(f"Unknown change consumer: {name}")
+    head = head_seq(conn)
+    query = 'SELECT seq, table_name, row_id, op, changed_at FROM changes WHERE seq > ? AND seq <= ?'
+    params = [position, head]
+    if tables:
+        query += f" AND table_name IN ({', '.join('?' * len(tables))})"
+        params.extend(tables)
+    events = conn.execute(query + ' ORDER BY seq LIMIT ?', (*params, limit)).fetchall()
+    upto = events[-1]['seq'] if len(events) == limit else head
+    return events, upto
+
+def ack_changes(conn, name, seq):
+    # Moves the consumer to seq; never backwards.
+    cur = conn.execute('''
+        UPDATE change_consumers SET last_seq = MAX(last_seq, ?), acked_at = datetime('now', 'localtime')
+        WHERE name = ?
+    ''', (seq, name))
+    return cur.rowcount > 0
+
+def compact_changes(conn):
+    # Returns (superseded, truncated) event counts. With no consumers
+    # registered nothing is waiting for the feed, so it is emptied.
+    truncated = conn.execute('''
+        DELETE FROM changes
+        WHERE seq <= IFNULL((SELECT MIN(last_seq) FROM change_consumers), (SELECT MAX(seq) FROM changes))
+    ''').rowcount
+    superseded = conn.execute('''
+        DELETE FROM changes
+        WHERE seq NOT IN (SELECT MAX(seq) FROM changes GROUP BY table_name, row_id)
+    ''').rowcount
+    return superseded, truncated
+
+def change_feed_stats(conn):
+    head = head_seq(conn)
+    retained, oldest = conn.execute('SELECT COUNT(*), MIN(seq) FROM changes').fetchone()
+    consumers = [dict(row, lag=head - row['last_seq']) for row in conn.execute(
+        'SELECT name, last_seq, registered_at, acked_at FROM change_consumers ORDER BY name')]
+    return {'head': head, 'retained': retained, 'oldest': oldest, 'consumers': consumers}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Inspect and maintain the users/leaves change feed.")
+    commands = parser.add_subparsers(dest='command', required=True)
+    commands.add_parser('status', help="feed head, retained events and consumer lag")
+    register = commands.add_parser('register', help="add a consumer")
+    register.add_argument('name')
+    register.add_argument('--from-start', action='store_true', help="start at the oldest retained event")
+    unregister = commands.add_parser('unregister', help="remove a consumer")
+    unregister.add_argument('name')
+    read = commands.add_parser('read', help="print a consumer's pending events")
+    read.add_argument('name')
+    read.add_argument('--limit', type=int, default=CHANGES_BATCH_SIZE)
+    read.add_argument('--ack', action='store_true', help="acknowledge what was printed")
+    commands.add_parser('compact', help="drop superseded and fully consumed events")
+    args = parser.parse_args(argv)
+
+    from database import get_db_connection, init_db
+    init_db()
+    conn = get_db_connection()
+    if conn is None:
+        print("Unable to connect to the database")
+        return 1
+    try:
+        started = time.perf_counter()
+        if args.command == 'status':
+            stats = change_feed_stats(conn)
+            print(f"Head seq {stats['head']}, {stats['retained']} events retained"
+                  + (f" from seq {stats['oldest']}" if stats['oldest'] is not None else ""))
+            for consumer in stats['consumers']:
+                print(f"  {consumer['name']:<24} at {consumer['last_seq']:>10}  lag {consumer['lag']:>8}  "
+                      f"last ack {consumer['acked_at'] or 'never'}")
+        elif args.command == 'register':
+            print(f"{args.name} starts after seq {register_consumer(conn, args.name, args.from_start)}")
+            conn.commit()
+        elif args.command == 'unregister':
+            if not unregister_consumer(conn, args.name):
+                print(f"Unknown change consumer: {args.name}")
+                return 1
+            conn.commit()
+        elif args.command == 'read':
+            events, upto = read_changes(conn, args.name, args.limit)
+            for event in events:
+                print(f"{event['seq']:>10}  {event['changed_at']}  {event['op']:<6}  "
+                      f"{event['table_name']} {event['row_id']}")
+            if args.ack:
+                ack_changes(conn, args.name, upto)
+                conn.commit()
+            print(f"{len(events)} events up to seq {upto}" + (", acknowledged" if args.ack else ""))
+        else:
+            superseded, truncated = compact_changes(conn)
+            conn.commit()
+            print(f"Removed {truncated} consumed and {superseded} superseded events "
+                  f"in {time.perf_counter() - started:.2f}s")
+        return 0
+    except (sqlite3.Error, ValueError) as e:
+        conn.rollback()
+        print(f"Change feed command failed: {e}")
+        return 1
+    finally:
+        conn.close()
+
+if __name__ == "__main__":
+    sys.exit(main())
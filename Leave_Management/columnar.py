@@ -0,0 +1,276 @@
+import argparse
+import json
+import os
+import shutil
+import sqlite3
+import sys
+import time
+from config import ANALYTICS_STORE
+
+# Incremental Parquet mirror of leaves (joined with users) for columnar
+# analytics, partitioned Hive-style by start year and month:
+#
+#   analytics_store/leaves/year=2024/month=7/part-000000001234-0.parquet
+#   analytics_store/users.parquet
+#
+# Triggers record every inserted, updated or deleted leave (and every leave of
+# a renamed, moved or deleted user) in export_queue. export_leaves() writes
+# just those rows as new part files tagged with the export sequence number
+# and then clears them from the queue, so the store is append-only: readers
+# keep the newest version of each leave id and drop deletions (written as
+# tombstones under year=0/month=0). compact() rewrites the store with one
+# version per leave.
+
+EXPORT_CHUNK_SIZE = 50000
+
+EXPORT_QUEUE = [
+    '''
+    CREATE TABLE IF NOT EXISTS export_queue (
+        seq INTEGER PRIMARY KEY AUTOINCREMENT,
+        leave_id INTEGER NOT NULL UNIQUE
+    )
+    ''',
+    # REPLACE gives a re-changed leave a new, higher seq.
+    '''
+    CREATE TRIGGER IF NOT EXISTS trg_export_leaves_insert AFTER INSERT ON leaves
+    BEGIN
+        INSERT OR REPLACE INTO export_queue (leave_id) VALUES (NEW.id);
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS trg_export_leaves_update AFTER UPDATE ON leaves
+    BEGIN
+        INSERT OR REPLACE INTO export_queue (leave_id) SELECT OLD.id WHERE OLD.id != NEW.id;
+        INSERT OR REPLACE INTO export_queue (leave_id) VALUES (NEW.id);
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS trg_export_leaves_delete AFTER DELETE ON leaves
+    BEGIN
+        INSERT OR REPLACE INTO export_queue (leave_id) VALUES (OLD.id);
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS trg_export_users_update AFTER UPDATE OF username, department ON users
+    BEGIN
+        INSERT OR REPLACE INTO export_queue (leave_id) SELECT id FROM leaves WHERE user_id = NEW.id;
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS trg_export_users_delete AFTER DELETE ON users
+    BEGIN
+        INSERT OR REPLACE INTO export_queue (leave_id) SELECT id FROM leaves WHERE user_id = OLD.id;
+    END
+    ''',
+    # Everything already in the database is pending for the first export.
+    'INSERT OR IGNORE INTO export_queue (leave_id) SELECT id FROM leaves ORDER BY id',
+]
+
+def create_export_queue(conn):
+    for statement in EXPORT_QUEUE:
+        conn.execute(statement)
+
+
+EXPORT_QUERY = '''
+    SELECT export_queue.leave_id as id, leaves.user_id, users.username, users.department,
+           leaves.start_date, leaves.end_date,
+           leaves.days,
+           leaves.reason, leaves.status, leaves.leave_type,
+           leaves.id IS NULL as deleted,
+           IFNULL(leaves.start_year, 0) as year,
+           IFNULL(leaves.start_month, 0) as month
+    FROM export_queue
+    LEFT JOIN leaves ON leaves.id = export_queue.leave_id
+    LEFT JOIN users ON users.id = leaves.user_id
+    WHERE export_queue.seq <= ?
+    ORDER BY export_queue.seq
+'''
+
+def _schemas():
+    import pyarrow as pa
+    leaves = pa.schema([
+        ('id', pa.int64()), ('user_id', pa.int64()), ('username', pa.string()), ('department', pa.string()),
+        ('start_date', pa.string()), ('end_date', pa.string()), ('days', pa.int32()), ('reason', pa.string()),
+        ('status', pa.string()), ('leave_type', pa.string()), ('deleted', pa.bool_()),
+        ('year', pa.int16()), ('month', pa.int8()),
+    ])
+    users = pa.schema([
+        ('id', pa.int64()), ('username', pa.string()), ('department', pa.string()),
+        ('is_admin', pa.bool_()), ('remaining_leaves', pa.int64()), ('allowance', pa.int64()),
+    ])
+    partitioning = pa.schema([('year', pa.int16()), ('month', pa.int8())])
+    return leaves, users, partitioning
+
+def _partitioning():
+    import pyarrow.dataset as ds
+    return ds.partitioning(_schemas()[2], flavor='hive')
+
+def _batches(cur, schema, chunk_size, extra=None):
+    import pyarrow as pa
+    while True:
+        rows = cur.fetchmany(chunk_size)
+        if not rows:
+            break
+        columns = list(zip(*rows))
+        # SQLite hands back booleans as 0/1, which Arrow won't take as bool.
+        arrays = [pa.array(values, pa.int8()).cast(field.type) if pa.types.is_boolean(field.type)
+                  else pa.array(values, field.type)
+                  for field, values in zip(schema, columns)]
+        batch = pa.RecordBatch.from_arrays(arrays, schema=schema)
+        if extra is not None:
+            batch = extra(batch)
+        yield batch
+
+def read_state(store=ANALYTICS_STORE):
+    path = os.path.join(store, '_state.json')
+    if not os.path.exists(path):
+        return {'last_seq': 0, 'exports': 0, 'rows_exported': 0, 'last_export_at': None, 'single_version': True}
+    with open(path) as f:
+        return json.load(f)
+
+def _write_state(store, state):
+    path = os.path.join(store, '_state.json')
+    with open(f"{path}.tmp", 'w') as f:
+        json.dump(state, f, indent=2)
+    os.replace(f"{path}.tmp", path)
+
+def export_users(conn, store, chunk_size=EXPORT_CHUNK_SIZE):
+    # users is small next to leaves; it is rewritten in full every export.
+    import pyarrow.parquet as pq
+    schema = _schemas()[1]
+    path = os.path.join(store, 'users.parquet')
+    cur = conn.execute('SELECT id, username, department, is_admin, remaining_leaves, allowance FROM users ORDER BY id')
+    with pq.ParquetWriter(f"{path}.tmp", schema) as writer:
+        for batch in _batches(cur, schema, chunk_size):
+            writer.write_batch(batch)
+    os.replace(f"{path}.tmp", path)
+
+def export_leaves(conn, store=ANALYTICS_STORE, chunk_size=EXPORT_CHUNK_SIZE):
+    # Appends every leave changed since the last export; returns the number of
+    # rows written. conn must not be inside a transaction.
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+    leaves_schema = _schemas()[0]
+    os.makedirs(store, exist_ok=True)
+    state = read_state(store)
+
+    conn.execute('BEGIN')  # one read snapshot for the queue, leaves and users
+    try:
+        upto = conn.execute('SELECT MAX(seq) FROM export_queue').fetchone()[0]
+        written = 0
+        if upto is not None:
+            cur = conn.execute(EXPORT_QUERY, (upto,))
+
+            def tag(batch):
+                nonlocal written
+                written += batch.num_rows
+                return batch.append_column('export_seq', pa.array([upto] * batch.num_rows, pa.int64()))
+
+            schema = leaves_schema.append(pa.field('export_seq', pa.int64()))
+            ds.write_dataset(
+                pa.RecordBatchReader.from_batches(schema, _batches(cur, leaves_schema, chunk_size, tag)),
+                os.path.join(store, 'leaves'), format='parquet', partitioning=_partitioning(),
+                basename_template=f"part-{upto:012d}-{{i}}.parquet",
+                existing_data_behavior='overwrite_or_ignore')
+        export_users(conn, store, chunk_size)
+    finally:
+        conn.rollback()
+
+    if upto is not None:
+        # Only rows queued up to the snapshot are cleared; anything changed
+        # since has a higher seq and goes out with the next export.
+        conn.execute('DELETE FROM export_queue WHERE seq <= ?', (upto,))
+        conn.commit()
+        # The first export holds one row per leave; later ones may repeat ids.
+        state['single_version'] = state['exports'] == 0
+        state['last_seq'] = upto
+        state['exports'] += 1
+        state['rows_exported'] += written
+    state['last_export_at'] = time.strftime('%Y-%m-%dT%H:%M:%S')
+    _write_state(store, state)
+    return written
+
+
+def open_dataset(store=ANALYTICS_STORE):
+    import pyarrow.dataset as ds
+    path = os.path.join(store, 'leaves')
+    if not os.path.isdir(path):
+        return None
+    return ds.dataset(path, format='parquet', partitioning=_partitioning())
+
+def read_leaves(store=ANALYTICS_STORE, years=None, columns=None, include_deleted=False):
+    # Returns the current version of each leave as an Arrow table. The newest
+    # export_seq per id is found from two integer columns across the whole
+    # store, so the full rows only need reading for the requested years. A
+    # freshly exported or compacted store has one row per leave and skips this.
+    import pyarrow.compute as pc
+    import pyarrow.dataset as ds
+    dataset = open_dataset(store)
+    if dataset is None:
+        return None
+    if columns is not None:
+        columns = list(dict.fromkeys(list(columns) + ['id', 'export_seq', 'deleted']))
+    where = ds.field('year').isin(list(years)) if years else None
+    table = dataset.to_table(columns=columns, filter=where)
+    if not read_state(store).get('single_version'):
+        latest = dataset.to_table(columns=['id', 'export_seq']).group_by('id').aggregate([('export_seq', 'max')])
+        table = table.join(latest, keys=['id', 'export_seq'], right_keys=['id', 'export_seq_max'],
+                           join_type='left semi')
+    if not include_deleted:
+        table = table.filter(pc.invert(table['deleted']))
+    return table
+
+def read_users(store=ANALYTICS_STORE):
+    import pyarrow.parquet as pq
+    path = os.path.join(store, 'users.parquet')
+    return pq.read_table(path) if os.path.exists(path) else None
+
+def compact(store=ANALYTICS_STORE):
+    # Rewrites the leaves dataset with one row per live leave.
+    import pyarrow.dataset as ds
+    table = read_leaves(store)
+    if table is None:
+        return 0
+    path = os.path.join(store, 'leaves')
+    state = read_state(store)
+    ds.write_dataset(table, f"{path}.compact", format='parquet', partitioning=_partitioning(),
+                     basename_template=f"part-{state['last_seq']:012d}-{{i}}.parquet",
+                     existing_data_behavior='delete_matching')
+    os.replace(path, f"{path}.old")
+    os.replace(f"{path}.compact", path)
+    shutil.rmtree(f"{path}.old")
+    state['single_version'] = True
+    _write_state(store, state)
+    return table.num_rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Mirror leaves into a partitioned Parquet analytics store.")
+    parser.add_argument('--store', default=ANALYTICS_STORE)
+    parser.add_argument('--compact', action='store_true', help="rewrite the store with one row per leave")
+    parser.add_argument('--chunk-size', type=int, default=EXPORT_CHUNK_SIZE)
+    args = parser.parse_args(argv)
+
+    from database import get_db_connection, init_db
+    init_db()
+    conn = get_db_connection()
+    if conn is None:
+        print("Unable to connect to the database")
+        return 1
+    try:
+        started = time.perf_counter()
+        written = export_leaves(conn, args.store, args.chunk_size)
+        print(f"Exported {written} changed leaves in {time.perf_counter() - started:.2f}s", file=sys.stderr)
+    except (sqlite3.Error, OSError) as e:
+        print(f"Export failed: {e}")
+        return 1
+    finally:
+        conn.close()
+    if args.compact:
+        started = time.perf_counter()
+        kept = compact(args.store)
+        print(f"Compacted to {kept} leaves in {time.perf_counter() - started:.2f}s", file=sys.stderr)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,13 +1,91 @@
 import os
 
 DB_NAME = 'database.db'
-DB_PATH = os.path.join(os.path.dirname(__file__), DB_NAME)
+DB_PATH = os.environ.get('LEAVE_DB_PATH') or os.path.join(os.path.dirname(__file__), DB_NAME)
 
 ADMIN_USERNAME = 'admin'
 ADMIN_PASSWORD = 'admin123'
 
 TOTAL_LEAVES_PER_YEAR = 20
 
+# Yearly accrual (accrual.py): per-department entitlements override
+# TOTAL_LEAVES_PER_YEAR, and at most CARRY_OVER_CAP unused days roll over.
+DEPARTMENT_ENTITLEMENTS = {}  # e.g. {'Operations': 24}
+CARRY_OVER_CAP = 5
+
+# Working-day calendars for leave durations (workdays.py). weekmask runs
+# Monday to Sunday, 1 = working day; holidays are ISO dates. Departments not
+# listed in DEPARTMENT_CALENDARS use 'default'.
+WORK_CALENDARS = {
+    'default': {'weekmask': '1111100', 'holidays': []},
+}
+DEPARTMENT_CALENDARS = {}  # e.g. {'Operations': 'shifts'} with a 'shifts' calendar above
+
+# Rows per page for paginated leave and user listings
+PAGE_SIZE = 25
+
+# Rows fetched per fetchmany() call by the streaming read helpers
+STREAM_CHUNK_SIZE = 5000
+
+# In-process cache for the small keyed read helpers in database.py
+QUERY_CACHE_SIZE = 256
+QUERY_CACHE_TTL = 300  # seconds
+QUERY_CACHE_SYNC_INTERVAL = 0.5  # seconds between checks for other processes' writes
+
+# Connection pool used by database.get_db_connection()
+POOL_SIZE = 8
+POOL_TIMEOUT = 10  # seconds to wait for a free connection
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'cache_size': -16000,  # negative = KiB, i.e. 16 MB per connection
+    'mmap_size': 268435456,
+    'busy_timeout': 5000,
+    'temp_store': 'MEMORY',
+}
+
+# Single writer thread behind the write helpers in database.py (writer.py)
+WRITE_BATCH_SIZE = 64  # most operations folded into one commit
+WRITE_QUEUE_SIZE = 1000  # queued operations before submitters have to wait
+WRITE_TIMEOUT = 30  # seconds a caller waits to enqueue and for its commit
+WRITE_RETRIES = 3  # batch retries while another process holds the write lock
+
+# Headless JSON API (api.py)
+API_ADDRESS = '127.0.0.1'
+API_PORT = 8600
+API_WORKERS = POOL_SIZE  # threads running blocking database calls
+API_MAX_PENDING = 256  # queued database calls before requests get 503
+API_MAX_PAGE_SIZE = 500
+API_TOKEN = os.environ.get('LEAVE_API_TOKEN')  # bearer token; None disables auth
+
+# Users/leaves change feed (changes.py)
+CHANGES_BATCH_SIZE = 1000  # events returned per read_changes() call
+
+# Who-is-on-leave interval index (interval_index.py): approved leaves within
+# this many days either side of today; other dates are queried directly
+INTERVAL_INDEX_DAYS = 400
+
+# Full-text search over reasons (search.py)
+SEARCH_CANDIDATES = 10000  # newest matches per source ranked by relevance
+
+# Read-only copy of the database used by the admin analytics charts
+SNAPSHOT_PATH = None  # default: <database>.analytics.db next to DB_PATH
+SNAPSHOT_MAX_AGE = 300  # seconds before a background refresh is started
+
+# Bulk exports from the admin page are written here; only files up to
+# EXPORT_DOWNLOAD_LIMIT bytes are also offered as a browser download, since
+# Streamlit holds a download in memory
+EXPORT_DIR = os.path.join(os.path.dirname(__file__), 'exports')
+EXPORT_DOWNLOAD_LIMIT = 50 * 1024 * 1024
+
+# Partitioned Parquet mirror of leaves for columnar analytics (columnar.py)
+ANALYTICS_STORE = os.path.join(os.path.dirname(__file__), 'analytics_store')
+
+# Query/page tracing (tracing.py); also switchable from the Diagnostics page
+TRACE_ENABLED = os.environ.get('LEAVE_TRACE') == '1'
+TRACE_LOG = os.path.join(os.path.dirname(__file__), 'trace.log')
+TRACE_BUFFER = 5000  # records kept in memory for the Diagnostics page
+
 COLORSCHEME = {
     'primary': '#1E88E5',
     'secondary': '#FFC107',
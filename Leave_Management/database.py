@@ -1,13 +1,159 @@
 import sqlite3
-import pandas as pd
-from config import DB_PATH, TOTAL_LEAVES_PER_YEAR
-from datetime import datetime
+import threading
+import os
+import json
+import numpy as np
+from config import (DB_PATH, PAGE_SIZE, QUERY_CACHE_SIZE, QUERY_CACHE_TTL, QUERY_CACHE_SYNC_INTERVAL,
+                    STREAM_CHUNK_SIZE, SNAPSHOT_PATH, SNAPSHOT_MAX_AGE, CHANGES_BATCH_SIZE, WRITE_TIMEOUT,
+                    INTERVAL_INDEX_DAYS)
+from datetime import date
+from concurrent.futures import TimeoutError as FutureTimeout
+from pool import ConnectionPool
+from calendar_engine import day_number
+from interval_index import IntervalIndex
+from query_cache import QueryCache, cached
+from migrations import run_migrations
+import tracing
+from snapshot import AnalyticsSnapshot
+from workdays import get_calendar, register_sql_functions
+from accrual import prorated_entitlement
+from ledger import post_entry, post_entries, balance_as_of
+from changes import register_consumer, unregister_consumer, read_changes, ack_changes, compact_changes, change_feed_stats
+from search import search_reasons, SEARCH_SOURCES
+from writer import WriteQueue
+
+_pool = None
+_pool_lock = threading.Lock()
+_writer = None
+
+def _live_table_versions():
+    conn = get_db_connection()
+    if conn is None:
+        return {}
+    try:
+        return dict(conn.execute('SELECT name, version FROM table_versions').fetchall())
+    except sqlite3.Error:
+        # Not created until migration 5.
+        return {}
+    finally:
+        conn.close()
+
+_cache = QueryCache(QUERY_CACHE_SIZE, QUERY_CACHE_TTL, versions=_live_table_versions,
+                    sync_interval=QUERY_CACHE_SYNC_INTERVAL)
+_snapshot = None
+_snapshot_lock = threading.Lock()
+
+def get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ConnectionPool(DB_PATH, on_connect=register_sql_functions)
+        return _pool
+
+def get_writer():
+    # The one thread that writes; see writer.py.
+    global _writer
+    with _pool_lock:
+        if _writer is None:
+            _writer = WriteQueue(DB_PATH, on_connect=register_sql_functions, prepare=tracing.attach)
+        return _writer
+
+def close_pool():
+    global _pool, _writer
+    with _pool_lock:
+        writer, _writer = _writer, None
+        if _pool is not None:
+            _pool.close()
+            _pool = None
+    if writer is not None:
+        writer.close()
+
+def get_pool_stats():
+    return get_pool().get_stats()
+
+def get_writer_stats():
+    return get_writer().get_stats()
+
+def submit_write(op, *args):
+    # Queues op(conn, *args) for the writer thread and returns a Future that
+    # resolves with op's result once its batch has committed.
+    return get_writer().submit(op, *args, timeout=WRITE_TIMEOUT)
+
+def _write(op, *args):
+    # Blocking form of submit_write() for the helpers below; failures surface
+    # as sqlite3.Error like they did with per-call connections.
+    future = submit_write(op, *args)
+    try:
+        return future.result(timeout=WRITE_TIMEOUT)
+    except FutureTimeout:
+        # Only a write that never started can be reported as not done. Once
+        # the writer has picked it up it may still commit, so wait for it.
+        if future.cancel():
+            raise sqlite3.OperationalError(f"Timed out after {WRITE_TIMEOUT}s waiting for the database writer")
+        return future.result()
+
+def get_cache_stats():
+    return _cache.get_stats()
+
+def invalidate_cache(*tables):
+    # Call after committing a write to any of these tables outside the write
+    # helpers below, so cached reads of them are dropped.
+    _cache.invalidate(*tables)
+
+def get_snapshot():
+    global _snapshot
+    path = SNAPSHOT_PATH or f"{os.path.splitext(DB_PATH)[0]}.analytics.db"
+    with _snapshot_lock:
+        if _snapshot is None or _snapshot.path != path:
+            _snapshot = AnalyticsSnapshot(path, SNAPSHOT_MAX_AGE)
+        return _snapshot
+
+def refresh_snapshot():
+    conn = get_db_connection()
+    if conn is None:
+        return False
+    try:
+        get_snapshot().refresh(conn)
+        _cache.invalidate('snapshot')
+        return True
+    except (sqlite3.Error, OSError) as e:
+        print(f"Error refreshing analytics snapshot: {e}")
+        return False
+    finally:
+        conn.close()
+
+def get_snapshot_connection():
+    # Read-only connection to the analytics snapshot. A missing snapshot is
+    # taken synchronously; an expired one keeps serving while a background
+    # refresh replaces it.
+    snapshot = get_snapshot()
+    if snapshot.taken_at is None:
+        if not refresh_snapshot():
+            return None
+    elif snapshot.is_expired():
+        snapshot.refresh_in_background(get_db_connection, lambda: _cache.invalidate('snapshot'))
+    try:
+        return snapshot.connect()
+    except sqlite3.Error as e:
+        print(f"Error opening analytics snapshot: {e}")
+        return None
+
+def get_snapshot_info():
+    conn = get_db_connection()
+    live_versions = None
+    if conn is not None:
+        try:
+            live_versions = dict(conn.execute('SELECT name, version FROM table_versions').fetchall())
+        except sqlite3.Error as e:
+            print(f"Error reading table versions: {e}")
+        finally:
+            conn.close()
+    return get_snapshot().get_info(live_versions)
 
 def get_db_connection():
+    # Connections are pooled; calling conn.close() returns it to the pool.
     try:
-        conn = sqlite3.connect(DB_PATH)
-        conn.row_factory = sqlite3.Row
-        return conn
+        return tracing.attach(get_pool().acquire())
     except sqlite3.Error as e:
         print(f"Database connection error: {e}")
         return None
@@ -27,7 +173,9 @@ def init_db():
             password TEXT NOT NULL,
             is_admin BOOLEAN NOT NULL DEFAULT 0,
             department TEXT,
-            remaining_leaves INTEGER NOT NULL DEFAULT 20
+            remaining_leaves INTEGER NOT NULL DEFAULT 20,
+            allowance INTEGER NOT NULL DEFAULT 20,
+            joined_on TEXT
         )
         ''')
 
@@ -45,44 +193,103 @@ def init_db():
         ''')
 
         conn.commit()
+        applied = run_migrations(conn)
     except sqlite3.Error as e:
         print(f"Database initialization error: {e}")
+        return
     finally:
         conn.close()
+    if applied and get_snapshot().taken_at is not None:
+        # An existing analytics snapshot has the old schema.
+        refresh_snapshot()
+
+def _add_user(conn, username, password, department, is_admin):
+    # Users joining mid-year get their department's entitlement pro-rated.
+    joined_on = date.today()
+    allowance = prorated_entitlement(department, joined_on, joined_on.year)
+    conn.execute('''
+        INSERT INTO users (username, password, department, is_admin, remaining_leaves, allowance, joined_on)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    ''', (username, password, department, is_admin, allowance, allowance, joined_on.isoformat()))
 
 def add_user(username, password, department, is_admin=False):
-    conn = get_db_connection()
-    if conn is None:
-        return False
-    
     try:
-        cur = conn.cursor()
-        cur.execute('INSERT INTO users (username, password, department, is_admin, remaining_leaves) VALUES (?, ?, ?, ?, ?)',
-                    (username, password, department, is_admin, TOTAL_LEAVES_PER_YEAR))
-        conn.commit()
-        return True
+        _write(_add_user, username, password, department, is_admin)
     except sqlite3.Error as e:
         print(f"Error adding user: {e}")
         return False
-    finally:
-        conn.close()
+    _cache.invalidate('users')
+    return True
+
+def _update_remaining_leaves(conn, user_id, days_taken):
+    cur = conn.execute('UPDATE users SET remaining_leaves = remaining_leaves - ? WHERE id = ?',
+                       (days_taken, user_id))
+    if cur.rowcount:
+        post_entry(conn, user_id, -days_taken, 'adjustment')
 
 def update_remaining_leaves(user_id, days_taken):
-    conn = get_db_connection()
-    if conn is None:
-        return False
-    
     try:
-        cur = conn.cursor()
-        cur.execute('UPDATE users SET remaining_leaves = remaining_leaves - ? WHERE id = ?', (days_taken, user_id))
-        conn.commit()
-        return True
+        _write(_update_remaining_leaves, user_id, days_taken)
     except sqlite3.Error as e:
         print(f"Error updating remaining leaves: {e}")
         return False
-    finally:
-        conn.close()
+    _cache.invalidate('users')
+    return True
+
+def _submit_leave(conn, user_id, start_date, end_date, reason, leave_type, days_requested):
+    cur = conn.cursor()
+    cur.execute('SELECT remaining_leaves, department FROM users WHERE id = ?', (user_id,))
+    user = cur.fetchone()
+    if user is None:
+        return False, "User not found."
+    days = days_requested
+    if days is None:
+        days = get_calendar(user['department']).count_one(start_date, end_date)
+        if days == 0:
+            return False, "The selected dates contain no working days."
+    if days > user['remaining_leaves']:
+        return False, (f"You don't have enough leaves. Available: {user['remaining_leaves']}, "
+                       f"Requested: {days}")
+    cur.execute('''
+        SELECT start_date, end_date FROM leaves
+        WHERE user_id = ? AND status IN ('pending', 'approved')
+          AND start_day <= ? AND end_day >= ?
+        LIMIT 1
+    ''', (user_id, day_number(end_date), day_number(start_date)))
+    clash = cur.fetchone()
+    if clash is not None:
+        return False, (f"This request overlaps your existing leave from "
+                       f"{clash['start_date']} to {clash['end_date']}.")
+    cur.execute('''
+        INSERT INTO leaves (user_id, start_date, end_date, start_day, end_day, reason, status,
+                            leave_type, days)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ''', (user_id, start_date.isoformat(), end_date.isoformat(), day_number(start_date),
+          day_number(end_date), reason, 'pending', leave_type, days))
+    post_entry(conn, user_id, -days, 'leave', leave_id=cur.lastrowid)
+    cur.execute('UPDATE users SET remaining_leaves = remaining_leaves - ? WHERE id = ?', (days, user_id))
+    return True, "Leave application submitted successfully!"
+
+def submit_leave(user_id, start_date, end_date, reason, leave_type, days_requested=None):
+    # Applies for leave atomically: the balance check, the overlap check
+    # against the user's pending/approved leaves, the insert and the balance
+    # debit run as one operation on the writer thread, which serialises all
+    # writes, so concurrent submissions cannot double-book or overdraw. The
+    # leave is charged in working days for the user's department calendar
+    # unless days_requested is given. Returns (success, message).
+    if end_date < start_date:
+        return False, "End date must be after start date"
 
+    try:
+        ok, message = _write(_submit_leave, user_id, start_date, end_date, reason, leave_type, days_requested)
+    except sqlite3.Error as e:
+        print(f"Error submitting leave: {e}")
+        return False, f"Error submitting leave application: {e}"
+    if ok:
+        _cache.invalidate('users', 'leaves')
+    return ok, message
+
+@cached(_cache, 'users')
 def get_remaining_leaves(user_id):
     conn = get_db_connection()
     if conn is None:
@@ -99,6 +306,86 @@ def get_remaining_leaves(user_id):
     finally:
         conn.close()
 
+# Change feed (changes.py). Reads use a pooled connection; moving cursors and
+# compaction are writes, so they go through the writer like everything else.
+
+def register_change_consumer(name, from_start=False):
+    try:
+        return _write(register_consumer, name, from_start)
+    except sqlite3.Error as e:
+        print(f"Error registering change consumer: {e}")
+        return None
+
+def unregister_change_consumer(name):
+    try:
+        return _write(unregister_consumer, name)
+    except sqlite3.Error as e:
+        print(f"Error removing change consumer: {e}")
+        return False
+
+def get_changes(name, limit=CHANGES_BATCH_SIZE, tables=None):
+    # (events, upto) for the consumer; pass upto to acknowledge_changes()
+    # after handling the events. Raises ValueError for an unknown consumer.
+    conn = get_db_connection()
+    if conn is None:
+        return None
+    try:
+        return read_changes(conn, name, limit, tables)
+    except sqlite3.Error as e:
+        print(f"Error reading changes: {e}")
+        return None
+    finally:
+        conn.close()
+
+def acknowledge_changes(name, seq):
+    try:
+        return _write(ack_changes, name, seq)
+    except sqlite3.Error as e:
+        print(f"Error acknowledging changes: {e}")
+        return False
+
+def compact_change_feed():
+    # (superseded, truncated) counts, or None on error.
+    try:
+        return _write(compact_changes)
+    except sqlite3.Error as e:
+        print(f"Error compacting the change feed: {e}")
+        return None
+
+def get_change_feed_stats():
+    conn = get_db_connection()
+    if conn is None:
+        return None
+    try:
+        return change_feed_stats(conn)
+    except sqlite3.Error as e:
+        print(f"Error reading change feed stats: {e}")
+        return None
+    finally:
+        conn.close()
+
+@cached(_cache, 'users')
+def get_user(user_id):
+    # Everything about a user except the password, or None if not found.
+    conn = get_db_connection()
+    if conn is None:
+        return None
+
+    try:
+        cur = conn.cursor()
+        cur.execute('''
+            SELECT id, username, department, is_admin, remaining_leaves, allowance, joined_on
+            FROM users WHERE id = ?
+        ''', (user_id,))
+        user = cur.fetchone()
+        return dict(user) if user else None
+    except sqlite3.Error as e:
+        print(f"Error getting user: {e}")
+        return None
+    finally:
+        conn.close()
+
+@cached(_cache, 'leaves')
 def get_user_leaves(user_id):
     conn = get_db_connection()
     if conn is None:
@@ -135,18 +422,128 @@ def get_all_leaves():
         conn.close()
 
 def update_leave_status(leave_id, status):
+    summary = decide_leaves([leave_id], status)
+    return summary is not None and summary['updated'] == 1
+
+# Approval decisions. Only pending leaves are decided; the leave was debited
+# leaves.days when it was submitted, so rejecting it credits those days back
+# to the user in the same transaction as the status change.
+
+DECISION_STATUSES = ('approved', 'rejected')
+
+def _apply_decisions(conn, status):
+    # Decides the pending leaves staged in temp.decision_ids. Runs inside the
+    # caller's transaction and returns the summary.
+    cur = conn.cursor()
+    cur.execute('''
+        SELECT leaves.user_id, COUNT(*) as leaves,
+               SUM(IFNULL(leaves.days, 0)) as days
+        FROM leaves
+        JOIN temp.decision_ids ON temp.decision_ids.id = leaves.id
+        WHERE leaves.status = 'pending'
+        GROUP BY leaves.user_id
+    ''')
+    per_user = cur.fetchall()
+    if status == 'rejected' and per_user:
+        cur.executemany('UPDATE users SET remaining_leaves = remaining_leaves + ? WHERE id = ?',
+                        [(int(row['days']), row['user_id']) for row in per_user])
+        post_entries(conn, '''
+            SELECT leaves.user_id, IFNULL(leaves.days, 0) as delta, 'refund' as kind,
+                   leaves.id as leave_id, NULL as reason
+            FROM leaves
+            JOIN temp.decision_ids ON temp.decision_ids.id = leaves.id
+            WHERE leaves.status = 'pending' AND IFNULL(leaves.days, 0) != 0
+        ''')
+    cur.execute('''
+        UPDATE leaves SET status = ?
+        WHERE status = 'pending' AND id IN (SELECT id FROM temp.decision_ids)
+    ''', (status,))
+    updated = cur.rowcount
+    requested = cur.execute('SELECT COUNT(*) FROM temp.decision_ids').fetchone()[0]
+    return {
+        'status': status,
+        'requested': requested,
+        'updated': updated,
+        'skipped': requested - updated,
+        'users': len(per_user),
+        'days_credited': int(sum(row['days'] for row in per_user)) if status == 'rejected' else 0,
+    }
+
+def _stage_and_decide(conn, stage, status):
+    cur = conn.cursor()
+    cur.execute('CREATE TEMP TABLE IF NOT EXISTS decision_ids (id INTEGER PRIMARY KEY)')
+    cur.execute('DELETE FROM temp.decision_ids')
+    stage(cur)
+    summary = _apply_decisions(conn, status)
+    cur.execute('DELETE FROM temp.decision_ids')
+    return summary
+
+def _decide(stage, status):
+    if status not in DECISION_STATUSES:
+        raise ValueError(f"status must be one of {DECISION_STATUSES}")
+    try:
+        summary = _write(_stage_and_decide, stage, status)
+    except sqlite3.Error as e:
+        print(f"Error updating leave status: {e}")
+        return None
+
+    if summary['updated']:
+        _cache.invalidate('users', 'leaves')
+    return summary
+
+def decide_leaves(leave_ids, status):
+    # Approves or rejects the given leave ids in one transaction. Ids that are
+    # unknown or no longer pending are skipped. Returns a summary dict, or
+    # None on a database error.
+    return _decide(lambda cur: cur.executemany('INSERT OR IGNORE INTO temp.decision_ids (id) VALUES (?)',
+                                               [(int(leave_id),) for leave_id in leave_ids]),
+                   status)
+
+def _leave_filters(department=None, leave_type=None, date_from=None, date_to=None):
+    # Shared WHERE fragments for listings and filter-based decisions; the date
+    # range keeps leaves that overlap [date_from, date_to].
+    conditions, params = [], []
+    if department is not None:
+        conditions.append('users.department = ?')
+        params.append(department)
+    if leave_type is not None:
+        conditions.append('leaves.leave_type = ?')
+        params.append(leave_type)
+    if date_to is not None:
+        conditions.append('leaves.start_day <= ?')
+        params.append(day_number(date_to))
+    if date_from is not None:
+        conditions.append('leaves.end_day >= ?')
+        params.append(day_number(date_from))
+    return conditions, params
+
+def decide_matching_leaves(status, department=None, leave_type=None, date_from=None, date_to=None):
+    # Approves or rejects every pending leave matching the filters.
+    conditions, params = _leave_filters(department, leave_type, date_from, date_to)
+    where = ''.join(f' AND {condition}' for condition in conditions)
+    return _decide(lambda cur: cur.execute(f'''
+        INSERT INTO temp.decision_ids (id)
+        SELECT leaves.id FROM leaves JOIN users ON leaves.user_id = users.id
+        WHERE leaves.status = 'pending'{where}
+    ''', params), status)
+
+def count_matching_leaves(status='pending', department=None, leave_type=None, date_from=None, date_to=None):
     conn = get_db_connection()
     if conn is None:
-        return False
-    
+        return None
+
+    conditions, params = _leave_filters(department, leave_type, date_from, date_to)
+    where = ''.join(f' AND {condition}' for condition in conditions)
     try:
         cur = conn.cursor()
-        cur.execute('UPDATE leaves SET status = ? WHERE id = ?', (status, leave_id))
-        conn.commit()
-        return True
+        cur.execute(f'''
+            SELECT COUNT(*) FROM leaves JOIN users ON leaves.user_id = users.id
+            WHERE leaves.status = ?{where}
+        ''', (status, *params))
+        return cur.fetchone()[0]
     except sqlite3.Error as e:
-        print(f"Error updating leave status: {e}")
-        return False
+        print(f"Error counting leaves: {e}")
+        return None
     finally:
         conn.close()
 
@@ -174,6 +571,7 @@ def get_department_leaves(department):
 # New functions
 
 def get_all_users():
+    import pandas as pd
     conn = get_db_connection()
     if conn is None:
         return None
@@ -187,33 +585,556 @@ def get_all_users():
     finally:
         conn.close()
 
-# In database.py
+# Streaming reads for exports and reports over whole tables. Rows come off the
+# cursor fetchmany(chunk_size) at a time, so memory stays bounded by the chunk
+# size however many rows match, and stopping early (break, or close() on the
+# generator) skips the rest of the query. The pooled connection, and with it a
+# read snapshot, is held until the generator is exhausted or closed, so keep
+# the consumer moving rather than parking a half-read generator.
 
-def update_user_data(user_id, username, department, is_admin, new_remaining_leaves, adjust_leaves, adjustment_reason):
+STREAM_LEAVES = '''
+    SELECT leaves.id, leaves.user_id, users.username, users.department, leaves.start_date, leaves.end_date,
+           leaves.days, leaves.reason, leaves.status, leaves.leave_type
+    FROM leaves
+    LEFT JOIN users ON leaves.user_id = users.id{where}
+    ORDER BY leaves.id
+'''
+
+STREAM_USERS = '''
+    SELECT id, username, department, is_admin, remaining_leaves, allowance
+    FROM users{where}
+    ORDER BY id
+'''
+
+# Arrow types for the columns above; the rest are strings.
+STREAM_INTEGER_COLUMNS = {'id', 'user_id', 'days', 'is_admin', 'remaining_leaves', 'allowance'}
+
+def stream_query(query, params=(), chunk_size=STREAM_CHUNK_SIZE):
+    # Yields lists of at most chunk_size sqlite3.Row. Raises
+    # sqlite3.OperationalError if no connection is available.
     conn = get_db_connection()
     if conn is None:
+        raise sqlite3.OperationalError("Unable to connect to the database")
+    cur = None
+    try:
+        cur = conn.execute(query, params)
+        while True:
+            rows = cur.fetchmany(chunk_size)
+            if not rows:
+                return
+            yield rows
+    finally:
+        if cur is not None:
+            cur.close()
+        conn.close()
+
+def _frames(chunks):
+    import pandas as pd
+    for rows in chunks:
+        yield pd.DataFrame.from_records(rows, columns=rows[0].keys())
+
+def _record_batches(chunks):
+    import pyarrow as pa
+    for rows in chunks:
+        schema = pa.schema([(name, pa.int64() if name in STREAM_INTEGER_COLUMNS else pa.string())
+                            for name in rows[0].keys()])
+        yield pa.RecordBatch.from_arrays([pa.array(values, field.type)
+                                          for field, values in zip(schema, zip(*rows))], schema=schema)
+
+def _chunks(chunks, format):
+    # 'rows' lists, 'pandas' DataFrames or 'arrow' RecordBatches. Arrow
+    # batches all share one schema, even for chunks that are entirely NULL in
+    # some column, so they can go straight into one Parquet file.
+    if format == 'rows':
+        return chunks
+    if format == 'pandas':
+        return _frames(chunks)
+    if format == 'arrow':
+        return _record_batches(chunks)
+    raise ValueError("format must be 'rows', 'pandas' or 'arrow'")
+
+def _stream_leaves(user_id, status, department, leave_type, date_from, date_to, chunk_size):
+    conditions, params = _leave_filters(department, leave_type, date_from, date_to)
+    if user_id is not None:
+        conditions.insert(0, 'leaves.user_id = ?')
+        params.insert(0, user_id)
+    if status is not None:
+        conditions.insert(0, 'leaves.status = ?')
+        params.insert(0, status)
+    where = ' WHERE ' + ' AND '.join(conditions) if conditions else ''
+    return stream_query(STREAM_LEAVES.format(where=where), params, chunk_size)
+
+def iter_leaves(user_id=None, status=None, department=None, leave_type=None, date_from=None, date_to=None,
+                chunk_size=STREAM_CHUNK_SIZE):
+    # One sqlite3.Row per matching leave, in id order.
+    for rows in _stream_leaves(user_id, status, department, leave_type, date_from, date_to, chunk_size):
+        yield from rows
+
+def iter_leave_chunks(user_id=None, status=None, department=None, leave_type=None, date_from=None,
+                      date_to=None, chunk_size=STREAM_CHUNK_SIZE, format='pandas'):
+    return _chunks(_stream_leaves(user_id, status, department, leave_type, date_from, date_to, chunk_size),
+                   format)
+
+def _stream_users(department, chunk_size):
+    where, params = ('', ()) if department is None else (' WHERE department = ?', (department,))
+    return stream_query(STREAM_USERS.format(where=where), params, chunk_size)
+
+def iter_users(department=None, chunk_size=STREAM_CHUNK_SIZE):
+    # One sqlite3.Row per user (without the password), in id order.
+    for rows in _stream_users(department, chunk_size):
+        yield from rows
+
+def iter_user_chunks(department=None, chunk_size=STREAM_CHUNK_SIZE, format='pandas'):
+    return _chunks(_stream_users(department, chunk_size), format)
+
+def _update_user_data(conn, user_id, username, department, is_admin, new_remaining_leaves, adjust_leaves,
+                      adjustment_reason):
+    cur = conn.cursor()
+    cur.execute('SELECT remaining_leaves FROM users WHERE id = ?', (user_id,))
+    user = cur.fetchone()
+    if user is None:
         return False
-    
+    # An admin changing the balance changes what the user was granted, not
+    # what they used, so allowance moves with it and allowance -
+    # remaining_leaves stays the days used (the right-hand sides see the old
+    # remaining_leaves).
+    cur.execute('''
+        UPDATE users 
+        SET username = ?, department = ?, is_admin = ?, remaining_leaves = ?,
+            allowance = allowance + ? - remaining_leaves
+        WHERE id = ?
+    ''', (username, department, is_admin, new_remaining_leaves, new_remaining_leaves, user_id))
+
+    correction = new_remaining_leaves - adjust_leaves - user['remaining_leaves']
+    if correction != 0:
+        post_entry(conn, user_id, correction, 'correction', reason="Remaining leaves set by an admin")
+    if adjust_leaves != 0:
+        post_entry(conn, user_id, adjust_leaves, 'adjustment', reason=adjustment_reason or None)
+    return True
+
+def update_user_data(user_id, username, department, is_admin, new_remaining_leaves, adjust_leaves, adjustment_reason):
+    # new_remaining_leaves already includes adjust_leaves. The adjustment is
+    # posted to the balance ledger with its reason; any other change to the
+    # balance is posted as a correction.
     try:
-        cur = conn.cursor()
-        cur.execute('''
-            UPDATE users 
-            SET username = ?, department = ?, is_admin = ?, remaining_leaves = ? 
-            WHERE id = ?
-        ''', (username, department, is_admin, new_remaining_leaves, user_id))
-        
-        if adjust_leaves != 0:
-            today = datetime.now().date().isoformat()
-            cur.execute('''
-                INSERT INTO leaves (user_id, start_date, end_date, reason, status, leave_type)
-                VALUES (?, ?, ?, ?, ?, ?)
-            ''', (user_id, today, today, adjustment_reason, 'approved', 'Administrative Adjustment'))
-        
-        conn.commit()
-        return True
+        updated = _write(_update_user_data, user_id, username, department, is_admin, new_remaining_leaves,
+                         adjust_leaves, adjustment_reason)
     except sqlite3.Error as e:
         print(f"Error updating user data: {e}")
-        conn.rollback()
         return False
+    if updated:
+        _cache.invalidate('users')
+    return updated
+
+def get_balance_as_of(user_id, day):
+    conn = get_db_connection()
+    if conn is None:
+        return None
+    try:
+        return balance_as_of(conn, user_id, day)
+    except sqlite3.Error as e:
+        print(f"Error reading balance: {e}")
+        return None
+    finally:
+        conn.close()
+
+def get_balance_history(user_id, limit=50):
+    import pandas as pd
+    conn = get_db_connection()
+    if conn is None:
+        return None
+    try:
+        return pd.read_sql_query('''
+            SELECT entry_date, delta, kind, leave_id, reason, created_at
+            FROM balance_ledger WHERE user_id = ?
+            ORDER BY id DESC LIMIT ?
+        ''', conn, params=(user_id, limit))
+    except sqlite3.Error as e:
+        print(f"Error reading balance history: {e}")
+        return None
     finally:
-        conn.close()
\ No newline at end of file
+        conn.close()
+
+# Queries behind the user pages
+
+@cached(_cache, 'leaves')
+def get_leave_breakdown(user_id, year):
+    # Per leave type count and working days for one user's leaves in a year.
+    import pandas as pd
+    conn = get_db_connection()
+    if conn is None:
+        return None
+
+    try:
+        return pd.read_sql_query('''
+            SELECT leave_type, COUNT(*) as count, SUM(days) as total_days
+            FROM leaves
+            WHERE user_id = ? AND start_year = ?
+            GROUP BY leave_type
+        ''', conn, params=(user_id, year))
+    except (sqlite3.Error, pd.errors.DatabaseError) as e:
+        print(f"Error getting leave breakdown: {e}")
+        return None
+    finally:
+        conn.close()
+
+@cached(_cache, 'leaves', 'users')
+def get_team_leaves(department, start_date, end_date):
+    import pandas as pd
+    # Day ranges of a department's approved leaves overlapping [start_date,
+    # end_date], for the team calendar. The unary + keeps the planner off
+    # idx_leaves_status_start (every approved leave in the company) so each
+    # team member is a range scan of idx_leaves_user_start_day instead.
+    conn = get_db_connection()
+    if conn is None:
+        return None
+
+    try:
+        return pd.read_sql_query('''
+            SELECT leaves.start_day, leaves.end_day
+            FROM leaves
+            JOIN users ON leaves.user_id = users.id
+            WHERE users.department = ? AND +leaves.status = 'approved'
+              AND leaves.start_day <= ? AND leaves.end_day >= ?
+        ''', conn, params=(department, day_number(end_date), day_number(start_date)))
+    except (sqlite3.Error, pd.errors.DatabaseError) as e:
+        print(f"Error getting team leaves: {e}")
+        return None
+    finally:
+        conn.close()
+
+
+# Leave Overview aggregates (maintained by triggers, see aggregates.py)
+
+def _read_aggregate(query, params=(), label="leave aggregates"):
+    import pandas as pd
+    # Aggregates are read from the analytics snapshot, not the live file.
+    conn = get_snapshot_connection()
+    if conn is None:
+        return None
+
+    try:
+        return pd.read_sql_query(query, conn, params=params)
+    except (sqlite3.Error, pd.errors.DatabaseError) as e:
+        print(f"Error reading {label}: {e}")
+        return None
+    finally:
+        conn.close()
+
+@cached(_cache, 'snapshot')
+def get_leave_overview():
+    return _read_aggregate('''
+        SELECT NULLIF(department, '') as department, status, count
+        FROM agg_department_status
+        WHERE count > 0
+        ORDER BY department, status
+    ''', label="leave overview")
+
+@cached(_cache, 'snapshot')
+def get_leave_utilization():
+    return _read_aggregate('''
+        SELECT NULLIF(department, '') as department,
+               CAST(remaining_sum AS REAL) / user_count as avg_remaining_leaves,
+               CAST(allowance_sum - remaining_sum AS REAL) / user_count as avg_used_leaves
+        FROM agg_department_balance
+        WHERE user_count > 0
+        ORDER BY department
+    ''', label="leave utilization")
+
+@cached(_cache, 'snapshot')
+def get_top_leave_types(limit=5):
+    return _read_aggregate('''
+        SELECT NULLIF(leave_type, '') as leave_type, count
+        FROM agg_leave_type
+        WHERE count > 0
+        ORDER BY count DESC
+        LIMIT ?
+    ''', (limit,), label="top leave types")
+
+@cached(_cache, 'snapshot')
+def get_monthly_leave_counts():
+    return _read_aggregate('''
+        SELECT month, count
+        FROM agg_monthly
+        WHERE count > 0 AND month != ''
+        ORDER BY month
+    ''', label="monthly leave counts")
+
+
+# Interval index over approved leaves for "who is on leave" queries
+
+_interval_index = None
+_interval_lock = threading.Lock()
+
+def get_table_version(table, conn=None):
+    own_conn = conn is None
+    if own_conn:
+        conn = get_db_connection()
+        if conn is None:
+            return None
+
+    try:
+        row = conn.execute('SELECT version FROM table_versions WHERE name = ?', (table,)).fetchone()
+        return row['version'] if row else None
+    except sqlite3.Error as e:
+        print(f"Error reading table version: {e}")
+        return None
+    finally:
+        if own_conn:
+            conn.close()
+
+def get_user_version(user_id, conn=None):
+    # What one session's user context is built from: a per-user counter bumped
+    # by triggers on the user's row and their leaves, so writes from any
+    # process (the API, bulk imports, accrual.py, ledger.py --repair) reload
+    # that user's context and nobody else's.
+    own_conn = conn is None
+    if own_conn:
+        conn = get_db_connection()
+        if conn is None:
+            return None
+
+    try:
+        row = conn.execute('SELECT version FROM user_versions WHERE user_id = ?', (user_id,)).fetchone()
+        return row['version'] if row else 0
+    except sqlite3.Error as e:
+        print(f"Error reading user version: {e}")
+        return None
+    finally:
+        if own_conn:
+            conn.close()
+
+def get_leave_interval_index():
+    global _interval_index
+    import pandas as pd
+    # Returns (index, leaves_df, first_day, last_day) over the approved leaves
+    # that overlap INTERVAL_INDEX_DAYS either side of today. Rebuilt only when
+    # leaves change or the day rolls over; names and departments are looked
+    # up per query, so user edits never force a rebuild.
+    conn = get_db_connection()
+    if conn is None:
+        return None
+
+    try:
+        today = day_number(date.today())
+        version = (get_table_version('leaves', conn), today)
+        with _interval_lock:
+            if _interval_index is not None and _interval_index[0] == version:
+                return _interval_index[1]
+
+        # One pass over leaves is about three times faster than walking
+        # idx_leaves_status_start and looking up every approved leave.
+        first_day, last_day = today - INTERVAL_INDEX_DAYS, today + INTERVAL_INDEX_DAYS
+        df = pd.read_sql_query('''
+            SELECT id, user_id, start_date, end_date, start_day, end_day, leave_type
+            FROM leaves
+            WHERE +status = 'approved' AND start_day <= ? AND end_day >= ?
+        ''', conn, params=(last_day, first_day))
+    except (sqlite3.Error, pd.errors.DatabaseError) as e:
+        print(f"Error building leave interval index: {e}")
+        return None
+    finally:
+        conn.close()
+
+    index = IntervalIndex(df['start_day'].to_numpy(np.int64), df['end_day'].to_numpy(np.int64))
+    built = (index, df, first_day, last_day)
+    with _interval_lock:
+        _interval_index = (version, built)
+    return built
+
+LEAVES_BETWEEN_COLUMNS = ['id', 'user_id', 'username', 'department', 'start_date', 'end_date',
+                          'start_day', 'end_day', 'leave_type']
+
+def get_leaves_between(start_date, end_date, department=None):
+    import pandas as pd
+    # Approved leaves overlapping [start_date, end_date], inclusive, by id.
+    lo, hi = day_number(start_date), day_number(end_date)
+    built = get_leave_interval_index()
+    if built is None:
+        return None
+    index, df, first_day, last_day = built
+
+    conn = get_db_connection()
+    if conn is None:
+        return None
+
+    try:
+        if first_day <= lo and hi <= last_day:
+            leaves = df.iloc[index.overlapping(lo, hi)]
+            query = 'SELECT id as user_id, username, department FROM users WHERE id IN (SELECT value FROM json_each(?))'
+            params = [json.dumps(leaves['user_id'].unique().tolist())]
+            if department is not None:
+                query += ' AND department = ?'
+                params.append(department)
+            users = pd.read_sql_query(query, conn, params=params)
+            found = leaves.merge(users, on='user_id')
+        else:
+            # Outside the indexed window; + keeps the planner off the status
+            # index, as in get_team_leaves.
+            query = '''
+                SELECT leaves.id, leaves.user_id, users.username, users.department, leaves.start_date,
+                       leaves.end_date, leaves.start_day, leaves.end_day, leaves.leave_type
+                FROM leaves
+                JOIN users ON leaves.user_id = users.id
+                WHERE +leaves.status = 'approved' AND leaves.start_day <= ? AND leaves.end_day >= ?
+            '''
+            params = [hi, lo]
+            if department is not None:
+                query += ' AND users.department = ?'
+                params.append(department)
+            found = pd.read_sql_query(query, conn, params=params)
+    except (sqlite3.Error, pd.errors.DatabaseError) as e:
+        print(f"Error getting leaves between dates: {e}")
+        return None
+    finally:
+        conn.close()
+    return found.sort_values('id')[LEAVES_BETWEEN_COLUMNS].reset_index(drop=True)
+
+def get_leaves_on(day, department=None):
+    return get_leaves_between(day, day, department)
+
+
+# Keyset pagination. Leaves are ordered newest first by (start_date, id); a
+# cursor is the (start_date, id) of the last row on the previous page, so each
+# page is an index range scan whatever its depth.
+
+def get_leaves_page(user_id=None, status=None, department=None, after=None, page_size=PAGE_SIZE,
+                    leave_type=None, date_from=None, date_to=None):
+    # Returns (rows, next_cursor); next_cursor is None on the last page.
+    conn = get_db_connection()
+    if conn is None:
+        return None, None
+
+    conditions, params = _leave_filters(department, leave_type, date_from, date_to)
+    if user_id is not None:
+        conditions.append('leaves.user_id = ?')
+        params.append(user_id)
+    if status is not None:
+        conditions.append('leaves.status = ?')
+        params.append(status)
+    if after is not None:
+        conditions.append('(leaves.start_date, leaves.id) < (?, ?)')
+        params.extend(after)
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+
+    try:
+        cur = conn.cursor()
+        cur.execute(f'''
+            SELECT leaves.*, users.username, users.department
+            FROM leaves
+            JOIN users ON leaves.user_id = users.id
+            {where}
+            ORDER BY leaves.start_date DESC, leaves.id DESC
+            LIMIT ?
+        ''', (*params, page_size + 1))
+        rows = cur.fetchall()
+    except sqlite3.Error as e:
+        print(f"Error getting leaves page: {e}")
+        return None, None
+    finally:
+        conn.close()
+
+    if len(rows) <= page_size:
+        return rows, None
+    rows = rows[:page_size]
+    return rows, (rows[-1]['start_date'], rows[-1]['id'])
+
+def search_leave_reasons(text, department=None, status=None, date_from=None, date_to=None,
+                         sources=SEARCH_SOURCES, after=None, page_size=PAGE_SIZE):
+    # Ranked full-text search over leave reasons and adjustment notes; returns
+    # (rows, next_cursor, truncated, restarted). See search.py.
+    conn = get_db_connection()
+    if conn is None:
+        return None, None, False, False
+    try:
+        return search_reasons(conn, text, department, status, date_from, date_to, sources, after, page_size)
+    except sqlite3.Error as e:
+        print(f"Error searching leave reasons: {e}")
+        return None, None, False, False
+    finally:
+        conn.close()
+
+def get_users_page(after=None, page_size=PAGE_SIZE):
+    import pandas as pd
+    # Users ordered by id; returns (DataFrame, next_cursor).
+    conn = get_db_connection()
+    if conn is None:
+        return None, None
+
+    try:
+        df = pd.read_sql_query('''
+            SELECT id, username, department, is_admin, remaining_leaves
+            FROM users
+            WHERE id > ?
+            ORDER BY id
+            LIMIT ?
+        ''', conn, params=(after or 0, page_size + 1))
+    except (sqlite3.Error, pd.errors.DatabaseError) as e:
+        print(f"Error fetching users page: {e}")
+        return None, None
+    finally:
+        conn.close()
+
+    if len(df) <= page_size:
+        return df, None
+    df = df.iloc[:page_size]
+    return df, int(df['id'].iloc[-1])
+
+@cached(_cache, 'leaves')
+def get_user_leave_type_counts(user_id):
+    import pandas as pd
+    conn = get_db_connection()
+    if conn is None:
+        return None
+
+    try:
+        return pd.read_sql_query('''
+            SELECT leave_type, COUNT(*) as count
+            FROM leaves
+            WHERE user_id = ?
+            GROUP BY leave_type
+        ''', conn, params=(user_id,))
+    except (sqlite3.Error, pd.errors.DatabaseError) as e:
+        print(f"Error getting leave type counts: {e}")
+        return None
+    finally:
+        conn.close()
+
+
+# Session-scoped user context (see auth.current_user_context)
+
+def get_user_context(username):
+    # Everything the user pages need about the logged-in user, in one query.
+    conn = get_db_connection()
+    if conn is None:
+        return None
+
+    try:
+        cur = conn.cursor()
+        cur.execute('SELECT id FROM users WHERE username = ?', (username,))
+        user = cur.fetchone()
+        if user is None:
+            return None
+        # Take the version before reading, so a write racing with this read
+        # leaves the context looking stale rather than current.
+        version = get_user_version(user['id'], conn)
+        cur.execute('''
+            SELECT users.id, users.username, users.department, users.is_admin, users.remaining_leaves,
+                   users.allowance,
+                   (SELECT COUNT(*) FROM leaves
+                    WHERE leaves.user_id = users.id AND leaves.start_day >= ?
+                      AND leaves.status = 'approved') as upcoming_leaves
+            FROM users
+            WHERE users.id = ?
+        ''', (day_number(date.today()), user['id']))
+        user = cur.fetchone()
+        if user is None:
+            return None
+        context = dict(user)
+        context['version'] = version
+        return context
+    except sqlite3.Error as e:
+        print(f"Error loading user context: {e}")
+        return None
+    finally:
+        conn.close()
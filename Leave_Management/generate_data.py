@@ -0,0 +1,129 @@
+import argparse
+import os
+import sys
+import time
+import numpy as np
+import database
+from config import TOTAL_LEAVES_PER_YEAR
+from workdays import working_days
+from changes import compact_changes
+
+# Seeded synthetic data for load testing the Leave_Management data layer.
+# Volumes are configurable; leave types, durations, statuses and start dates
+# follow rough real-world shapes (summer and December peaks, few weekend
+# starts, mostly approved history, mostly pending future requests).
+
+DEPARTMENTS = ['HR', 'IT', 'Finance', 'Marketing', 'Operations']
+DEPARTMENT_WEIGHTS = [0.08, 0.30, 0.15, 0.17, 0.30]
+
+LEAVE_TYPES = ['Annual Leave', 'Sick Leave', 'Personal Leave', 'Other']
+LEAVE_TYPE_WEIGHTS = [0.55, 0.25, 0.15, 0.05]
+# Duration in days (inclusive) drawn uniformly from [low, high] per type.
+LEAVE_DURATIONS = {'Annual Leave': (1, 10), 'Sick Leave': (1, 3), 'Personal Leave': (1, 2), 'Other': (1, 5)}
+
+MONTH_WEIGHTS = np.array([0.7, 0.7, 0.9, 1.0, 1.0, 1.3, 1.8, 1.8, 1.0, 0.9, 0.8, 1.6])
+WEEKDAY_WEIGHTS = np.array([1.3, 1.0, 1.0, 1.0, 1.2, 0.15, 0.15])  # Monday first
+
+REASONS = {
+    'Annual Leave': ['Family vacation', 'Travel abroad', 'Wedding', 'Holiday trip', 'Visa appointment'],
+    'Sick Leave': ['Flu', 'Fever', 'Doctor appointment', 'Surgery recovery', 'Migraine'],
+    'Personal Leave': ['Moving house', 'Family matter', 'Bank work', 'Child school event'],
+    'Other': ['Jury duty', 'Exam', 'Volunteering', 'Relocation'],
+}
+
+def _day_weights(first, last):
+    days = np.arange(first, last + 1, dtype='datetime64[D]')
+    months = days.astype('datetime64[M]').astype(int) % 12
+    weekdays = (days.astype(int) - 4) % 7  # 1970-01-01 was a Thursday
+    weights = MONTH_WEIGHTS[months] * WEEKDAY_WEIGHTS[weekdays]
+    return days, weights / weights.sum()
+
+def generate_users(conn, rng, count, chunk_size):
+    departments = rng.choice(DEPARTMENTS, size=count, p=DEPARTMENT_WEIGHTS)
+    is_admin = rng.random(count) < 0.01
+    remaining = rng.integers(0, TOTAL_LEAVES_PER_YEAR + 1, size=count)
+    for start in range(0, count, chunk_size):
+        stop = min(start + chunk_size, count)
+        conn.executemany(
+            'INSERT INTO users (username, password, department, is_admin, remaining_leaves) VALUES (?, ?, ?, ?, ?)',
+            ((f"user{i:07d}", "password", str(departments[i]), bool(is_admin[i]), int(remaining[i]))
+             for i in range(start, stop)))
+        conn.commit()
+
+def generate_leaves(conn, rng, count, user_ids, departments, first_day, last_day, today, chunk_size, progress=None):
+    days, weights = _day_weights(first_day, last_day)
+    type_index = np.arange(len(LEAVE_TYPES))
+    low = np.array([LEAVE_DURATIONS[t][0] for t in LEAVE_TYPES])
+    high = np.array([LEAVE_DURATIONS[t][1] for t in LEAVE_TYPES])
+    done = 0
+    while done < count:
+        n = min(chunk_size, count - done)
+        picks = rng.choice(len(user_ids), size=n)
+        users = user_ids[picks]
+        types = rng.choice(type_index, size=n, p=LEAVE_TYPE_WEIGHTS)
+        starts = rng.choice(days, size=n, p=weights)
+        ends = starts + rng.integers(low[types], high[types] + 1) - 1
+        past = starts < today
+        status = np.where(past,
+                          rng.choice(['approved', 'rejected', 'pending'], size=n, p=[0.85, 0.12, 0.03]),
+                          rng.choice(['approved', 'rejected', 'pending'], size=n, p=[0.35, 0.05, 0.60]))
+        reason_pick = rng.integers(0, 1 << 30, size=n)
+        type_names = [LEAVE_TYPES[t] for t in types.tolist()]
+        reasons = [REASONS[name][pick % len(REASONS[name])] for name, pick in zip(type_names, reason_pick.tolist())]
+        charged = working_days(starts, ends, departments[picks])
+        conn.executemany('''
+            INSERT INTO leaves (user_id, start_date, end_date, start_day, end_day, reason, status, leave_type, days)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', zip(users.tolist(), starts.astype(str).tolist(), ends.astype(str).tolist(),
+                 starts.astype(np.int64).tolist(), ends.astype(np.int64).tolist(), reasons,
+                 status.tolist(), type_names, charged.tolist()))
+        conn.commit()
+        done += n
+        if progress is not None:
+            progress(done)
+
+def generate(path, users, leaves, years, seed, chunk_size=50000, progress=None):
+    database.close_pool()
+    database.DB_PATH = path
+    database.init_db()
+    rng = np.random.default_rng(seed)
+    conn = database.get_db_connection()
+    try:
+        conn.execute('PRAGMA synchronous = OFF')
+        generate_users(conn, rng, users, chunk_size)
+        rows = conn.execute("SELECT id, department FROM users WHERE username LIKE 'user%'").fetchall()
+        user_ids = np.array([row[0] for row in rows])
+        departments = np.array([row[1] for row in rows], dtype=object)
+        today = np.datetime64('today', 'D')
+        first_day = np.datetime64(f"{today.astype('datetime64[Y]').astype(int) + 1970 - years + 1}-01-01", 'D')
+        last_day = np.datetime64(f"{today.astype('datetime64[Y]').astype(int) + 1970}-12-31", 'D')
+        generate_leaves(conn, rng, leaves, user_ids, departments, first_day, last_day, today, chunk_size, progress)
+        # A new database has no change consumers, so the load itself is not
+        # kept as change events.
+        compact_changes(conn)
+        conn.commit()
+        conn.execute('PRAGMA optimize')
+    finally:
+        conn.close()
+        database.close_pool()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Fill a database with seeded synthetic users and leaves.")
+    parser.add_argument('path', help="database file to create (must not exist)")
+    parser.add_argument('--users', type=int, default=100000)
+    parser.add_argument('--leaves', type=int, default=10000000)
+    parser.add_argument('--years', type=int, default=5, help="years of history, ending with the current year")
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args(argv)
+
+    if os.path.exists(args.path):
+        parser.error(f"{args.path} already exists")
+    started = time.perf_counter()
+    generate(args.path, args.users, args.leaves, args.years, args.seed,
+             progress=lambda n: print(f"\r{n} leaves", end='', file=sys.stderr))
+    print(f"\nGenerated {args.users} users and {args.leaves} leaves in {time.perf_counter() - started:.1f}s",
+          file=sys.stderr)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,72 @@
+import numpy as np
+
+# Static centered interval tree over closed integer intervals [start, end].
+# Each node keeps the intervals that contain its center twice, sorted by start
+# and by end, so a node contributes its matches with one searchsorted and a
+# slice. Point and range overlap queries cost O(log n + k).
+
+class _Node:
+    __slots__ = ('center', 'by_start', 'start_keys', 'by_end', 'end_keys', 'left', 'right')
+
+
+class IntervalIndex:
+    def __init__(self, starts, ends):
+        self.starts = np.asarray(starts, dtype=np.int64)
+        self.ends = np.asarray(ends, dtype=np.int64)
+        if self.starts.shape != self.ends.shape:
+            raise ValueError("starts and ends must have the same length")
+        valid = np.flatnonzero(self.starts <= self.ends)
+        self._root = self._build(valid)
+
+    def __len__(self):
+        return len(self.starts)
+
+    def _build(self, positions):
+        if len(positions) == 0:
+            return None
+        s = self.starts[positions]
+        e = self.ends[positions]
+        # The median endpoint always lies inside its own interval, so every
+        # node holds at least one interval and the recursion terminates.
+        endpoints = np.sort(np.concatenate([s, e]))
+        center = endpoints[len(endpoints) // 2]
+
+        here = (s <= center) & (e >= center)
+        node = _Node()
+        node.center = center
+        inside = positions[here]
+        order = np.argsort(self.starts[inside], kind='stable')
+        node.by_start = inside[order]
+        node.start_keys = self.starts[node.by_start]
+        order = np.argsort(self.ends[inside], kind='stable')
+        node.by_end = inside[order]
+        node.end_keys = self.ends[node.by_end]
+        node.left = self._build(positions[e < center])
+        node.right = self._build(positions[s > center])
+        return node
+
+    def overlapping(self, lo, hi=None):
+        # Positions of intervals that overlap [lo, hi] (or contain lo when hi
+        # is omitted), in ascending order.
+        hi = lo if hi is None else hi
+        found = []
+        stack = [self._root]
+        while stack:
+            node = stack.pop()
+            if node is None:
+                continue
+            if hi < node.center:
+                k = np.searchsorted(node.start_keys, hi, side='right')
+                found.append(node.by_start[:k])
+                stack.append(node.left)
+            elif lo > node.center:
+                k = np.searchsorted(node.end_keys, lo, side='left')
+                found.append(node.by_end[k:])
+                stack.append(node.right)
+            else:
+                found.append(node.by_start)
+                stack.append(node.left)
+                stack.append(node.right)
+        if not found:
+            return np.empty(0, dtype=np.int64)
+        return np.sort(np.concatenate(found))
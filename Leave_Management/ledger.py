@@ -0,0 +1,222 @@
+import argparse
+import sqlite3
+import sys
+import time
+from datetime import date, timedelta
+
+# Append-only ledger of leave balance changes. users.remaining_leaves stays
+# the fast current balance; every write path that changes it also appends a
+# signed entry here in the same transaction (debit for a submitted leave,
+# credit for a rejected one, admin adjustments and corrections, accrual and
+# forfeiture), and new users get an 'opening' entry from a trigger. Entries
+# are dated the day they were posted, so nothing is ever backdated.
+#
+# balance_snapshots holds each user's balance at the end of a closed day. The
+# balance on any date is the nearest snapshot at or before it plus the few
+# entries posted after it. reconcile() recomputes every balance from the
+# ledger in one pass and reports users whose remaining_leaves has drifted.
+
+LEDGER_KINDS = ('opening', 'leave', 'refund', 'adjustment', 'correction', 'accrual', 'forfeit')
+
+LEDGER_SCHEMA = [
+    '''
+    CREATE TABLE IF NOT EXISTS balance_ledger (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER NOT NULL,
+        entry_date TEXT NOT NULL,
+        delta INTEGER NOT NULL,
+        kind TEXT NOT NULL,
+        leave_id INTEGER,
+        reason TEXT,
+        created_at TEXT NOT NULL DEFAULT (datetime('now', 'localtime'))
+    )
+    ''',
+    'CREATE INDEX IF NOT EXISTS idx_ledger_user_date ON balance_ledger (user_id, entry_date)',
+    '''
+    CREATE TABLE IF NOT EXISTS balance_snapshots (
+        user_id INTEGER NOT NULL,
+        as_of TEXT NOT NULL,
+        balance INTEGER NOT NULL,
+        PRIMARY KEY (user_id, as_of)
+    ) WITHOUT ROWID
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS trg_ledger_users_insert AFTER INSERT ON users
+    BEGIN
+        INSERT INTO balance_ledger (user_id, entry_date, delta, kind)
+        VALUES (NEW.id, date('now', 'localtime'), NEW.remaining_leaves, 'opening');
+    END
+    ''',
+    # The ledger starts from today's balances; earlier history is unknown.
+    '''
+    INSERT INTO balance_ledger (user_id, entry_date, delta, kind, reason)
+    SELECT id, date('now', 'localtime'), remaining_leaves, 'opening', 'balance when the ledger was introduced'
+    FROM users
+    ''',
+]
+
+def create_ledger(conn):
+    for statement in LEDGER_SCHEMA:
+        conn.execute(statement)
+
+
+# Posting. These run inside the caller's transaction.
+
+def post_entry(conn, user_id, delta, kind, leave_id=None, reason=None):
+    conn.execute('''
+        INSERT INTO balance_ledger (user_id, entry_date, delta, kind, leave_id, reason)
+        VALUES (?, date('now', 'localtime'), ?, ?, ?, ?)
+    ''', (user_id, delta, kind, leave_id, reason))
+
+def post_entries(conn, select_sql, params=()):
+    # select_sql yields (user_id, delta, kind, leave_id, reason) rows.
+    conn.execute(f'''
+        INSERT INTO balance_ledger (user_id, entry_date, delta, kind, leave_id, reason)
+        SELECT user_id, date('now', 'localtime'), delta, kind, leave_id, reason FROM ({select_sql})
+    ''', params)
+
+
+# Point-in-time balances
+
+BALANCE_AS_OF = '''
+    WITH snapshot AS (
+        SELECT as_of, balance FROM balance_snapshots
+        WHERE user_id = :user_id AND as_of <= :day
+        ORDER BY as_of DESC LIMIT 1
+    )
+    SELECT IFNULL((SELECT balance FROM snapshot), 0) + IFNULL((
+        SELECT SUM(delta) FROM balance_ledger
+        WHERE user_id = :user_id
+          AND entry_date > IFNULL((SELECT as_of FROM snapshot), '')
+          AND entry_date <= :day
+    ), 0)
+'''
+
+# Every user's balance at the end of :day, each from their own nearest
+# snapshot plus the entries after it.
+BALANCES_AS_OF = '''
+    WITH latest AS (
+        SELECT user_id, MAX(as_of) as as_of FROM balance_snapshots
+        WHERE as_of <= :day GROUP BY user_id
+    ),
+    base AS (
+        SELECT users.id as user_id, IFNULL(balance_snapshots.as_of, '') as as_of,
+               IFNULL(balance_snapshots.balance, 0) as balance
+        FROM users
+        LEFT JOIN latest ON latest.user_id = users.id
+        LEFT JOIN balance_snapshots
+               ON balance_snapshots.user_id = latest.user_id AND balance_snapshots.as_of = latest.as_of
+    )
+    SELECT base.user_id, base.balance + IFNULL((
+        SELECT SUM(delta) FROM balance_ledger
+        WHERE balance_ledger.user_id = base.user_id
+          AND balance_ledger.entry_date > base.as_of AND balance_ledger.entry_date <= :day
+    ), 0) as balance
+    FROM base
+'''
+
+def _day(value):
+    return value.isoformat() if isinstance(value, date) else str(value)[:10]
+
+def balance_as_of(conn, user_id, day):
+    return conn.execute(BALANCE_AS_OF, {'user_id': user_id, 'day': _day(day)}).fetchone()[0]
+
+def balances_as_of(conn, day):
+    import pandas as pd
+    return pd.read_sql_query(BALANCES_AS_OF, conn, params={'day': _day(day)})
+
+def take_snapshots(conn, as_of=None):
+    # Snapshots every user's balance at the end of as_of (default:
+    # yesterday). Only closed days can be snapshotted, since entries are
+    # still being posted today. Returns the number of users.
+    as_of = date.today() - timedelta(days=1) if as_of is None else date.fromisoformat(_day(as_of))
+    if as_of >= date.today():
+        raise ValueError("Snapshots can only be taken for days that have ended")
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        cur = conn.execute(f'''
+            INSERT OR REPLACE INTO balance_snapshots (user_id, as_of, balance)
+            SELECT user_id, :day, balance FROM ({BALANCES_AS_OF})
+        ''', {'day': as_of.isoformat()})
+        count = cur.rowcount
+        conn.commit()
+        return count
+    except sqlite3.Error:
+        conn.rollback()
+        raise
+
+
+def reconcile(conn, repair=False):
+    import pandas as pd
+    # Compares every user's remaining_leaves with the sum of their ledger
+    # entries in a single grouped pass. With repair, posts a 'correction'
+    # entry per mismatch so the ledger matches the balances users see.
+    conn.execute('BEGIN IMMEDIATE' if repair else 'BEGIN')
+    try:
+        mismatches = pd.read_sql_query('''
+            SELECT users.id as user_id, users.username, users.remaining_leaves,
+                   IFNULL(ledger.balance, 0) as ledger_balance,
+                   users.remaining_leaves - IFNULL(ledger.balance, 0) as drift
+            FROM users
+            LEFT JOIN (SELECT user_id, SUM(delta) as balance FROM balance_ledger GROUP BY user_id) as ledger
+                   ON ledger.user_id = users.id
+            WHERE users.remaining_leaves != IFNULL(ledger.balance, 0)
+            ORDER BY users.id
+        ''', conn)
+        if repair and not mismatches.empty:
+            conn.executemany('''
+                INSERT INTO balance_ledger (user_id, entry_date, delta, kind, reason)
+                VALUES (?, date('now', 'localtime'), ?, 'correction', 'reconciliation')
+            ''', zip(mismatches['user_id'].tolist(), mismatches['drift'].tolist()))
+            conn.commit()
+        else:
+            conn.rollback()
+        return mismatches
+    except sqlite3.Error:
+        conn.rollback()
+        raise
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Leave balance ledger maintenance.")
+    commands = parser.add_subparsers(dest='command', required=True)
+    snapshot = commands.add_parser('snapshot', help="snapshot every balance at the end of a day")
+    snapshot.add_argument('--as-of', help="ISO date (default: yesterday)")
+    check = commands.add_parser('reconcile', help="report users whose balance does not match the ledger")
+    check.add_argument('--repair', action='store_true', help="post correction entries for mismatches")
+    balance = commands.add_parser('balance', help="a user's balance at the end of a day")
+    balance.add_argument('user_id', type=int)
+    balance.add_argument('day', help="ISO date")
+    args = parser.parse_args(argv)
+
+    from database import get_db_connection, init_db, invalidate_cache
+    init_db()
+    conn = get_db_connection()
+    if conn is None:
+        print("Unable to connect to the database")
+        return 1
+    try:
+        started = time.perf_counter()
+        if args.command == 'snapshot':
+            count = take_snapshots(conn, args.as_of)
+            print(f"Snapshotted {count} balances in {time.perf_counter() - started:.2f}s")
+        elif args.command == 'balance':
+            print(balance_as_of(conn, args.user_id, args.day))
+        else:
+            mismatches = reconcile(conn, args.repair)
+            if args.repair and not mismatches.empty:
+                invalidate_cache('balance_ledger')
+            if not mismatches.empty:
+                print(mismatches.to_string(index=False))
+            verb = "Corrected" if args.repair else "Found"
+            print(f"{verb} {len(mismatches)} mismatched balances in {time.perf_counter() - started:.2f}s")
+            return 1 if len(mismatches) and not args.repair else 0
+        return 0
+    except (sqlite3.Error, ValueError) as e:
+        print(f"Ledger command failed: {e}")
+        return 1
+    finally:
+        conn.close()
+
+if __name__ == "__main__":
+    sys.exit(main())
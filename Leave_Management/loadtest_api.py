@@ -0,0 +1,185 @@
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+from tornado.httpclient import AsyncHTTPClient, HTTPClientError, HTTPRequest
+
+# Sustained-load test for api.py. Starts the API server on a database
+# (normally one built by generate_data.py, or a fresh one with --generate),
+# then keeps --concurrency requests in flight for --duration seconds with a
+# read-heavy mix of endpoints, and reports requests/second, latency
+# percentiles and status codes per endpoint:
+#
+#   python loadtest_api.py /tmp/bench.db --duration 30 --concurrency 64
+#   python loadtest_api.py --generate 10000 200000 --duration 30
+#
+# Clients remember ETags and send If-None-Match on --conditional of their
+# repeat reads, the way a polling integration would. --write-ratio adds leave
+# applications far in the future, so pass a scratch copy of the database.
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+def _sample_ids(path, count=2000):
+    import sqlite3
+    conn = sqlite3.connect(path)
+    try:
+        user_ids = [row[0] for row in conn.execute('SELECT id FROM users ORDER BY random() LIMIT ?', (count,))]
+        departments = [row[0] for row in conn.execute('SELECT DISTINCT department FROM users WHERE department IS NOT NULL')]
+    finally:
+        conn.close()
+    if not user_ids:
+        raise SystemExit("The database has no users; run generate_data.py first or pass --generate.")
+    return user_ids, departments
+
+def _request_mix(rng, user_ids, departments, write_ratio):
+    # Returns (endpoint name, method, path, body).
+    if rng.random() < write_ratio:
+        start = date(2040, 1, 1) + timedelta(days=rng.randrange(3000))
+        body = {'user_id': rng.choice(user_ids), 'start_date': start.isoformat(),
+                'end_date': (start + timedelta(days=rng.randrange(3))).isoformat(),
+                'reason': 'load test', 'leave_type': 'Annual Leave'}
+        return 'apply', 'POST', '/api/leaves', body
+    user_id = rng.choice(user_ids)
+    pick = rng.random()
+    if pick < 0.25:
+        return 'user', 'GET', f'/api/users/{user_id}', None
+    if pick < 0.45:
+        return 'balance', 'GET', f'/api/users/{user_id}/balance', None
+    if pick < 0.70:
+        return 'user leaves', 'GET', f'/api/leaves?user_id={user_id}&limit=25', None
+    if pick < 0.80:
+        department = rng.choice(departments) if departments else ''
+        return 'pending leaves', 'GET', f'/api/leaves?status=pending&department={department}&limit=50', None
+    if pick < 0.90:
+        return 'users page', 'GET', f'/api/users?after={user_id}&limit=50', None
+    return 'stats', 'GET', f"/api/stats/{rng.choice(['overview', 'utilization', 'leave-types', 'monthly'])}", None
+
+async def _run_load(base_url, user_ids, departments, duration, concurrency, write_ratio, conditional, seed, token):
+    AsyncHTTPClient.configure(None, max_clients=concurrency)
+    client = AsyncHTTPClient()
+    results = {}
+    etags = {}
+    deadline = time.perf_counter() + duration
+
+    async def worker(index):
+        rng = random.Random(seed + index)
+        while time.perf_counter() < deadline:
+            name, method, path, body = _request_mix(rng, user_ids, departments, write_ratio)
+            headers = {'Authorization': f"Bearer {token}"} if token else {}
+            if method == 'GET' and path in etags and rng.random() < conditional:
+                headers['If-None-Match'] = etags[path]
+            request = HTTPRequest(base_url + path, method=method, headers=headers,
+                                  body=json.dumps(body) if body is not None else None, request_timeout=60)
+            started = time.perf_counter()
+            try:
+                response = await client.fetch(request, raise_error=False)
+                code = response.code
+                if code == 200 and 'Etag' in response.headers:
+                    etags[path] = response.headers['Etag']
+            except (HTTPClientError, OSError) as e:
+                code = getattr(e, 'code', 599)
+            elapsed = time.perf_counter() - started
+            stats = results.setdefault(name, {'latencies': [], 'codes': {}})
+            stats['latencies'].append(elapsed)
+            stats['codes'][code] = stats['codes'].get(code, 0) + 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker(i) for i in range(concurrency)))
+    client.close()
+    return results, time.perf_counter() - started
+
+def _percentile(values, q):
+    return statistics.quantiles(values, n=100, method='inclusive')[q - 1] if len(values) > 1 else values[0]
+
+def report(results, elapsed):
+    total = sum(len(stats['latencies']) for stats in results.values())
+    print(f"{'endpoint':<16}{'requests':>10}{'req/s':>10}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}  status codes")
+    everything = []
+    for name, stats in sorted(results.items()):
+        latencies = stats['latencies']
+        everything.extend(latencies)
+        codes = ' '.join(f"{code}:{count}" for code, count in sorted(stats['codes'].items()))
+        print(f"{name:<16}{len(latencies):>10}{len(latencies) / elapsed:>10.0f}"
+              f"{_percentile(latencies, 50) * 1000:>9.1f}{_percentile(latencies, 95) * 1000:>9.1f}"
+              f"{_percentile(latencies, 99) * 1000:>9.1f}  {codes}")
+    if everything:
+        print(f"{'total':<16}{total:>10}{total / elapsed:>10.0f}{_percentile(everything, 50) * 1000:>9.1f}"
+              f"{_percentile(everything, 95) * 1000:>9.1f}{_percentile(everything, 99) * 1000:>9.1f}")
+    failures = sum(count for stats in results.values() for code, count in stats['codes'].items() if code >= 500)
+    return total, failures
+
+def _wait_until_up(process, base_url, timeout=60):
+    import urllib.request
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise SystemExit("The API server exited during startup")
+        try:
+            urllib.request.urlopen(base_url + '/api/health', timeout=1)
+            return
+        except OSError as e:
+            if getattr(e, 'code', None) == 401:
+                return
+            time.sleep(0.2)
+    raise SystemExit("The API server did not start in time")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Sustained-load test for the leave JSON API (api.py).")
+    parser.add_argument('database', nargs='?', help="database to serve (see generate_data.py)")
+    parser.add_argument('--generate', nargs=2, type=int, metavar=('USERS', 'LEAVES'),
+                        help="serve a freshly generated scratch database instead")
+    parser.add_argument('--duration', type=float, default=20, help="seconds of sustained load")
+    parser.add_argument('--concurrency', type=int, default=32, help="requests kept in flight")
+    parser.add_argument('--workers', type=int, help="database threads in the server (default: API_WORKERS)")
+    parser.add_argument('--write-ratio', type=float, default=0.0, help="fraction of requests that apply for leave")
+    parser.add_argument('--conditional', type=float, default=0.5,
+                        help="fraction of repeat reads sent with If-None-Match")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+    if (args.database is None) == (args.generate is None):
+        parser.error("give either a database or --generate USERS LEAVES")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = args.database
+        if args.generate is not None:
+            path = os.path.join(tmp, 'loadtest.db')
+            subprocess.run([sys.executable, os.path.join(HERE, 'generate_data.py'), path,
+                            '--users', str(args.generate[0]), '--leaves', str(args.generate[1])], check=True)
+        elif not os.path.exists(path):
+            parser.error(f"{path} does not exist")
+        user_ids, departments = _sample_ids(path)
+
+        port = _free_port()
+        base_url = f"http://127.0.0.1:{port}"
+        command = [sys.executable, os.path.join(HERE, 'api.py'), '--db', path, '--port', str(port)]
+        if args.workers:
+            command += ['--workers', str(args.workers)]
+        server = subprocess.Popen(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            _wait_until_up(server, base_url)
+            print(f"Running {args.concurrency} concurrent clients for {args.duration:.0f}s against {path}\n")
+            results, elapsed = asyncio.run(_run_load(
+                base_url, user_ids, departments, args.duration, args.concurrency, args.write_ratio,
+                args.conditional, args.seed, os.environ.get('LEAVE_API_TOKEN')))
+        finally:
+            server.terminate()
+            server.wait(timeout=30)
+    total, failures = report(results, elapsed)
+    print(f"\n{total / elapsed:.0f} requests/second sustained over {elapsed:.1f}s, {failures} server errors")
+    return 1 if failures else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,259 @@
+import sqlite3
+import sys
+from datetime import datetime
+from aggregates import create_aggregates, add_allowance_to_balance
+from columnar import create_export_queue
+from accrual import create_accrual_schema
+from ledger import create_ledger
+from changes import create_change_feed
+from search import create_search_index, create_search_version, create_prefix_index, drop_search_version
+
+# Migration 17 bumps a user's counter in user_versions on every write to
+# their users row or their leaves.
+BUMP_USER_VERSION = '''
+            INSERT INTO user_versions (user_id, version) VALUES ({}, 1)
+            ON CONFLICT (user_id) DO UPDATE SET version = version + 1;'''
+
+# Each migration is (version, description, steps). A step is either a SQL
+# statement or a callable taking the connection. Migrations are applied in
+# order inside their own transaction and recorded in schema_version, so
+# existing database.db files are upgraded in place by init_db().
+MIGRATIONS = [
+    (1, 'Index leaves by user for history, summary and upcoming-leave lookups', [
+        'CREATE INDEX IF NOT EXISTS idx_leaves_user_start ON leaves (user_id, start_date)',
+        'CREATE INDEX IF NOT EXISTS idx_leaves_user_status_start ON leaves (user_id, status, start_date)',
+    ]),
+    (2, 'Index leaves by status and start date for approval queue and listings', [
+        'CREATE INDEX IF NOT EXISTS idx_leaves_status_start ON leaves (status, start_date)',
+        'CREATE INDEX IF NOT EXISTS idx_leaves_start ON leaves (start_date)',
+    ]),
+    (3, 'Index users by department for department and team calendar queries', [
+        'CREATE INDEX IF NOT EXISTS idx_users_department ON users (department)',
+    ]),
+    (4, 'Trigger-maintained summary tables for the admin Leave Overview page', [
+        create_aggregates,
+    ]),
+    (5, 'Per-table data versions bumped by triggers on every write', [
+        '''
+        CREATE TABLE IF NOT EXISTS table_versions (
+            name TEXT PRIMARY KEY,
+            version INTEGER NOT NULL DEFAULT 0
+        )
+        ''',
+        "INSERT OR IGNORE INTO table_versions (name, version) VALUES ('users', 0), ('leaves', 0)",
+    ] + [
+        f'''
+        CREATE TRIGGER IF NOT EXISTS trg_version_{table}_{op.lower()} AFTER {op} ON {table}
+        BEGIN
+            UPDATE table_versions SET version = version + 1 WHERE name = '{table}';
+        END
+        '''
+        for table in ('users', 'leaves') for op in ('INSERT', 'UPDATE', 'DELETE')
+    ]),
+    (6, 'Queue of changed leaves for the incremental Parquet export', [
+        create_export_queue,
+    ]),
+    (7, 'Store the working days each leave is charged (see workdays.py)', [
+        'ALTER TABLE leaves ADD COLUMN days INTEGER',
+        # Every existing leave was debited in calendar days when it was
+        # submitted, decided or not; keep that figure so history, refunds of
+        # pending leaves and the ledger agree with what was actually taken.
+        # Only leaves submitted from now on are charged working days.
+        'UPDATE leaves SET days = CAST(julianday(end_date) - julianday(start_date) + 1 AS INTEGER)',
+    ]),
+    (8, 'Per-user yearly allowance and join date for the accrual job', [
+        create_accrual_schema,
+        add_allowance_to_balance,
+    ]),
+    (9, 'Append-only balance ledger with per-user balance snapshots', [
+        create_ledger,
+    ]),
+    (10, 'Integer day numbers and generated year/month columns for leave date ranges', [
+        # Days since 1970-01-01 (numpy's datetime64[D] encoding), written
+        # next to the ISO text by every insert. Range filters compare these
+        # integers; the year and month columns are computed and indexed.
+        'ALTER TABLE leaves ADD COLUMN start_day INTEGER',
+        'ALTER TABLE leaves ADD COLUMN end_day INTEGER',
+        '''
+        ALTER TABLE leaves ADD COLUMN start_year INTEGER
+        GENERATED ALWAYS AS (CAST(substr(start_date, 1, 4) AS INTEGER)) VIRTUAL
+        ''',
+        '''
+        ALTER TABLE leaves ADD COLUMN start_month INTEGER
+        GENERATED ALWAYS AS (CAST(substr(start_date, 6, 2) AS INTEGER)) VIRTUAL
+        ''',
+        '''
+        UPDATE leaves
+        SET start_day = CAST(julianday(start_date) - 2440587.5 AS INTEGER),
+            end_day = CAST(julianday(end_date) - 2440587.5 AS INTEGER)
+        ''',
+        'CREATE INDEX IF NOT EXISTS idx_leaves_user_start_day ON leaves (user_id, start_day, end_day)',
+        'CREATE INDEX IF NOT EXISTS idx_leaves_user_year_month ON leaves (user_id, start_year, start_month)',
+    ]),
+    (11, 'Trigger-fed change feed of users/leaves row changes with consumer cursors', [
+        create_change_feed,
+    ]),
+    (12, 'FTS5 search index over leave reasons and balance adjustment notes', [
+        create_search_index,
+    ]),
+    (13, 'Data version for balance_ledger, so ledger-only writes are visible to ETags and caches', [
+        "INSERT OR IGNORE INTO table_versions (name, version) VALUES ('balance_ledger', 0)",
+    ] + [
+        f'''
+        CREATE TRIGGER IF NOT EXISTS trg_version_balance_ledger_{op.lower()} AFTER {op} ON balance_ledger
+        BEGIN
+            UPDATE table_versions SET version = version + 1 WHERE name = 'balance_ledger';
+        END
+        '''
+        for op in ('INSERT', 'UPDATE', 'DELETE')
+    ]),
+    (14, 'Version of the reason search index, so search cursors can detect re-ranking', [
+        create_search_version,
+    ]),
+    (15, 'Unstemmed FTS5 index of reasons for prefix searches', [
+        create_prefix_index,
+    ]),
+    (16, 'Stop versioning the reason search index; search cursors resume after their last result', [
+        drop_search_version,
+    ]),
+    (17, "Per-user data versions, so a session's user context reloads only on that user's writes", [
+        '''
+        CREATE TABLE IF NOT EXISTS user_versions (
+            user_id INTEGER PRIMARY KEY,
+            version INTEGER NOT NULL
+        ) WITHOUT ROWID
+        ''',
+    ] + [
+        f'''
+        CREATE TRIGGER IF NOT EXISTS trg_user_version_{table}_{op.lower()} AFTER {op} ON {table}
+        BEGIN{''.join(BUMP_USER_VERSION.format(f'{row}.{column}') for row in rows)}
+        END
+        '''
+        # An update bumps both the old and the new owner, in case it moved.
+        for table, column in (('users', 'id'), ('leaves', 'user_id'))
+        for op, rows in (('INSERT', ['NEW']), ('UPDATE', ['OLD', 'NEW']), ('DELETE', ['OLD']))
+    ]),
+]
+
+# The queries behind the hot helpers, used by check_query_plans() to confirm
+# each one is answered from an index rather than a full table scan.
+HOT_QUERIES = {
+    'get_user_leaves': (
+        'SELECT * FROM leaves WHERE user_id = ? ORDER BY start_date DESC', (1,)),
+    'get_all_leaves': (
+        '''SELECT leaves.*, users.username, users.department
+           FROM leaves JOIN users ON leaves.user_id = users.id
+           ORDER BY start_date DESC''', ()),
+    'get_department_leaves': (
+        '''SELECT leaves.*, users.username
+           FROM leaves JOIN users ON leaves.user_id = users.id
+           WHERE users.department = ? ORDER BY start_date DESC''', ('HR',)),
+    'manage_leaves': (
+        '''SELECT leaves.*, users.username, users.department
+           FROM leaves JOIN users ON leaves.user_id = users.id
+           WHERE leaves.status = 'pending' ''', ()),
+    'get_user_context (upcoming)': (
+        '''SELECT COUNT(*) as count FROM leaves
+           WHERE user_id = ? AND start_day >= ? AND status = 'approved' ''', (1, 20000)),
+    'get_leave_breakdown': (
+        '''SELECT leave_type, COUNT(*) as count, SUM(days) as total_days FROM leaves
+           WHERE user_id = ? AND start_year = ? GROUP BY leave_type''', (1, 2024)),
+    'submit_leave (overlap)': (
+        '''SELECT start_date, end_date FROM leaves
+           WHERE user_id = ? AND status IN ('pending', 'approved')
+             AND start_day <= ? AND end_day >= ? LIMIT 1''', (1, 20000, 19990)),
+    'get_leaves_page (user)': (
+        '''SELECT leaves.*, users.username, users.department
+           FROM leaves JOIN users ON leaves.user_id = users.id
+           WHERE leaves.user_id = ? AND (leaves.start_date, leaves.id) < (?, ?)
+           ORDER BY leaves.start_date DESC, leaves.id DESC LIMIT 26''', (1, '2024-08-01', 10)),
+    'get_leaves_page (pending)': (
+        '''SELECT leaves.*, users.username, users.department
+           FROM leaves JOIN users ON leaves.user_id = users.id
+           WHERE leaves.status = ? AND (leaves.start_date, leaves.id) < (?, ?)
+           ORDER BY leaves.start_date DESC, leaves.id DESC LIMIT 26''', ('pending', '2024-08-01', 10)),
+    'get_leaves_page (all)': (
+        '''SELECT leaves.*, users.username, users.department
+           FROM leaves JOIN users ON leaves.user_id = users.id
+           WHERE (leaves.start_date, leaves.id) < (?, ?)
+           ORDER BY leaves.start_date DESC, leaves.id DESC LIMIT 26''', ('2024-08-01', 10)),
+    'show_team_calendar': (
+        '''SELECT leaves.start_day, leaves.end_day
+           FROM leaves JOIN users ON leaves.user_id = users.id
+           WHERE users.department = ? AND +leaves.status = 'approved'
+             AND leaves.start_day <= ? AND leaves.end_day >= ?''', ('HR', 20453, 20089)),
+}
+
+def ensure_version_table(conn):
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS schema_version (
+        version INTEGER PRIMARY KEY,
+        description TEXT NOT NULL,
+        applied_at TEXT NOT NULL
+    )
+    ''')
+    conn.commit()
+
+def get_schema_version(conn):
+    ensure_version_table(conn)
+    row = conn.execute('SELECT MAX(version) FROM schema_version').fetchone()
+    return row[0] or 0
+
+def run_migrations(conn, target=None):
+    current = get_schema_version(conn)
+    applied = []
+    for version, description, steps in MIGRATIONS:
+        if version <= current or (target is not None and version > target):
+            continue
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            for step in steps:
+                if callable(step):
+                    step(conn)
+                else:
+                    conn.execute(step)
+            conn.execute('INSERT INTO schema_version (version, description, applied_at) VALUES (?, ?, ?)',
+                         (version, description, datetime.now().isoformat(timespec='seconds')))
+            conn.commit()
+        except sqlite3.Error:
+            conn.rollback()
+            raise
+        applied.append(version)
+    return applied
+
+def explain(conn, sql, params=()):
+    return [row[3] for row in conn.execute(f'EXPLAIN QUERY PLAN {sql}', params).fetchall()]
+
+def check_query_plans(conn):
+    # A plan is considered indexed if none of its steps is a bare table scan.
+    # Scans of an index ("SCAN x USING INDEX") and covering scans are fine.
+    results = []
+    for name, (sql, params) in HOT_QUERIES.items():
+        plan = explain(conn, sql, params)
+        full_scans = [step for step in plan
+                      if step.startswith('SCAN') and 'USING' not in step]
+        results.append((name, plan, not full_scans))
+    return results
+
+def main(argv):
+    from database import get_db_connection, init_db
+    init_db()
+    conn = get_db_connection()
+    if conn is None:
+        return 1
+    try:
+        print(f"Schema version: {get_schema_version(conn)}")
+        if '--check' not in argv:
+            return 0
+        failed = 0
+        for name, plan, indexed in check_query_plans(conn):
+            print(f"{'OK  ' if indexed else 'SCAN'} {name}")
+            for step in plan:
+                print(f"       {step}")
+            failed += not indexed
+        return 1 if failed else 0
+    finally:
+        conn.close()
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,24 @@
+import streamlit as st
+
+# Next/previous controls for keyset-paginated listings. The session keeps a
+# stack of page-start cursors per listing: "Next" pushes the cursor returned
+# with the current page, "Previous" pops back to the one before it.
+
+def current_cursor(key):
+    return st.session_state.setdefault(f"{key}_cursors", [None])[-1]
+
+def reset_pagination(key):
+    st.session_state[f"{key}_cursors"] = [None]
+
+def pagination_controls(key, next_cursor):
+    stack = st.session_state.setdefault(f"{key}_cursors", [None])
+    col1, col2, col3 = st.columns([1, 2, 1])
+    with col1:
+        if st.button("Previous", key=f"{key}_prev", disabled=len(stack) == 1):
+            stack.pop()
+            st.rerun()
+    col2.write(f"Page {len(stack)}")
+    with col3:
+        if st.button("Next", key=f"{key}_next", disabled=next_cursor is None):
+            stack.append(next_cursor)
+            st.rerun()
@@ -0,0 +1,149 @@
+import queue
+import sqlite3
+import threading
+from config import POOL_SIZE, POOL_TIMEOUT, SQLITE_PRAGMAS
+
+
+class PooledConnection(sqlite3.Connection):
+    # close() hands the connection back to its pool instead of closing it, so
+    # every existing `conn.close()` call site keeps working unchanged.
+    _pool = None
+    _checked_out = False
+    # Cursor class used for conn.cursor()/conn.execute() when set (tracing.py).
+    traced_cursor = None
+
+    def cursor(self, factory=None):
+        if factory is None:
+            factory = self.traced_cursor
+        return super().cursor() if factory is None else super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        if self.traced_cursor is None:
+            return super().execute(sql, parameters)
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        if self.traced_cursor is None:
+            return super().executemany(sql, seq_of_parameters)
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def close(self):
+        if self._pool is None:
+            super().close()
+        else:
+            self._pool.release(self)
+
+    def close_for_real(self):
+        super().close()
+
+
+class ConnectionPool:
+    def __init__(self, path, size=POOL_SIZE, timeout=POOL_TIMEOUT, pragmas=None, on_connect=None):
+        # on_connect(conn) runs once for every new connection, e.g. to
+        # register SQL functions.
+        self.path = path
+        self.on_connect = on_connect
+        self.size = size
+        self.timeout = timeout
+        self.pragmas = SQLITE_PRAGMAS if pragmas is None else pragmas
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._all = set()
+        self._pending = 0
+        self._closed = False
+        self.stats = {'hits': 0, 'misses': 0, 'waits': 0, 'timeouts': 0, 'open': 0, 'in_use': 0}
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, factory=PooledConnection, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        for name, value in self.pragmas.items():
+            conn.execute(f"PRAGMA {name} = {value}")
+        if self.on_connect is not None:
+            self.on_connect(conn)
+        conn._pool = self
+        return conn
+
+    def acquire(self):
+        try:
+            conn = self._idle.get_nowait()
+            conn._checked_out = True
+            with self._lock:
+                self.stats['hits'] += 1
+                self.stats['in_use'] += 1
+            return conn
+        except queue.Empty:
+            pass
+
+        with self._lock:
+            can_open = len(self._all) + self._pending < self.size
+            if can_open:
+                # Reserve the slot before connecting so concurrent callers
+                # cannot overshoot the pool size.
+                self._pending += 1
+                self.stats['misses'] += 1
+            else:
+                self.stats['waits'] += 1
+
+        if can_open:
+            try:
+                conn = self._connect()
+            except sqlite3.Error:
+                with self._lock:
+                    self._pending -= 1
+                raise
+            with self._lock:
+                self._pending -= 1
+                self._all.add(conn)
+                self.stats['open'] = len(self._all)
+                self.stats['in_use'] += 1
+            conn._checked_out = True
+            return conn
+
+        try:
+            conn = self._idle.get(timeout=self.timeout)
+        except queue.Empty:
+            with self._lock:
+                self.stats['timeouts'] += 1
+            raise sqlite3.OperationalError(f"Timed out after {self.timeout}s waiting for a pooled connection")
+        conn._checked_out = True
+        with self._lock:
+            self.stats['in_use'] += 1
+        return conn
+
+    def release(self, conn):
+        if not conn._checked_out:
+            return
+        conn._checked_out = False
+        with self._lock:
+            self.stats['in_use'] -= 1
+            closed = self._closed
+        if closed:
+            self._discard(conn)
+            return
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error:
+            self._discard(conn)
+            return
+        self._idle.put(conn)
+
+    def _discard(self, conn):
+        with self._lock:
+            self._all.discard(conn)
+            self.stats['open'] = len(self._all)
+        conn.close_for_real()
+
+    def close(self):
+        with self._lock:
+            self._closed = True
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            self._discard(conn)
+
+    def get_stats(self):
+        with self._lock:
+            return dict(self.stats, size=self.size, idle=self._idle.qsize())
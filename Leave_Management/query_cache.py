@@ -0,0 +1,141 @@
+import functools
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+# In-process result cache for read helpers. Entries are keyed by the helper
+# and its arguments, tagged with the tables they read, evicted LRU or after a
+# TTL, and dropped as soon as a write helper invalidates one of their tables.
+#
+# Writes from other processes (the API, bulk imports, the CLIs) never reach
+# those helpers. Given a versions callable returning the trigger-maintained
+# {table: version} counters, lookups sync against them at most once every
+# sync_interval seconds and drop the tables whose counter has moved since the
+# last look, so another process's write can be served stale for up to that
+# long. Only cache small keyed lookups: every hit hands out a copy.
+
+class QueryCache:
+    def __init__(self, max_entries, ttl, versions=None, sync_interval=0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.versions = versions
+        self.sync_interval = sync_interval
+        self._next_sync = 0
+        self._entries = OrderedDict()  # key -> (value, expires_at, tags)
+        self._by_tag = {}
+        self._generations = {}
+        self._seen_versions = {}
+        self._lock = threading.Lock()
+        self.stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'expirations': 0, 'invalidations': 0}
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.stats['misses'] += 1
+                return False, None
+            value, expires_at, _ = entry
+            if expires_at < time.monotonic():
+                self._remove(key)
+                self.stats['expirations'] += 1
+                self.stats['misses'] += 1
+                return False, None
+            self._entries.move_to_end(key)
+            self.stats['hits'] += 1
+            return True, value
+
+    def generation(self, tags):
+        with self._lock:
+            return tuple(self._generations.get(tag, 0) for tag in tags)
+
+    def put(self, key, value, tags, generation=None):
+        with self._lock:
+            # A write that landed while the value was being computed makes it
+            # stale before it is stored; skip it.
+            if generation is not None and generation != tuple(self._generations.get(tag, 0) for tag in tags):
+                return
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (value, time.monotonic() + self.ttl, tags)
+            for tag in tags:
+                self._by_tag.setdefault(tag, set()).add(key)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+                self.stats['evictions'] += 1
+
+    def invalidate(self, *tables):
+        with self._lock:
+            self._invalidate(tables)
+
+    def sync(self):
+        if self.versions is None:
+            return
+        now = time.monotonic()
+        with self._lock:
+            if now < self._next_sync:
+                return
+            self._next_sync = now + self.sync_interval
+        live = self.versions()
+        if not live:
+            return
+        with self._lock:
+            seen, self._seen_versions = self._seen_versions, live
+            self._invalidate([table for table, version in live.items()
+                              if table in seen and seen[table] != version])
+
+    def _invalidate(self, tables):
+        for table in tables:
+            self._generations[table] = self._generations.get(table, 0) + 1
+            for key in list(self._by_tag.get(table, ())):
+                self._remove(key)
+                self.stats['invalidations'] += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._by_tag.clear()
+
+    def _remove(self, key):
+        _, _, tags = self._entries.pop(key)
+        for tag in tags:
+            keys = self._by_tag.get(tag)
+            if keys is not None:
+                keys.discard(key)
+
+    def get_stats(self):
+        with self._lock:
+            lookups = self.stats['hits'] + self.stats['misses']
+            return dict(self.stats, entries=len(self._entries), max_entries=self.max_entries, ttl=self.ttl,
+                        hit_rate=self.stats['hits'] / lookups if lookups else 0.0)
+
+
+def _copy(value):
+    # Callers are free to mutate what they get back (e.g. adding columns to a
+    # DataFrame), so hand out copies and keep the cached value pristine. A
+    # DataFrame can only be cached once pandas is loaded, so it is not imported
+    # here just to check.
+    pd = sys.modules.get('pandas')
+    if pd is not None and isinstance(value, pd.DataFrame):
+        return value.copy()
+    if isinstance(value, list):
+        return list(value)
+    return value
+
+def cached(cache, *tables):
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            key = (func.__name__, args, tuple(sorted(kwargs.items())))
+            cache.sync()
+            hit, value = cache.get(key)
+            if hit:
+                return _copy(value)
+            generation = cache.generation(tables)
+            value = func(*args, **kwargs)
+            # None means the helper hit an error; don't pin that in the cache.
+            if value is not None:
+                cache.put(key, value, tables, generation)
+            return _copy(value)
+        return wrapper
+    return decorator
@@ -0,0 +1,338 @@
+import argparse
+import re
+import sqlite3
+import sys
+import time
+from config import PAGE_SIZE, SEARCH_CANDIDATES
+from calendar_engine import day_number
+
+# Full-text search over leave reasons and the notes admins give with balance
+# adjustments. reason_search is a contentless FTS5 index (the text stays in
+# leaves/balance_ledger only): a leave is indexed under rowid = leaves.id and
+# an adjustment under rowid = -balance_ledger.id, so one MATCH ranks both.
+# Triggers keep it in step with every insert, reason edit and delete in the
+# same transaction. Words are stemmed (porter), so "wedding" also finds
+# "weddings"; a trailing * matches a prefix ("visa*", "wedd*") of the words as
+# written, looked up in a second, unstemmed index (reason_prefix).
+#
+# bm25 has to be computed for every match before the best can be picked, so a
+# word found in a large share of millions of reasons would cost seconds. Each
+# source is therefore ranked over its newest SEARCH_CANDIDATES matches that
+# pass the filters (FTS5 walks the index newest first and stops there); when
+# fewer rows match, the ranking is exact, and when more do the results say
+# so (truncated) so callers can narrow the search or pass candidates=None to
+# rank every match.
+#
+# bm25 scores depend on the whole index, so any indexed write shifts them,
+# often by the same amount for every result. A page cursor is therefore the
+# doc_id of the last result only: the next page continues after that
+# document's current (score, doc_id), so writes in between can at most move
+# the results that changed places with it. If it no longer matches (deleted,
+# edited, or no longer among the candidates), search starts again from the
+# first page.
+
+def index_schema(table, tokenize, tag):
+    # A contentless FTS5 table over leave reasons and adjustment notes, and
+    # the triggers that keep it in step. A contentless index needs the old
+    # text to remove a row.
+    return [
+        f'''
+        CREATE VIRTUAL TABLE IF NOT EXISTS {table} USING fts5(
+            reason, content='', tokenize='{tokenize}', prefix='2 3'
+        )
+        ''',
+        f'''
+        CREATE TRIGGER IF NOT EXISTS trg_{tag}_leaves_insert AFTER INSERT ON leaves
+        BEGIN
+            INSERT INTO {table} (rowid, reason) VALUES (NEW.id, NEW.reason);
+        END
+        ''',
+        f'''
+        CREATE TRIGGER IF NOT EXISTS trg_{tag}_leaves_update AFTER UPDATE OF id, reason ON leaves
+        BEGIN
+            INSERT INTO {table} ({table}, rowid, reason) VALUES ('delete', OLD.id, OLD.reason);
+            INSERT INTO {table} (rowid, reason) VALUES (NEW.id, NEW.reason);
+        END
+        ''',
+        f'''
+        CREATE TRIGGER IF NOT EXISTS trg_{tag}_leaves_delete AFTER DELETE ON leaves
+        BEGIN
+            INSERT INTO {table} ({table}, rowid, reason) VALUES ('delete', OLD.id, OLD.reason);
+        END
+        ''',
+        # The ledger is append-only; only adjustments with a note are indexed.
+        f'''
+        CREATE TRIGGER IF NOT EXISTS trg_{tag}_ledger_insert AFTER INSERT ON balance_ledger
+        WHEN NEW.kind = 'adjustment' AND NEW.reason != ''
+        BEGIN
+            INSERT INTO {table} (rowid, reason) VALUES (-NEW.id, NEW.reason);
+        END
+        ''',
+        f'''
+        CREATE TRIGGER IF NOT EXISTS trg_{tag}_ledger_delete AFTER DELETE ON balance_ledger
+        WHEN OLD.kind = 'adjustment' AND OLD.reason != ''
+        BEGIN
+            INSERT INTO {table} ({table}, rowid, reason) VALUES ('delete', -OLD.id, OLD.reason);
+        END
+        ''',
+    ]
+
+def index_existing(table):
+    return [
+        f'INSERT INTO {table} (rowid, reason) SELECT id, reason FROM leaves',
+        f'''
+        INSERT INTO {table} (rowid, reason)
+        SELECT -id, reason FROM balance_ledger WHERE kind = 'adjustment' AND reason != ''
+        ''',
+        f"INSERT INTO {table} ({table}) VALUES ('optimize')",
+    ]
+
+# Whole words are looked up stemmed in reason_search. Porter stems are not
+# prefixes of the words they came from ("wedding" is stored as "wed"), so a
+# prefix search there misses whenever the typed prefix runs past the stem;
+# prefix terms go to reason_prefix, which keeps the words as written.
+SEARCH_INDEXES = [
+    ('reason_search', 'porter unicode61 remove_diacritics 2', 'search'),
+    ('reason_prefix', 'unicode61 remove_diacritics 2', 'prefix'),
+]
+
+# Migration 14: the same events as index_schema(), counted in table_versions.
+# Bumping on every insert made cursors stale under normal traffic; migration
+# 16 drops these again (DROP_SEARCH_VERSION).
+SEARCH_VERSION_SCHEMA = [
+    "INSERT OR IGNORE INTO table_versions (name, version) VALUES ('reason_search', 0)",
+] + [
+    f'''
+    CREATE TRIGGER IF NOT EXISTS trg_version_search_{name} {event}
+    BEGIN
+        UPDATE table_versions SET version = version + 1 WHERE name = 'reason_search';
+    END
+    '''
+    for name, event in [
+        ('leaves_insert', 'AFTER INSERT ON leaves'),
+        ('leaves_update', 'AFTER UPDATE OF id, reason ON leaves'),
+        ('leaves_delete', 'AFTER DELETE ON leaves'),
+        ('ledger_insert', "AFTER INSERT ON balance_ledger WHEN NEW.kind = 'adjustment' AND NEW.reason != ''"),
+        ('ledger_delete', "AFTER DELETE ON balance_ledger WHEN OLD.kind = 'adjustment' AND OLD.reason != ''"),
+    ]
+]
+
+DROP_SEARCH_VERSION = [
+    f'DROP TRIGGER IF EXISTS trg_version_search_{name}'
+    for name in ('leaves_insert', 'leaves_update', 'leaves_delete', 'ledger_insert', 'ledger_delete')
+] + [
+    "DELETE FROM table_versions WHERE name = 'reason_search'",
+]
+
+def create_search_index(conn):
+    table, tokenize, tag = SEARCH_INDEXES[0]
+    for statement in index_schema(table, tokenize, tag) + index_existing(table):
+        conn.execute(statement)
+
+def create_prefix_index(conn):
+    table, tokenize, tag = SEARCH_INDEXES[1]
+    for statement in index_schema(table, tokenize, tag) + index_existing(table):
+        conn.execute(statement)
+
+def create_search_version(conn):
+    for statement in SEARCH_VERSION_SCHEMA:
+        conn.execute(statement)
+
+def drop_search_version(conn):
+    for statement in DROP_SEARCH_VERSION:
+        conn.execute(statement)
+
+def rebuild_search_index(conn):
+    # Re-indexes everything from leaves and balance_ledger; the caller commits.
+    for table, _, _ in SEARCH_INDEXES:
+        conn.execute(f"INSERT INTO {table} ({table}) VALUES ('delete-all')")
+        for statement in index_existing(table):
+            conn.execute(statement)
+
+SEARCH_SOURCES = ('leave', 'adjustment')
+
+# Candidates per source: (doc_id, score) only, newest first, from whichever
+# index the query has terms for (see match_expressions). The joins are added
+# only when a filter needs them.
+LEAVE_CANDIDATES = '''
+    SELECT * FROM (
+        SELECT {table}.rowid as doc_id, bm25({table}) as score
+        FROM {table}{joins}
+        WHERE {table} MATCH :query AND {table}.rowid > 0{where}
+        ORDER BY {table}.rowid DESC LIMIT :candidates)
+'''
+LEAVE_JOINS = '''
+        JOIN leaves ON leaves.id = {table}.rowid
+        JOIN users ON users.id = leaves.user_id'''
+
+ADJUSTMENT_CANDIDATES = '''
+    SELECT * FROM (
+        SELECT {table}.rowid as doc_id, bm25({table}) as score
+        FROM {table}{joins}
+        WHERE {table} MATCH :query AND {table}.rowid < 0{where}
+        ORDER BY {table}.rowid LIMIT :candidates)
+'''
+ADJUSTMENT_JOINS = '''
+        JOIN balance_ledger ON balance_ledger.id = -{table}.rowid
+        JOIN users ON users.id = balance_ledger.user_id'''
+
+# Prefix terms alongside whole words narrow the stemmed matches.
+PREFIX_FILTER = ' AND +reason_search.rowid IN (SELECT rowid FROM reason_prefix WHERE reason_prefix MATCH :prefixes)'
+
+# Only the page being returned is joined for display. A following page
+# resumes after the cursor document's current score (NULL, so no rows, if it
+# is no longer a candidate). most_matches is the
+# larger of the two sources' candidate counts, to tell whether either hit the
+# cap.
+SEARCH_PAGE = '''
+    WITH candidates AS MATERIALIZED ({candidates}),
+    ranked AS (
+        SELECT * FROM candidates{keyset}
+        ORDER BY score, doc_id
+        LIMIT :limit
+    )
+    SELECT (SELECT MAX(matches) FROM (SELECT COUNT(*) as matches FROM candidates GROUP BY doc_id > 0))
+               as most_matches,
+           ranked.doc_id, ranked.score,
+           CASE WHEN ranked.doc_id > 0 THEN 'leave' ELSE 'adjustment' END as source,
+           IFNULL(leaves.id, balance_ledger.id) as id, users.id as user_id, users.username, users.department,
+           IFNULL(leaves.start_date, balance_ledger.entry_date) as date, leaves.end_date, leaves.status,
+           leaves.leave_type, IFNULL(leaves.days, balance_ledger.delta) as days,
+           IFNULL(leaves.reason, balance_ledger.reason) as reason
+    FROM ranked
+    LEFT JOIN leaves ON ranked.doc_id > 0 AND leaves.id = ranked.doc_id
+    LEFT JOIN balance_ledger ON ranked.doc_id < 0 AND balance_ledger.id = -ranked.doc_id
+    JOIN users ON users.id = IFNULL(leaves.user_id, balance_ledger.user_id)
+    ORDER BY ranked.score, ranked.doc_id
+'''
+
+KEYSET = ' WHERE (score, doc_id) > ((SELECT score FROM candidates WHERE doc_id = :after_doc), :after_doc)'
+
+def match_expressions(text):
+    # Turns free text into FTS5 queries that cannot be a syntax error: every
+    # word must match, quoted so operators and punctuation are taken
+    # literally. Returns (words, prefixes): the whole words, for
+    # reason_search, and the words ending in * as prefix searches, for
+    # reason_prefix; either is None if there are none.
+    words, prefixes = [], []
+    for word, star in re.findall(r'(\w+)(\*?)', text):
+        if star:
+            prefixes.append(f'"{word}"*')
+        else:
+            words.append(f'"{word}"')
+    return ' '.join(words) or None, ' '.join(prefixes) or None
+
+def search_reasons(conn, text, department=None, status=None, date_from=None, date_to=None,
+                   sources=SEARCH_SOURCES, after=None, page_size=PAGE_SIZE, candidates=SEARCH_CANDIDATES):
+    # Best matches first (bm25; lower scores rank higher). Returns (rows,
+    # next_cursor, truncated, restarted); pass next_cursor back as after for
+    # the following page. truncated means a source had more than candidates
+    # matches and only its newest were ranked. restarted means the cursor's
+    # document no longer matches, so the first page was returned instead.
+    # status and the date range apply
+    # to leaves by their dates and to adjustments by the day they were
+    # posted; adjustments have no status, so they are left out when status is
+    # given.
+    words, prefixes = match_expressions(text)
+    if words is None and prefixes is None:
+        return [], None, False, False
+    # Ranked on the stemmed index when there are whole words, otherwise on
+    # the prefix index alone.
+    table = 'reason_search' if words is not None else 'reason_prefix'
+    also = PREFIX_FILTER if words is not None and prefixes is not None else ''
+    params = {'query': words or prefixes, 'prefixes': prefixes, 'department': department, 'status': status, 'limit': page_size + 1,
+              'candidates': -1 if candidates is None else candidates}
+    common = ' AND users.department = :department' if department is not None else ''
+    branches = []
+    if 'leave' in sources:
+        where = common
+        if status is not None:
+            where += ' AND leaves.status = :status'
+        if date_to is not None:
+            where += ' AND leaves.start_day <= :day_to'
+        if date_from is not None:
+            where += ' AND leaves.end_day >= :day_from'
+        joins = LEAVE_JOINS.format(table=table) if where else ''
+        branches.append(LEAVE_CANDIDATES.format(table=table, joins=joins, where=where + also))
+    if 'adjustment' in sources and status is None:
+        where = common
+        if date_to is not None:
+            where += ' AND balance_ledger.entry_date <= :date_to'
+        if date_from is not None:
+            where += ' AND balance_ledger.entry_date >= :date_from'
+        joins = ADJUSTMENT_JOINS.format(table=table) if where else ''
+        branches.append(ADJUSTMENT_CANDIDATES.format(table=table, joins=joins, where=where + also))
+    if not branches:
+        return [], None, False, False
+    if date_from is not None:
+        params['date_from'], params['day_from'] = str(date_from), day_number(date_from)
+    if date_to is not None:
+        params['date_to'], params['day_to'] = str(date_to), day_number(date_to)
+
+    candidates_sql = ' UNION ALL '.join(branches)
+    rows, restarted = [], False
+    if after is not None:
+        params['after_doc'] = after
+        rows = conn.execute(SEARCH_PAGE.format(candidates=candidates_sql, keyset=KEYSET), params).fetchall()
+        # A cursor is only handed out when a row follows it, so an empty page
+        # means the results changed under it.
+        restarted = not rows
+    if after is None or restarted:
+        rows = conn.execute(SEARCH_PAGE.format(candidates=candidates_sql, keyset=''), params).fetchall()
+    restarted = restarted and bool(rows)
+    truncated = bool(rows) and candidates is not None and rows[0]['most_matches'] >= candidates
+    if len(rows) <= page_size:
+        return rows, None, truncated, restarted
+    rows = rows[:page_size]
+    return rows, rows[-1]['doc_id'], truncated, restarted
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Search leave reasons and adjustment notes.")
+    parser.add_argument('query', nargs='?', help="words to search for; end a word with * for a prefix")
+    parser.add_argument('--department')
+    parser.add_argument('--status', choices=['pending', 'approved', 'rejected'])
+    parser.add_argument('--from', dest='date_from', help="ISO date")
+    parser.add_argument('--to', dest='date_to', help="ISO date")
+    parser.add_argument('--limit', type=int, default=PAGE_SIZE)
+    parser.add_argument('--all', action='store_true',
+                        help=f"rank every match, not just the newest {SEARCH_CANDIDATES} of each kind")
+    parser.add_argument('--rebuild', action='store_true', help="re-index every reason first")
+    args = parser.parse_args(argv)
+    if args.query is None and not args.rebuild:
+        parser.error("give a query or --rebuild")
+
+    from database import get_db_connection, init_db
+    init_db()
+    conn = get_db_connection()
+    if conn is None:
+        print("Unable to connect to the database")
+        return 1
+    try:
+        if args.rebuild:
+            started = time.perf_counter()
+            rebuild_search_index(conn)
+            conn.commit()
+            print(f"Rebuilt the search index in {time.perf_counter() - started:.2f}s")
+        if args.query is not None:
+            started = time.perf_counter()
+            rows, more, truncated, _ = search_reasons(conn, args.query, args.department, args.status, args.date_from,
+                                                   args.date_to, page_size=args.limit,
+                                                   candidates=None if args.all else SEARCH_CANDIDATES)
+            elapsed = time.perf_counter() - started
+            for row in rows:
+                print(f"{row['score']:>8.2f}  {row['source']:<10} {row['date']}  {row['username']:<16} "
+                      f"{row['status'] or '':<9} {row['reason']}")
+            print(f"{len(rows)} results{' (more available)' if more else ''} in {elapsed * 1000:.1f} ms")
+            if truncated:
+                print(f"Ranked among the newest {SEARCH_CANDIDATES} matches of each kind; use --all to rank every match")
+        return 0
+    except sqlite3.Error as e:
+        conn.rollback()
+        print(f"Search failed: {e}")
+        return 1
+    finally:
+        conn.close()
+
+if __name__ == "__main__":
+    sys.exit(main())
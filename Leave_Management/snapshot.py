@@ -0,0 +1,106 @@
+import os
+import sqlite3
+import threading
+import time
+
+
+class AnalyticsSnapshot:
+    # A read-only copy of the live database for the admin analytics pages.
+    # refresh() copies the live file with the SQLite online backup API into a
+    # temporary file and atomically swaps it into place, so long aggregate
+    # scans read the copy and never hold up leave writes on the live file.
+    def __init__(self, path, max_age):
+        self.path = path
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        self._refreshing = False
+        self.taken_at = os.path.getmtime(path) if os.path.exists(path) else None
+        self.versions = None
+        self.stats = {'refreshes': 0, 'failures': 0, 'last_duration': None, 'last_error': None}
+
+    def age(self):
+        if self.taken_at is None:
+            return None
+        return time.time() - self.taken_at
+
+    def is_expired(self):
+        age = self.age()
+        return age is None or age > self.max_age
+
+    def refresh(self, source):
+        # source is an open connection to the live database. The backup runs
+        # as a single step, i.e. one read transaction: under WAL that never
+        # blocks writers, and it cannot be restarted by writes landing mid-copy.
+        with self._lock:
+            started = time.perf_counter()
+            tmp_path = f"{self.path}.tmp"
+            try:
+                dest = sqlite3.connect(tmp_path)
+                try:
+                    source.backup(dest)
+                    # The copy is never written again; a rollback journal
+                    # avoids -wal/-shm files next to a read-only file.
+                    dest.execute('PRAGMA journal_mode = DELETE')
+                    versions = dict(dest.execute('SELECT name, version FROM table_versions').fetchall())
+                finally:
+                    dest.close()
+                os.replace(tmp_path, self.path)
+            except (sqlite3.Error, OSError) as e:
+                self.stats['failures'] += 1
+                self.stats['last_error'] = str(e)
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                raise
+            self.taken_at = time.time()
+            self.versions = versions
+            self.stats['refreshes'] += 1
+            self.stats['last_duration'] = time.perf_counter() - started
+            self.stats['last_error'] = None
+
+    def refresh_in_background(self, connect, on_refresh=None):
+        # connect() returns a source connection; it is closed afterwards.
+        with self._lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+
+        def run():
+            try:
+                source = connect()
+                if source is None:
+                    return
+                try:
+                    self.refresh(source)
+                finally:
+                    source.close()
+                if on_refresh is not None:
+                    on_refresh()
+            except (sqlite3.Error, OSError) as e:
+                print(f"Error refreshing analytics snapshot: {e}")
+            finally:
+                self._refreshing = False
+
+        threading.Thread(target=run, name='analytics-snapshot', daemon=True).start()
+
+    def connect(self):
+        # immutable=1: the file is only ever replaced, never modified in
+        # place, so SQLite can skip locking entirely.
+        conn = sqlite3.connect(f"file:{self.path}?mode=ro&immutable=1", uri=True, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def get_info(self, live_versions=None):
+        if self.versions is None and self.taken_at is not None:
+            try:
+                conn = self.connect()
+                try:
+                    self.versions = dict(conn.execute('SELECT name, version FROM table_versions').fetchall())
+                finally:
+                    conn.close()
+            except sqlite3.Error:
+                pass
+        behind = None
+        if live_versions is not None and self.versions is not None:
+            behind = sum(max(0, version - self.versions.get(name, 0)) for name, version in live_versions.items())
+        return dict(self.stats, path=self.path, taken_at=self.taken_at, age=self.age(), max_age=self.max_age,
+                    refreshing=self._refreshing, changes_behind=behind)
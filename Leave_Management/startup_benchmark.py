@@ -0,0 +1,206 @@
+import argparse
+import json
+import os
+import platform
+import re
+import shutil
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+# Cold-start benchmark for the Streamlit entry points. Every sample runs in a
+# fresh interpreter under `python -X importtime`: the child imports Streamlit's
+# AppTest, then renders one page of an entry point and reports the time to
+# first render. Imports logged after AppTest itself is loaded are the ones the
+# page pulled in, and the slowest of them are listed by cumulative time:
+#
+#   python startup_benchmark.py -o before.json
+#   python startup_benchmark.py -o after.json --compare before.json
+#
+# The Leave Management pages run against a scratch copy of the database
+# (LEAVE_DB_PATH), so migrations and sessions never touch the real one.
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+LEAVE_APP = os.path.join(HERE, 'app.py')
+HR_DASHBOARD = os.path.join(os.path.dirname(HERE), 'HR_Dashboard', 'dashboard.py')
+
+MARKER = '-- startup benchmark: app imports follow --'
+IMPORT_LINE = re.compile(r'import time:\s+(\d+) \|\s+(\d+) \|( +)(\S+)')
+
+def _targets(username):
+    # name -> (script, session state)
+    targets = {
+        'leave: login': (LEAVE_APP, {}),
+        'leave: admin': (LEAVE_APP, {'is_authenticated': True, 'is_admin': True, 'username': 'admin'}),
+        'hr: home': (HR_DASHBOARD, {}),
+    }
+    if username:
+        targets['leave: user'] = (LEAVE_APP, {'is_authenticated': True, 'is_admin': False, 'username': username})
+    return targets
+
+def _child(script, state):
+    # Runs inside the sampled interpreter; prints one JSON line on stdout.
+    started = time.perf_counter()
+    from streamlit.testing.v1 import AppTest
+    streamlit_ms = (time.perf_counter() - started) * 1000
+    sys.stderr.write(MARKER + '\n')
+    sys.stderr.flush()
+
+    directory = os.path.dirname(script)
+    os.chdir(directory)
+    sys.path.insert(0, directory)
+    before = len(sys.modules)
+    started = time.perf_counter()
+    at = AppTest.from_file(script, default_timeout=120)
+    for key, value in state.items():
+        at.session_state[key] = value
+    at.run()
+    render_ms = (time.perf_counter() - started) * 1000
+    print(json.dumps({
+        'streamlit_import_ms': streamlit_ms,
+        'first_render_ms': render_ms,
+        'modules_loaded': len(sys.modules) - before,
+        'errors': [str(e.value) for e in at.exception],
+    }))
+    return 0
+
+def _page_imports(stderr):
+    # Top-level modules imported after MARKER -> cumulative milliseconds.
+    _, _, tail = stderr.partition(MARKER)
+    imports = {}
+    for line in tail.splitlines():
+        match = IMPORT_LINE.match(line)
+        if match and len(match.group(3)) == 1:
+            name = match.group(4)
+            imports[name] = imports.get(name, 0) + int(match.group(2)) / 1000
+    return imports
+
+def sample(script, state, db_path):
+    env = dict(os.environ, LEAVE_DB_PATH=db_path)
+    proc = subprocess.run([sys.executable, '-X', 'importtime', os.path.abspath(__file__),
+                           '--child', script, json.dumps(state)],
+                          capture_output=True, text=True, env=env)
+    lines = proc.stdout.strip().splitlines()
+    if proc.returncode != 0 or not lines:
+        tail = proc.stderr.strip().splitlines()[-5:]
+        raise RuntimeError(f"{os.path.basename(script)} failed to start: " + ' / '.join(tail))
+    result = json.loads(lines[-1])
+    result['imports'] = _page_imports(proc.stderr)
+    return result
+
+def run_benchmarks(db_path, repeat, only=None, top=8):
+    username = _sample_username(db_path)
+    results = {}
+    for name, (script, state) in _targets(username).items():
+        if only and not any(part in name for part in only):
+            continue
+        samples = [sample(script, state, db_path) for _ in range(repeat)]
+        renders = sorted(s['first_render_ms'] for s in samples)
+        imports = {}
+        for s in samples:
+            for module, ms in s['imports'].items():
+                imports.setdefault(module, []).append(ms)
+        slowest = sorted(((module, statistics.median(times)) for module, times in imports.items()),
+                         key=lambda item: -item[1])[:top]
+        results[name] = {
+            'runs': len(samples),
+            'median_ms': round(statistics.median(renders), 3),
+            'min_ms': round(renders[0], 3),
+            'import_ms': round(statistics.median(sum(s['imports'].values()) for s in samples), 3),
+            'streamlit_import_ms': round(statistics.median(s['streamlit_import_ms'] for s in samples), 3),
+            'modules_loaded': samples[-1]['modules_loaded'],
+            'errors': samples[-1]['errors'],
+            'top_imports': [[module, round(ms, 3)] for module, ms in slowest],
+        }
+        result = results[name]
+        print(f"{name:<16} first render {result['median_ms']:>9.1f} ms, imports {result['import_ms']:>8.1f} ms, "
+              f"{result['modules_loaded']:>5} modules" + (' ERRORS' if result['errors'] else ''), file=sys.stderr)
+        for module, ms in result['top_imports']:
+            print(f"    {module:<32} {ms:>8.1f} ms", file=sys.stderr)
+    return results
+
+def _sample_username(db_path):
+    conn = sqlite3.connect(db_path)
+    try:
+        row = conn.execute('SELECT username FROM users WHERE is_admin = 0 ORDER BY id LIMIT 1').fetchone()
+    except sqlite3.Error:
+        row = None
+    finally:
+        conn.close()
+    return row[0] if row else None
+
+def _metadata(source):
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                cwd=HERE).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        'commit': commit,
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'database': os.path.abspath(source) if source else None,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+    }
+
+def compare(current, baseline, threshold, min_delta_ms):
+    # Same rule as benchmark.py: slower than threshold x baseline by more than
+    # min_delta_ms, on the median time to first render.
+    regressions = []
+    for name, result in current['results'].items():
+        before = baseline['results'].get(name)
+        if before is None or not before['median_ms']:
+            continue
+        ratio = result['median_ms'] / before['median_ms']
+        regressed = ratio > threshold and result['median_ms'] - before['median_ms'] > min_delta_ms
+        flag = 'REGRESSION' if regressed else ''
+        print(f"{name:<16} {before['median_ms']:>10.1f} -> {result['median_ms']:>10.1f} ms  x{ratio:.2f} {flag}")
+        if regressed:
+            regressions.append(name)
+    return regressions
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if argv[:1] == ['--child']:
+        return _child(argv[1], json.loads(argv[2]))
+
+    parser = argparse.ArgumentParser(description="Measure cold-start time of the Streamlit entry points.")
+    parser.add_argument('--db', help="database to copy for the Leave Management pages (default: config.DB_PATH)")
+    parser.add_argument('-o', '--output', help="write JSON results here (default: stdout)")
+    parser.add_argument('--repeat', type=int, default=3, help="fresh interpreters per page")
+    parser.add_argument('--only', nargs='*', help="only pages whose name contains one of these")
+    parser.add_argument('--top', type=int, default=8, help="slowest page imports to report")
+    parser.add_argument('--compare', help="baseline JSON to compare against")
+    parser.add_argument('--threshold', type=float, default=1.25, help="slowdown ratio counted as a regression")
+    parser.add_argument('--min-delta-ms', type=float, default=100.0, help="ignore slowdowns smaller than this")
+    args = parser.parse_args(argv)
+
+    from config import DB_PATH
+    source = args.db or DB_PATH
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, 'startup.db')
+        if os.path.exists(source):
+            shutil.copyfile(source, db_path)
+        elif args.db:
+            parser.error(f"{args.db} does not exist")
+        results = run_benchmarks(db_path, args.repeat, args.only, args.top)
+    report = {'meta': _metadata(source if os.path.exists(source) else None), 'results': results}
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        return 1 if compare(report, baseline, args.threshold, args.min_delta_ms) else 0
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
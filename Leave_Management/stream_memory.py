@@ -0,0 +1,147 @@
+import argparse
+import gc
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+# Peak memory of reading every leave with the list-returning get_all_leaves()
+# versus the streaming helpers and exports in database.py / bulk.py, at
+# growing table sizes. Every measurement runs in a fresh interpreter on a
+# scratch database built by generate_data.py, and reports how far peak RSS
+# rose above the RSS after imports:
+#
+#   python stream_memory.py --sizes 25000 100000 400000
+#
+# The streaming modes should stay flat as the table grows while fetchall grows
+# with it; the script exits 1 if any streaming mode grows by more than
+# --tolerance-mb between the smallest and largest size.
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+MODES = ['fetchall', 'rows', 'pandas', 'arrow', 'csv export', 'parquet export']
+STREAMING = MODES[1:]
+
+def _status_kb(field):
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith(field + ':'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+def _reset_peak():
+    # Linux resets VmHWM to the current RSS when 5 is written to clear_refs.
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return True
+    except OSError:
+        return False
+
+def _peak_kb():
+    peak = _status_kb('VmHWM')
+    return peak if peak is not None else resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+def _child(mode, path, chunk_size):
+    # Memory-mapped database pages count towards RSS but are file-backed and
+    # reclaimable, and SQLite's page cache fills up to cache_size on larger
+    # files whatever the caller does. Both are switched off/down so the peak
+    # reflects the Python objects the read itself keeps alive.
+    import config
+    config.SQLITE_PRAGMAS['mmap_size'] = 0
+    config.SQLITE_PRAGMAS['cache_size'] = -1000
+    import pandas
+    import pyarrow.parquet
+    import database
+    import bulk
+    database.close_pool()
+    database.DB_PATH = path
+    database.init_db()
+
+    gc.collect()
+    exact = _reset_peak()
+    before = _status_kb('VmRSS') if exact else _peak_kb()
+    started = time.perf_counter()
+    with tempfile.TemporaryDirectory() as tmp:
+        if mode == 'fetchall':
+            rows = len(database.get_all_leaves())
+        elif mode == 'rows':
+            rows = sum(1 for _ in database.iter_leaves(chunk_size=chunk_size))
+        elif mode == 'pandas':
+            rows = sum(len(frame) for frame in database.iter_leave_chunks(chunk_size=chunk_size))
+        elif mode == 'arrow':
+            rows = sum(batch.num_rows for batch in database.iter_leave_chunks(chunk_size=chunk_size,
+                                                                               format='arrow'))
+        elif mode == 'csv export':
+            rows = bulk.export_rows('leaves', os.path.join(tmp, 'leaves.csv'), chunk_size)
+        else:
+            rows = bulk.export_rows('leaves', os.path.join(tmp, 'leaves.parquet'), chunk_size)
+    elapsed = time.perf_counter() - started
+    peak = _peak_kb()
+    database.close_pool()
+    print(json.dumps({'rows': rows, 'peak_mb': max(peak - before, 0) / 1024, 'seconds': elapsed, 'exact': exact}))
+    return 0
+
+def measure(mode, path, chunk_size):
+    proc = subprocess.run([sys.executable, os.path.abspath(__file__), '--child', mode, path, str(chunk_size)],
+                          capture_output=True, text=True)
+    lines = proc.stdout.strip().splitlines()
+    if proc.returncode != 0 or not lines:
+        raise RuntimeError(f"{mode} failed: " + ' / '.join(proc.stderr.strip().splitlines()[-3:]))
+    return json.loads(lines[-1])
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if argv[:1] == ['--child']:
+        return _child(argv[1], argv[2], int(argv[3]))
+
+    parser = argparse.ArgumentParser(description="Peak RSS of whole-table reads, list vs streaming.")
+    parser.add_argument('--sizes', type=int, nargs='+', default=[25000, 100000, 200000],
+                        help="leave rows in each scratch database")
+    parser.add_argument('--chunk-size', type=int, default=5000)
+    parser.add_argument('--modes', nargs='+', choices=MODES, default=MODES)
+    parser.add_argument('--tolerance-mb', type=float, default=8.0,
+                        help="allowed peak growth of a streaming mode from smallest to largest size")
+    args = parser.parse_args(argv)
+    sizes = sorted(args.sizes)
+
+    results = {mode: {} for mode in args.modes}
+    with tempfile.TemporaryDirectory() as tmp:
+        for size in sizes:
+            path = os.path.join(tmp, f"leaves-{size}.db")
+            print(f"Generating {size} leaves...", file=sys.stderr)
+            subprocess.run([sys.executable, os.path.join(HERE, 'generate_data.py'), path,
+                            '--users', str(max(size // 20, 100)), '--leaves', str(size)],
+                           check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            for mode in args.modes:
+                results[mode][size] = measure(mode, path, args.chunk_size)
+            os.remove(path)
+
+    print(f"\nPeak RSS above baseline (MB), chunk size {args.chunk_size}:")
+    print(f"{'mode':<16}" + ''.join(f"{size:>12}" for size in sizes) + f"{'growth':>10}")
+    failures = []
+    for mode in args.modes:
+        peaks = [results[mode][size]['peak_mb'] for size in sizes]
+        growth = peaks[-1] - peaks[0]
+        flag = ''
+        if mode in STREAMING and growth > args.tolerance_mb:
+            failures.append(mode)
+            flag = '  NOT FLAT'
+        print(f"{mode:<16}" + ''.join(f"{peak:>12.1f}" for peak in peaks) + f"{growth:>10.1f}{flag}")
+    rates = ', '.join(f"{mode} {results[mode][sizes[-1]]['rows'] / results[mode][sizes[-1]]['seconds']:,.0f}"
+                      for mode in args.modes)
+    print(f"\nRows/second at {sizes[-1]} rows: {rates}")
+    if not all(result['exact'] for by_size in results.values() for result in by_size.values()):
+        print("(peak RSS could not be reset per run; figures are upper bounds)")
+    for mode in failures:
+        print(f"FAIL: {mode} peak grew by more than {args.tolerance_mb:.0f} MB")
+    return 1 if failures else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
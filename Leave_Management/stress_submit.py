@@ -0,0 +1,119 @@
+import argparse
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from datetime import date, timedelta
+import database
+from config import TOTAL_LEAVES_PER_YEAR
+from ledger import reconcile
+
+# Concurrency stress test for database.submit_leave(). Many threads submit
+# overlapping leave requests for a small set of users against a scratch
+# database, then the result is checked: no user has overlapping pending or
+# approved leaves, every balance equals the allowance minus the days actually
+# booked, and every balance matches the balance ledger.
+
+def run(threads, requests_per_thread, users, seed):
+    rng = random.Random(seed)
+    conn = database.get_db_connection()
+    # add_user() pro-rates the allowance by join date; give everyone a full
+    # year so the run is not dominated by balance rejections.
+    conn.executemany('''
+        INSERT INTO users (username, password, department, remaining_leaves, allowance)
+        VALUES (?, 'pw', 'IT', ?, ?)
+    ''', [(f"stress{i}", TOTAL_LEAVES_PER_YEAR, TOTAL_LEAVES_PER_YEAR) for i in range(users)])
+    conn.commit()
+    user_ids = [row['id'] for row in conn.execute("SELECT id FROM users WHERE username LIKE 'stress%'")]
+    conn.close()
+    database.invalidate_cache('users')
+
+    base = date(2030, 1, 1)
+    plans = [[(rng.choice(user_ids), base + timedelta(days=rng.randrange(60)), rng.randrange(1, 5))
+              for _ in range(requests_per_thread)] for _ in range(threads)]
+    outcomes = {'accepted': 0, 'rejected': 0, 'errors': 0}
+    lock = threading.Lock()
+    barrier = threading.Barrier(threads)
+
+    def worker(plan):
+        barrier.wait()
+        for user_id, start, length in plan:
+            ok, message = database.submit_leave(user_id, start, start + timedelta(days=length - 1),
+                                                "stress", "Annual Leave")
+            key = 'accepted' if ok else ('errors' if message.startswith('Error') else 'rejected')
+            with lock:
+                outcomes[key] += 1
+
+    workers = [threading.Thread(target=worker, args=(plan,)) for plan in plans]
+    started = time.perf_counter()
+    for t in workers:
+        t.start()
+    for t in workers:
+        t.join()
+    elapsed = time.perf_counter() - started
+    return outcomes, elapsed
+
+def check_invariants():
+    conn = database.get_db_connection()
+    try:
+        problems = []
+        overlaps = conn.execute('''
+            SELECT COUNT(*) FROM leaves a JOIN leaves b
+              ON a.user_id = b.user_id AND a.id < b.id
+             AND a.start_date <= b.end_date AND b.start_date <= a.end_date
+            WHERE a.status IN ('pending', 'approved') AND b.status IN ('pending', 'approved')
+        ''').fetchone()[0]
+        if overlaps:
+            problems.append(f"{overlaps} overlapping leave pairs")
+        drift = conn.execute('''
+            SELECT COUNT(*) FROM users
+            WHERE remaining_leaves != allowance - IFNULL((
+                SELECT SUM(days)
+                FROM leaves WHERE leaves.user_id = users.id), 0)
+               OR remaining_leaves < 0
+        ''').fetchone()[0]
+        if drift:
+            problems.append(f"{drift} users with a balance that does not match their leaves")
+        unreconciled = len(reconcile(conn))
+        if unreconciled:
+            problems.append(f"{unreconciled} users with a balance that does not match the ledger")
+        return problems
+    finally:
+        conn.close()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Concurrency stress test for submit_leave().")
+    parser.add_argument('--threads', type=int, default=200)
+    parser.add_argument('--requests', type=int, default=20, help="requests per thread")
+    parser.add_argument('--users', type=int, default=50)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        database.close_pool()
+        database.DB_PATH = os.path.join(tmp, 'stress.db')
+        database.init_db()
+        try:
+            outcomes, elapsed = run(args.threads, args.requests, args.users, args.seed)
+            writer = database.get_writer_stats()
+            problems = check_invariants()
+        finally:
+            database.close_pool()
+
+    total = sum(outcomes.values())
+    print(f"{total} submissions from {args.threads} threads in {elapsed:.2f}s "
+          f"({total / elapsed:.0f}/s): {outcomes['accepted']} accepted, "
+          f"{outcomes['rejected']} rejected, {outcomes['errors']} errors")
+    print(f"Writer: {writer['batches']} commits, {writer['avg_batch']:.1f} writes/commit "
+          f"(max {writer['max_batch']}), commit p50 {writer['commit_ms_p50']:.2f} ms, "
+          f"write latency p50/p95 {writer['latency_ms_p50']:.1f}/{writer['latency_ms_p95']:.1f} ms")
+    for problem in problems:
+        print(f"FAIL: {problem}")
+    if not problems and not outcomes['errors']:
+        print("OK: no overlaps, balances consistent")
+    return 1 if problems or outcomes['errors'] else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,74 @@
+import sqlite3
+import pytest
+from search import create_search_index, create_prefix_index, search_reasons
+
+# Just the columns search.py reads; run with python -m pytest from this folder.
+SCHEMA = [
+    'CREATE TABLE users (id INTEGER PRIMARY KEY, username TEXT, department TEXT)',
+    '''
+    CREATE TABLE leaves (
+        id INTEGER PRIMARY KEY, user_id INTEGER, start_date TEXT, end_date TEXT, start_day INTEGER,
+        end_day INTEGER, reason TEXT, status TEXT, leave_type TEXT, days INTEGER
+    )
+    ''',
+    '''
+    CREATE TABLE balance_ledger (
+        id INTEGER PRIMARY KEY, user_id INTEGER, entry_date TEXT, kind TEXT, delta INTEGER, reason TEXT
+    )
+    ''',
+    'CREATE TABLE table_versions (name TEXT PRIMARY KEY, version INTEGER NOT NULL DEFAULT 0)',
+]
+
+REASONS = ['Wedding', 'Sister\'s weddings', 'Wednesday appointment', 'Visa appointment']
+
+@pytest.fixture
+def conn():
+    conn = sqlite3.connect(':memory:')
+    conn.row_factory = sqlite3.Row
+    for statement in SCHEMA:
+        conn.execute(statement)
+    create_search_index(conn)
+    create_prefix_index(conn)
+    conn.execute("INSERT INTO users VALUES (1, 'alice', 'IT')")
+    for reason in REASONS:
+        conn.execute("INSERT INTO leaves (user_id, start_date, end_date, reason, status, days) "
+                     "VALUES (1, '2024-01-01', '2024-01-01', ?, 'approved', 1)", (reason,))
+    conn.execute("INSERT INTO balance_ledger (user_id, entry_date, kind, delta, reason) "
+                 "VALUES (1, '2024-01-02', 'adjustment', 2, 'Wedding gift days')")
+    yield conn
+    conn.close()
+
+def reasons(conn, text):
+    rows = search_reasons(conn, text)[0]
+    return sorted(row['reason'] for row in rows)
+
+def test_prefix_longer_than_stem(conn):
+    # "wedding" is indexed as the stem "wed"; the prefix must still match.
+    assert reasons(conn, 'wedd*') == ['Sister\'s weddings', 'Wedding', 'Wedding gift days']
+
+def test_whole_words_are_stemmed(conn):
+    assert reasons(conn, 'weddings') == ['Sister\'s weddings', 'Wedding', 'Wedding gift days']
+
+def test_prefix_with_words(conn):
+    assert reasons(conn, 'wed* appointment') == ['Wednesday appointment']
+    assert reasons(conn, 'sister wedd*') == ['Sister\'s weddings']
+
+def add_leave(conn, reason):
+    conn.execute("INSERT INTO leaves (user_id, start_date, end_date, reason, status, days) "
+                 "VALUES (1, '2024-02-01', '2024-02-01', ?, 'approved', 1)", (reason,))
+
+def test_cursor_survives_new_leaves(conn):
+    first, after, _, _ = search_reasons(conn, 'wedding', page_size=1)
+    # A new match shifts every bm25 score; the next page still follows on.
+    add_leave(conn, 'Wedding')
+    second, _, _, restarted = search_reasons(conn, 'wedding', after=after, page_size=1)
+    assert not restarted
+    ranking = [row['doc_id'] for row in search_reasons(conn, 'wedding')[0]]
+    assert second[0]['doc_id'] == ranking[ranking.index(first[0]['doc_id']) + 1]
+
+def test_cursor_restarts_when_its_result_is_gone(conn):
+    first, after, _, _ = search_reasons(conn, 'wedding', page_size=1)
+    conn.execute('DELETE FROM leaves WHERE id = ?', (after,))
+    rows, _, _, restarted = search_reasons(conn, 'wedding', after=after, page_size=1)
+    assert restarted
+    assert rows[0]['doc_id'] != after
@@ -0,0 +1,263 @@
+import json
+import re
+import sqlite3
+import sys
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from config import TRACE_ENABLED, TRACE_LOG, TRACE_BUFFER
+
+# Opt-in query and page instrumentation. When enabled, every pooled
+# connection handed out by database.get_db_connection() is attached here:
+#   - conn.cursor()/conn.execute() return a TracedCursor, which times each
+#     statement from execute() until its rows are exhausted and counts them;
+#   - the sqlite3 trace callback counts the statements SQLite actually runs
+#     (trigger bodies included) and the progress handler counts VM steps.
+# timed_page() wraps each dashboard page so queries are attributed to the page
+# that issued them. Records are kept in memory for the diagnostics page and
+# appended to TRACE_LOG as JSON lines.
+
+PROGRESS_STEP = 1000  # VM instructions per progress-handler call
+
+_enabled = TRACE_ENABLED
+_lock = threading.Lock()
+_local = threading.local()
+_queries = deque(maxlen=TRACE_BUFFER)
+_pages = defaultdict(lambda: deque(maxlen=TRACE_BUFFER))
+_log = None
+
+def is_enabled():
+    return _enabled
+
+def enable():
+    global _enabled
+    _enabled = True
+
+def disable():
+    global _enabled, _log
+    _enabled = False
+    with _lock:
+        if _log is not None:
+            _log.close()
+            _log = None
+
+def clear():
+    with _lock:
+        _queries.clear()
+        _pages.clear()
+
+def _write(record):
+    global _log
+    with _lock:
+        if record['type'] == 'query':
+            _queries.append(record)
+        else:
+            _pages[record['page']].append(record['ms'])
+        if TRACE_LOG:
+            if _log is None:
+                _log = open(TRACE_LOG, 'a', encoding='utf-8')
+            _log.write(json.dumps(record) + '\n')
+            _log.flush()
+
+def _normalize(sql):
+    return re.sub(r'\s+', ' ', sql).strip()
+
+
+class TracedCursor(sqlite3.Cursor):
+    _sql = None
+
+    def _begin(self, sql):
+        self._finish()
+        conn = self.connection
+        self._sql = sql
+        self._rows = 0
+        self._elapsed = 0.0
+        self._ticks = getattr(conn, 'trace_ticks', 0)
+        self._statements = getattr(conn, 'trace_statements', 0)
+
+    def _timed(self, method, *args):
+        started = time.perf_counter()
+        try:
+            return method(*args)
+        finally:
+            self._elapsed += time.perf_counter() - started
+
+    def _finish(self):
+        if self._sql is None:
+            return
+        conn = self.connection
+        rows = self._rows if self._rows or self.rowcount < 0 else self.rowcount
+        _write({
+            'type': 'query',
+            'ts': time.time(),
+            'page': getattr(_local, 'page', None),
+            'sql': _normalize(self._sql),
+            'ms': round(self._elapsed * 1000, 3),
+            'rows': rows,
+            'statements': getattr(conn, 'trace_statements', 0) - self._statements,
+            'vm_steps': (getattr(conn, 'trace_ticks', 0) - self._ticks) * PROGRESS_STEP,
+        })
+        self._sql = None
+
+    def execute(self, sql, parameters=()):
+        self._begin(sql)
+        return self._timed(super().execute, sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        self._begin(sql)
+        return self._timed(super().executemany, sql, seq_of_parameters)
+
+    def fetchone(self):
+        row = self._timed(super().fetchone)
+        if row is None:
+            self._finish()
+        elif self._sql is not None:
+            self._rows += 1
+        return row
+
+    def fetchmany(self, size=None):
+        size = self.arraysize if size is None else size
+        rows = self._timed(super().fetchmany, size)
+        if self._sql is not None:
+            self._rows += len(rows)
+        if len(rows) < size:
+            self._finish()
+        return rows
+
+    def fetchall(self):
+        rows = self._timed(super().fetchall)
+        if self._sql is not None:
+            self._rows += len(rows)
+        self._finish()
+        return rows
+
+    def __next__(self):
+        try:
+            row = self._timed(super().__next__)
+        except StopIteration:
+            self._finish()
+            raise
+        if self._sql is not None:
+            self._rows += 1
+        return row
+
+    def close(self):
+        self._finish()
+        super().close()
+
+    def __del__(self):
+        try:
+            self._finish()
+        except Exception:
+            pass
+
+
+def attach(conn):
+    # Called by database.get_db_connection() on every checkout.
+    if not _enabled:
+        if conn.traced_cursor is not None:
+            conn.traced_cursor = None
+            conn.set_trace_callback(None)
+            conn.set_progress_handler(None, PROGRESS_STEP)
+        return conn
+    if conn.traced_cursor is None:
+        conn.trace_ticks = 0
+        conn.trace_statements = 0
+
+        def on_progress():
+            conn.trace_ticks += 1
+            return 0
+
+        def on_statement(_sql):
+            conn.trace_statements += 1
+
+        conn.set_progress_handler(on_progress, PROGRESS_STEP)
+        conn.set_trace_callback(on_statement)
+        conn.traced_cursor = TracedCursor
+    return conn
+
+@contextmanager
+def timed_page(name):
+    if not _enabled:
+        yield
+        return
+    previous = getattr(_local, 'page', None)
+    _local.page = name
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        _local.page = previous
+        _write({'type': 'page', 'ts': time.time(), 'page': name,
+                'ms': round((time.perf_counter() - started) * 1000, 3)})
+
+
+def _percentile(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))]
+
+def slowest_queries(records=None, limit=20):
+    # Groups query records by SQL text; sorted by total time spent.
+    if records is None:
+        with _lock:
+            records = list(_queries)
+    groups = defaultdict(list)
+    for record in records:
+        groups[record['sql']].append(record)
+    report = []
+    for sql, items in groups.items():
+        durations = [item['ms'] for item in items]
+        report.append({
+            'sql': sql,
+            'calls': len(items),
+            'total_ms': round(sum(durations), 3),
+            'p50_ms': _percentile(durations, 0.5),
+            'p95_ms': _percentile(durations, 0.95),
+            'max_ms': max(durations),
+            'avg_rows': round(sum(item['rows'] for item in items) / len(items), 1),
+            'avg_vm_steps': round(sum(item['vm_steps'] for item in items) / len(items)),
+            'pages': sorted({item['page'] for item in items if item['page']}),
+        })
+    report.sort(key=lambda item: item['total_ms'], reverse=True)
+    return report[:limit]
+
+def page_percentiles(pages=None):
+    with _lock:
+        pages = {name: list(values) for name, values in _pages.items()} if pages is None else pages
+    report = []
+    for name, durations in sorted(pages.items()):
+        if not durations:
+            continue
+        report.append({
+            'page': name,
+            'renders': len(durations),
+            'p50_ms': _percentile(durations, 0.5),
+            'p90_ms': _percentile(durations, 0.9),
+            'p99_ms': _percentile(durations, 0.99),
+            'max_ms': max(durations),
+        })
+    return report
+
+def read_log(path=TRACE_LOG):
+    queries, pages = [], defaultdict(list)
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            record = json.loads(line)
+            if record['type'] == 'query':
+                queries.append(record)
+            else:
+                pages[record['page']].append(record['ms'])
+    return queries, pages
+
+if __name__ == "__main__":
+    path = sys.argv[1] if len(sys.argv) > 1 else TRACE_LOG
+    queries, pages = read_log(path)
+    print("Per-page render time (ms)")
+    for row in page_percentiles(pages):
+        print(f"  {row['page']:<36} n={row['renders']:<6} p50={row['p50_ms']:<10} "
+              f"p90={row['p90_ms']:<10} p99={row['p99_ms']:<10} max={row['max_ms']}")
+    print("\nSlowest queries by total time")
+    for row in slowest_queries(queries):
+        print(f"  {row['total_ms']:>10.1f} ms  calls={row['calls']:<6} p95={row['p95_ms']:<9} "
+              f"rows~{row['avg_rows']:<8} {row['sql'][:100]}")
@@ -1,60 +1,53 @@
 import streamlit as st
-import pandas as pd
-import plotly.express as px
-import plotly.graph_objects as go
-from database import get_db_connection, update_remaining_leaves, get_remaining_leaves
-from config import TOTAL_LEAVES_PER_YEAR, COLORSCHEME
-from datetime import datetime, timedelta
-import sqlite3
+from database import get_leaves_on, submit_leave, get_leave_breakdown, get_team_leaves, get_leaves_page, get_user_leave_type_counts
+from auth import current_user_context
+from pagination import current_cursor, pagination_controls
+from tracing import timed_page
+from config import COLORSCHEME
+from calendar_engine import leave_occupancy, to_days
+from datetime import date, datetime, timedelta
 
 def user_dashboard(username):
     st.title(f"Welcome, {username}!")
 
+    user = current_user_context(username)
+    if user is None:
+        st.error("User not found.")
+        return
+
     menu = ["Leave Summary", "Apply for Leave", "Leave History", "Team Calendar"]
     choice = st.sidebar.selectbox("Menu", menu)
 
-    if choice == "Leave Summary":
-        show_leave_summary(username)
-    elif choice == "Apply for Leave":
-        apply_for_leave(username)
-    elif choice == "Leave History":
-        show_leave_history(username)
-    elif choice == "Team Calendar":
-        show_team_calendar(username)
-
-def show_leave_summary(username):
+    with timed_page(f"user/{choice}"):
+        if choice == "Leave Summary":
+            show_leave_summary(user)
+        elif choice == "Apply for Leave":
+            apply_for_leave(user)
+        elif choice == "Leave History":
+            show_leave_history(user)
+        elif choice == "Team Calendar":
+            show_team_calendar(user)
+
+def show_leave_summary(user):
     st.header("Leave Summary")
-    conn = get_db_connection()
-    if conn is None:
-        st.error("Unable to connect to the database. Please try again later.")
-        return
-
-    user_id = get_user_id(username, conn)
-    if user_id is None:
-        conn.close()
-        return
-
-    remaining_leaves = get_remaining_leaves(user_id)
-    if remaining_leaves is None:
-        st.error("Unable to fetch remaining leaves. Please try again later.")
-        conn.close()
-        return
-
-    taken_leaves = TOTAL_LEAVES_PER_YEAR - remaining_leaves
+    user_id = user['id']
+    remaining_leaves = user['remaining_leaves']
+    taken_leaves = user['allowance'] - remaining_leaves
 
     current_year = datetime.now().year
-    df = pd.read_sql_query(f"""
-        SELECT leave_type, COUNT(*) as count, SUM(julianday(end_date) - julianday(start_date) + 1) as total_days
-        FROM leaves
-        WHERE user_id = ? AND strftime('%Y', start_date) = '{current_year}'
-        GROUP BY leave_type
-    """, conn, params=(user_id,))
-    conn.close()
+    df = get_leave_breakdown(user_id, current_year)
+    if df is None:
+        st.error("Unable to connect to the database. Please try again later.")
+        return
 
     col1, col2, col3 = st.columns(3)
     col1.metric("Available Leaves", remaining_leaves)
     col2.metric("Taken Leaves", taken_leaves)
-    col3.metric("Upcoming Leaves", get_upcoming_leaves_count(user_id))
+    col3.metric("Upcoming Leaves", user['upcoming_leaves'])
+
+    # plotly is imported by the pages that draw charts, not at module load.
+    import plotly.graph_objects as go
+    import plotly.express as px
 
     # Create a unique radial chart for leave utilization
     fig = go.Figure(go.Barpolar(
@@ -69,7 +62,7 @@ def show_leave_summary(username):
     fig.update_layout(
         title="Leave Utilization",
         polar=dict(
-            radialaxis=dict(range=[0, TOTAL_LEAVES_PER_YEAR], showticklabels=False, ticks=''),
+            radialaxis=dict(range=[0, max(user['allowance'], remaining_leaves, 1)], showticklabels=False, ticks=''),
             angularaxis=dict(showticklabels=True, ticks='')
         )
     )
@@ -82,54 +75,16 @@ def show_leave_summary(username):
         fig = px.scatter(df, x='count', y='total_days', size='count', color='leave_type',
                          hover_name='leave_type', text='leave_type',
                          title="Leave Type Distribution",
-                         labels={'count': 'Number of Leaves', 'total_days': 'Total Days Taken'})
+                         labels={'count': 'Number of Leaves', 'total_days': 'Working Days Taken'})
         fig.update_traces(textposition='top center')
         fig.update_layout(showlegend=False)
         st.plotly_chart(fig)
     else:
         st.info("No leave data available for this year.")
         
-def get_user_id(username, conn):
-    cur = conn.cursor()
-    cur.execute('SELECT id FROM users WHERE username = ?', (username,))
-    user = cur.fetchone()
-    if user is None:
-        st.error("User not found.")
-        return None
-    return user['id']
-
-def get_upcoming_leaves_count(user_id):
-    conn = get_db_connection()
-    if conn is None:
-        return 0
-
-    cur = conn.cursor()
-    cur.execute("""
-        SELECT COUNT(*) as count
-        FROM leaves
-        WHERE user_id = ? AND start_date >= date('now') AND status = 'approved'
-    """, (user_id,))
-    result = cur.fetchone()
-    conn.close()
-    return result['count'] if result else 0
-
-def apply_for_leave(username):
+def apply_for_leave(user):
     st.header("Apply for Leave")
-    conn = get_db_connection()
-    if conn is None:
-        st.error("Unable to connect to the database. Please try again later.")
-        return
-
-    user_id = get_user_id(username, conn)
-    if user_id is None:
-        conn.close()
-        return
-
-    remaining_leaves = get_remaining_leaves(user_id)
-    if remaining_leaves is None:
-        st.error("Unable to fetch remaining leaves. Please try again later.")
-        conn.close()
-        return
+    user_id = user['id']
 
     with st.form("leave_application_form"):
         start_date = st.date_input("Start Date")
@@ -139,50 +94,25 @@ def apply_for_leave(username):
         submitted = st.form_submit_button("Submit Leave Application")
 
         if submitted:
-            if start_date <= end_date:
-                days_requested = (end_date - start_date).days + 1
-                if days_requested <= remaining_leaves:
-                    try:
-                        cur = conn.cursor()
-                        cur.execute('''
-                        INSERT INTO leaves (user_id, start_date, end_date, reason, status, leave_type)
-                        VALUES (?, ?, ?, ?, ?, ?)
-                        ''', (user_id, start_date.isoformat(), end_date.isoformat(), reason, 'pending', leave_type))
-                        conn.commit()
-                        if update_remaining_leaves(user_id, days_requested):
-                            st.success("Leave application submitted successfully!")
-                        else:
-                            st.error("Error updating remaining leaves. Please try again.")
-                    except sqlite3.Error as e:
-                        st.error(f"Error submitting leave application: {e}")
-                else:
-                    st.error(f"You don't have enough leaves. Available: {remaining_leaves}, Requested: {days_requested}")
+            success, message = submit_leave(user_id, start_date, end_date, reason, leave_type)
+            if success:
+                st.success(message)
             else:
-                st.error("End date must be after start date")
-
-    conn.close()
+                st.error(message)
 
-def show_leave_history(username):
+def show_leave_history(user):
     st.header("Leave History")
-    conn = get_db_connection()
-    if conn is None:
-        st.error("Unable to connect to the database. Please try again later.")
-        return
+    user_id = user['id']
 
-    user_id = get_user_id(username, conn)
-    if user_id is None:
-        conn.close()
+    rows, next_cursor = get_leaves_page(user_id=user_id, after=current_cursor("history"))
+    if rows is None:
+        st.error("Unable to fetch leave history. Please try again later.")
         return
 
-    df = pd.read_sql_query('SELECT * FROM leaves WHERE user_id = ? ORDER BY start_date DESC', conn, params=(user_id,))
-    conn.close()
-
+    import pandas as pd
+    df = pd.DataFrame([dict(row) for row in rows])
     if not df.empty:
-        df['start_date'] = pd.to_datetime(df['start_date'])
-        df['end_date'] = pd.to_datetime(df['end_date'])
-        df['duration'] = (df['end_date'] - df['start_date']).dt.days + 1
-        df['start_date'] = df['start_date'].dt.strftime('%Y-%m-%d')
-        df['end_date'] = df['end_date'].dt.strftime('%Y-%m-%d')
+        df['duration'] = df['days']
         
         columns = ['start_date', 'end_date', 'duration', 'leave_type', 'reason', 'status']
         df = df[columns]
@@ -198,48 +128,38 @@ def show_leave_history(username):
         styled_df = df.style.applymap(color_status, subset=['status'])
         
         st.dataframe(styled_df, use_container_width=True)
-        
-        fig = px.pie(df, names='leave_type', title='Leave Type Distribution')
-        st.plotly_chart(fig)
+        pagination_controls("history", next_cursor)
+
+        type_counts = get_user_leave_type_counts(user_id)
+        if type_counts is not None and not type_counts.empty:
+            import plotly.express as px
+            fig = px.pie(type_counts, values='count', names='leave_type', title='Leave Type Distribution')
+            st.plotly_chart(fig)
     else:
         st.info("No leave history available.")
 
-def show_team_calendar(username):
+def show_team_calendar(user):
     st.header("Team Calendar")
-    conn = get_db_connection()
-    if conn is None:
-        st.error("Unable to connect to the database. Please try again later.")
-        return
+    department = user['department']
 
-    user_id = get_user_id(username, conn)
-    if user_id is None:
-        conn.close()
+    year = datetime.now().year
+    window = st.date_input("Calendar range", (date(year, 1, 1), date(year, 12, 31)))
+    if len(window) != 2:
+        st.info("Select an end date for the calendar range.")
         return
 
-    cur = conn.cursor()
-    cur.execute('SELECT department FROM users WHERE id = ?', (user_id,))
-    user = cur.fetchone()
-    department = user['department']
-
-    df = pd.read_sql_query("""
-        SELECT leaves.*, users.username
-        FROM leaves
-        JOIN users ON leaves.user_id = users.id
-        WHERE users.department = ? AND leaves.status = 'approved'
-    """, conn, params=(department,))
-    conn.close()
+    df = get_team_leaves(department, window[0], window[1])
+    if df is None:
+        st.error("Unable to connect to the database. Please try again later.")
+        return
 
     if not df.empty:
-        df['start_date'] = pd.to_datetime(df['start_date'])
-        df['end_date'] = pd.to_datetime(df['end_date'])
-
-        year = datetime.now().year
-        date_range = pd.date_range(start=f'{year}-01-01', end=f'{year}-12-31', freq='D')
-        calendar_df = pd.DataFrame(index=date_range, columns=['Leave Count'])
-
-        for _, row in df.iterrows():
-            mask = (calendar_df.index >= row['start_date']) & (calendar_df.index <= row['end_date'])
-            calendar_df.loc[mask, 'Leave Count'] += 1
+        starts = to_days(df['start_day'])
+        ends = to_days(df['end_day'])
+        days, counts, _ = leave_occupancy(starts, ends, window[0], window[1])
+        import pandas as pd
+        calendar_df = pd.DataFrame({'Leave Count': counts}, index=pd.DatetimeIndex(days))
+        import plotly.express as px
 
         fig = px.imshow(calendar_df.T,
                         x=calendar_df.index,
@@ -252,8 +172,10 @@ def show_team_calendar(username):
 
         st.write("Select a date to see team leave details:")
         selected_date = st.date_input("Select a date", datetime.now())
-        selected_leaves = df[(df['start_date'] <= selected_date) & (df['end_date'] >= selected_date)]
-        if not selected_leaves.empty:
+        selected_leaves = get_leaves_on(selected_date, department)
+        if selected_leaves is None:
+            st.error("Unable to load team leave details. Please try again later.")
+        elif not selected_leaves.empty:
             st.write(f"Team members on leave on {selected_date}:")
             for _, leave in selected_leaves.iterrows():
                 st.write(f"- {leave['username']}: {leave['leave_type']}")
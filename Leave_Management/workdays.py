@@ -0,0 +1,89 @@
+import sys
+from datetime import date
+import numpy as np
+from config import WORK_CALENDARS, DEPARTMENT_CALENDARS
+from calendar_engine import to_days
+
+# Leave durations in working days. Each calendar is a Monday-first weekend
+# mask plus a holiday list (see config.WORK_CALENDARS). Whole columns are
+# counted at once with np.busday_count. Single rows, e.g. inside SQL via the
+# registered working_days(start, end[, department]) function, use a running
+# count of working days precomputed over RANGE_START..RANGE_END, so a range is
+# prefix[end + 1] - prefix[start] with no per-call NumPy overhead.
+
+RANGE_START = np.datetime64('1900-01-01', 'D')
+RANGE_END = np.datetime64('2199-12-31', 'D')
+_EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+
+
+class WorkCalendar:
+    def __init__(self, weekmask='1111100', holidays=()):
+        self.weekmask = weekmask
+        self.holidays = to_days(list(holidays))
+        self.busdaycal = np.busdaycalendar(weekmask=weekmask, holidays=self.holidays)
+        days = np.arange(RANGE_START, RANGE_END + 1, dtype='datetime64[D]')
+        busy = np.is_busday(days, busdaycal=self.busdaycal)
+        self._prefix = np.concatenate(([0], np.cumsum(busy))).tolist()
+        self._offset = int(RANGE_START.astype(np.int64))
+        self._size = len(days)
+
+    def count(self, starts, ends):
+        # Working days in each inclusive [start, end]; 0 when end < start.
+        starts, ends = np.atleast_1d(to_days(starts)), np.atleast_1d(to_days(ends))
+        return np.maximum(np.busday_count(starts, ends + 1, busdaycal=self.busdaycal), 0)
+
+    def count_one(self, start, end):
+        # Scalar version for ISO date strings or dates (used by the SQL function).
+        if isinstance(start, str):
+            start = date.fromisoformat(start[:10])
+        if isinstance(end, str):
+            end = date.fromisoformat(end[:10])
+        s = start.toordinal() - _EPOCH_ORDINAL - self._offset
+        e = end.toordinal() - _EPOCH_ORDINAL - self._offset + 1
+        if e <= s:
+            return 0
+        if 0 <= s and e <= self._size:
+            return self._prefix[e] - self._prefix[s]
+        return int(self.count(start, end)[0])
+
+
+_calendars = {}
+
+def get_calendar(department=None):
+    name = DEPARTMENT_CALENDARS.get(department, 'default')
+    calendar = _calendars.get(name)
+    if calendar is None:
+        calendar = _calendars[name] = WorkCalendar(**WORK_CALENDARS[name])
+    return calendar
+
+def working_days(starts, ends, departments=None):
+    import pandas as pd
+    # Vectorised: one calendar lookup per distinct department, not per row.
+    if departments is None:
+        return get_calendar().count(starts, ends)
+    starts, ends = np.atleast_1d(to_days(starts)), np.atleast_1d(to_days(ends))
+    codes, names = pd.factorize(np.asarray(departments, dtype=object), use_na_sentinel=True)
+    result = np.zeros(len(starts), dtype=np.int64)
+    for code, department in [(-1, None)] + list(enumerate(names)):
+        rows = codes == code
+        if rows.any():
+            result[rows] = get_calendar(department).count(starts[rows], ends[rows])
+    return result
+
+def _sql_working_days(start, end, department=None):
+    if start is None or end is None:
+        return None
+    try:
+        return get_calendar(department).count_one(start, end)
+    except ValueError:
+        return None
+
+def register_sql_functions(conn):
+    # Called for every new pooled connection (see database.get_pool()).
+    conn.create_function('working_days', 2, _sql_working_days, deterministic=True)
+    conn.create_function('working_days', 3, _sql_working_days, deterministic=True)
+
+if __name__ == "__main__":
+    # python workdays.py 2024-12-23 2025-01-03 [department]
+    department = sys.argv[3] if len(sys.argv) > 3 else None
+    print(get_calendar(department).count_one(sys.argv[1], sys.argv[2]))
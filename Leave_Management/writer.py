@@ -0,0 +1,205 @@
+import queue
+import sqlite3
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from config import SQLITE_PRAGMAS, WRITE_BATCH_SIZE, WRITE_QUEUE_SIZE, WRITE_RETRIES
+from pool import PooledConnection
+
+# One thread owns the only write connection. Callers submit an operation,
+# op(conn, *args), and get a Future back. The thread takes everything that has
+# queued up (up to batch_size operations) and runs it in one BEGIN IMMEDIATE
+# ... COMMIT, so writers never contend for SQLite's lock and one commit covers
+# the whole batch. Each operation runs in its own savepoint: one that raises
+# is rolled back alone and its future gets the exception, while the rest of
+# the batch still commits. Futures are resolved only after the COMMIT, so a
+# result means the write is durable. Operations must not commit or roll back
+# themselves.
+#
+# Every write from the app goes through here, including bulk imports (one
+# operation per chunk) and the yearly accrual (one operation). The only
+# writers that open their own BEGIN IMMEDIATE are maintenance commands run
+# by hand in their own process: migrations, aggregates/ledger rebuilds,
+# ledger snapshots and --repair. A writer thread there would serialise
+# nothing, and they wait on SQLite's lock (busy_timeout) like any other
+# process; this thread retries its batch while they hold it.
+
+LATENCY_WINDOW = 1000  # recent batches/operations kept for percentiles
+
+def _percentile(values, q):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class WriteQueue:
+    def __init__(self, path, batch_size=WRITE_BATCH_SIZE, queue_size=WRITE_QUEUE_SIZE,
+                 retries=WRITE_RETRIES, pragmas=None, on_connect=None, prepare=None):
+        # on_connect(conn) runs once when the connection is opened; prepare(conn)
+        # runs before every batch and returns the connection to use.
+        self.path = path
+        self.batch_size = batch_size
+        self.retries = retries
+        self.pragmas = SQLITE_PRAGMAS if pragmas is None else pragmas
+        self.on_connect = on_connect
+        self.prepare = prepare
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._lock = threading.Lock()
+        self._closed = False
+        self._commit_ms = deque(maxlen=LATENCY_WINDOW)
+        self._latency_ms = deque(maxlen=LATENCY_WINDOW)
+        self.stats = {'writes': 0, 'failed': 0, 'batches': 0, 'max_batch': 0, 'retries': 0, 'max_depth': 0}
+        self._thread = threading.Thread(target=self._run, name='db-writer', daemon=True)
+        self._thread.start()
+
+    def submit(self, op, *args, timeout=None):
+        # Raises sqlite3.OperationalError if the queue stays full for timeout
+        # seconds or the writer has been closed.
+        future = Future()
+        with self._lock:
+            if self._closed:
+                raise sqlite3.OperationalError("The database writer is closed")
+        try:
+            self._queue.put((op, args, future, time.perf_counter()), timeout=timeout)
+        except queue.Full:
+            raise sqlite3.OperationalError("The database write queue is full")
+        depth = self._queue.qsize()
+        with self._lock:
+            if depth > self.stats['max_depth']:
+                self.stats['max_depth'] = depth
+        return future
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, factory=PooledConnection, check_same_thread=False,
+                               isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        for name, value in self.pragmas.items():
+            conn.execute(f"PRAGMA {name} = {value}")
+        if self.on_connect is not None:
+            self.on_connect(conn)
+        return conn
+
+    def _run(self):
+        conn = None
+        stopping = False
+        while not stopping:
+            item = self._queue.get()
+            if item is None:
+                break
+            batch = [item]
+            while len(batch) < self.batch_size:
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+            batch = [item for item in batch if item[2].set_running_or_notify_cancel()]
+            if not batch:
+                continue
+            try:
+                if conn is None:
+                    conn = self._connect()
+                if self.prepare is not None:
+                    conn = self.prepare(conn)
+            except sqlite3.Error as e:
+                self._finish(batch, [(False, e)] * len(batch))
+                continue
+            if not self._commit(conn, batch):
+                conn = None
+        if conn is not None:
+            conn.close()
+
+    def _commit(self, conn, batch):
+        # Returns False if the connection had to be dropped; the next batch
+        # opens a new one.
+        for attempt in range(self.retries + 1):
+            outcomes = []
+            try:
+                conn.execute('BEGIN IMMEDIATE')
+                for op, args, _, _ in batch:
+                    conn.execute('SAVEPOINT write_op')
+                    try:
+                        value = op(conn, *args)
+                    except Exception as e:
+                        conn.execute('ROLLBACK TO write_op')
+                        conn.execute('RELEASE write_op')
+                        outcomes.append((False, e))
+                    else:
+                        conn.execute('RELEASE write_op')
+                        outcomes.append((True, value))
+                started = time.perf_counter()
+                conn.execute('COMMIT')
+                commit_ms = (time.perf_counter() - started) * 1000
+            except sqlite3.Error as e:
+                if not self._rollback(conn):
+                    self._finish(batch, [(False, e)] * len(batch))
+                    return False
+                if isinstance(e, sqlite3.OperationalError) and 'locked' in str(e) and attempt < self.retries:
+                    # Another process holds the write lock; run the batch again.
+                    with self._lock:
+                        self.stats['retries'] += 1
+                    continue
+                self._finish(batch, [(False, e)] * len(batch))
+                return True
+            with self._lock:
+                self._commit_ms.append(commit_ms)
+            self._finish(batch, outcomes)
+            return True
+
+    def _rollback(self, conn):
+        # A failed ROLLBACK (connection gone, I/O error) must not kill the
+        # thread and leave every later write waiting; close the connection
+        # instead and report whether it is still usable.
+        try:
+            if conn.in_transaction:
+                conn.execute('ROLLBACK')
+            return True
+        except sqlite3.Error:
+            try:
+                conn.close()
+            except sqlite3.Error:
+                pass
+            return False
+
+    def _finish(self, batch, outcomes):
+        now = time.perf_counter()
+        with self._lock:
+            self.stats['batches'] += 1
+            self.stats['max_batch'] = max(self.stats['max_batch'], len(batch))
+            for (_, _, _, queued_at), (ok, _) in zip(batch, outcomes):
+                self.stats['writes' if ok else 'failed'] += 1
+                self._latency_ms.append((now - queued_at) * 1000)
+        for (_, _, future, _), (ok, value) in zip(batch, outcomes):
+            if ok:
+                future.set_result(value)
+            else:
+                future.set_exception(value)
+
+    def close(self, wait=True):
+        # Operations already queued are still written.
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+        self._queue.put(None)
+        if wait:
+            self._thread.join()
+
+    def get_stats(self):
+        with self._lock:
+            batches = self.stats['batches']
+            return dict(
+                self.stats,
+                depth=self._queue.qsize(),
+                batch_size=self.batch_size,
+                avg_batch=(self.stats['writes'] + self.stats['failed']) / batches if batches else 0.0,
+                commit_ms_p50=_percentile(self._commit_ms, 0.50),
+                commit_ms_p95=_percentile(self._commit_ms, 0.95),
+                latency_ms_p50=_percentile(self._latency_ms, 0.50),
+                latency_ms_p95=_percentile(self._latency_ms, 0.95),
+            )